@@ -0,0 +1,288 @@
+"""Online, chunked backfills for schema migrations.
+
+A migration that rewrites a column with one ``UPDATE`` holds row locks on the
+whole table until it commits, which stalls the live bot.  :func:`run_backfill`
+instead updates rows in small keyed batches, each in its own short
+transaction with ``lock_timeout`` and ``statement_timeout`` set, sleeps
+between batches, and records its position in ``backfill_progress`` so an
+interrupted run resumes where it stopped.  :func:`execute_ddl` gives schema
+changes the same lock timeout and retry treatment.
+
+Backfills commit as they go, so every step must be idempotent: ``predicate``
+selects only the rows that still need work.  Every run is bounded even when
+an update leaves a row matching ``predicate``: the keyed walk only moves
+forward, rows it has already passed (the live bot keeps writing) are caught
+by one final keyed sweep from the start up to where the walk ended, and jobs
+without a key update at most as many rows as matched when the run started.
+
+Configuration (environment variables):
+
+``BACKFILL_BATCH_SIZE``
+    Rows updated per batch (default ``1000``).
+``BACKFILL_SLEEP_MS``
+    Pause between batches (default ``50``).
+``BACKFILL_LOCK_TIMEOUT`` / ``BACKFILL_STATEMENT_TIMEOUT``
+    Per-batch timeouts (default ``2s`` / ``30s``).
+``BACKFILL_MAX_RETRIES``
+    Attempts per batch or DDL statement before giving up (default ``5``).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import psycopg2
+import psycopg2.errors
+from psycopg2 import sql
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "1000"))
+SLEEP_MS = float(os.getenv("BACKFILL_SLEEP_MS", "50"))
+LOCK_TIMEOUT = os.getenv("BACKFILL_LOCK_TIMEOUT", "2s")
+STATEMENT_TIMEOUT = os.getenv("BACKFILL_STATEMENT_TIMEOUT", "30s")
+MAX_RETRIES = int(os.getenv("BACKFILL_MAX_RETRIES", "5"))
+
+RETRYABLE = (
+    psycopg2.errors.LockNotAvailable,
+    psycopg2.errors.QueryCanceled,
+    psycopg2.errors.DeadlockDetected,
+)
+
+
+@dataclass(frozen=True)
+class Backfill:
+    """An idempotent ``UPDATE table SET assignments WHERE predicate``.
+
+    ``key`` is a unique, ordered column used to walk the table; without one
+    batches are picked by ``ctid`` and rely on ``predicate`` alone to make
+    progress.
+    """
+
+    name: str
+    table: str
+    assignments: sql.Composable
+    predicate: sql.Composable
+    key: Optional[str] = None
+
+
+def _set_timeouts(cursor, statement_timeout: Optional[str] = STATEMENT_TIMEOUT) -> None:
+    cursor.execute("SET LOCAL lock_timeout = %s", (LOCK_TIMEOUT,))
+    if statement_timeout:
+        cursor.execute("SET LOCAL statement_timeout = %s", (statement_timeout,))
+
+
+def _backoff(attempt: int) -> None:
+    time.sleep(min(0.2 * 2 ** attempt, 10.0))
+
+
+def execute_ddl(cursor, statement) -> None:
+    """Run ``statement`` in its own transaction, retrying on lock timeouts.
+
+    Without ``lock_timeout`` an ``ALTER TABLE`` waiting behind a long query
+    blocks every later query on the table; failing fast and retrying keeps
+    the bot responsive.
+    """
+    connection = cursor.connection
+    connection.commit()
+    for attempt in range(MAX_RETRIES):
+        try:
+            _set_timeouts(cursor, statement_timeout=None)
+            cursor.execute(statement)
+            connection.commit()
+            return
+        except RETRYABLE as exc:
+            connection.rollback()
+            if attempt + 1 == MAX_RETRIES:
+                raise
+            logger.warning("DDL blocked (%s), retrying", exc.pgcode)
+            _backoff(attempt)
+
+
+def _ensure_progress_table(cursor) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS backfill_progress (
+            name TEXT PRIMARY KEY,
+            last_key TEXT,
+            rows_done BIGINT NOT NULL DEFAULT 0,
+            started_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+            completed_at TIMESTAMP WITHOUT TIME ZONE
+        )
+        """
+    )
+
+
+def _load_progress(cursor, name: str) -> tuple:
+    """Return ``(last_key, rows_done)`` to resume from, restarting finished jobs."""
+    cursor.execute(
+        "SELECT last_key, rows_done, completed_at FROM backfill_progress WHERE name = %s",
+        (name,),
+    )
+    row = cursor.fetchone()
+    if row is None or row["completed_at"] is not None:
+        cursor.execute(
+            """
+            INSERT INTO backfill_progress (name) VALUES (%s)
+            ON CONFLICT (name) DO UPDATE
+            SET last_key = NULL, rows_done = 0, started_at = NOW(),
+                updated_at = NOW(), completed_at = NULL
+            """,
+            (name,),
+        )
+        return None, 0
+    return row["last_key"], row["rows_done"]
+
+
+def batch_statement(job: Backfill, after_key: bool, up_to_key: bool = False) -> sql.Composable:
+    """``UPDATE`` for one batch, returning ``rows`` and the batch's ``last_key``.
+
+    ``after_key`` / ``up_to_key`` restrict a keyed batch to
+    ``key > %(last_key)s`` / ``key <= %(upper)s``.
+    """
+    table = sql.Identifier(job.table)
+    if job.key is None:
+        update = sql.SQL(
+            "UPDATE {table} SET {assignments} WHERE ctid = ANY(ARRAY("
+            "SELECT ctid FROM {table} WHERE {predicate} LIMIT %(limit)s)) "
+            "RETURNING NULL::text AS key"
+        )
+    else:
+        update = sql.SQL(
+            "UPDATE {table} SET {assignments} WHERE {key} IN ("
+            "SELECT {key} FROM {table} WHERE {range}({predicate}) "
+            "ORDER BY {key} LIMIT %(limit)s) "
+            "RETURNING {key} AS key"
+        )
+    key = sql.Identifier(job.key) if job.key else sql.SQL("")
+    bounds = []
+    if after_key:
+        bounds.append(sql.SQL("{} > %(last_key)s AND ").format(key))
+    if up_to_key:
+        bounds.append(sql.SQL("{} <= %(upper)s AND ").format(key))
+    statement = update.format(
+        table=table,
+        assignments=job.assignments,
+        predicate=job.predicate,
+        key=key,
+        range=sql.Composed(bounds),
+    )
+    return sql.SQL(
+        "WITH updated AS ({}) SELECT COUNT(*) AS rows, MAX(key)::text AS last_key FROM updated"
+    ).format(statement)
+
+
+def run_backfill(cursor, job: Backfill, batch_size: int = BATCH_SIZE, dry_run: bool = False) -> int:
+    """Apply ``job`` in committed batches; return the number of rows updated.
+
+    Commits the caller's open transaction first.
+    """
+    if dry_run:
+        text = batch_statement(job, after_key=False).as_string(cursor.connection)
+        print(f"-- backfill {job.name} in batches of {batch_size}")
+        print(f"{' '.join(text.split())};".replace("%(limit)s", str(batch_size)))
+        return 0
+
+    connection = cursor.connection
+    connection.commit()
+    _ensure_progress_table(cursor)
+    last_key, done = _load_progress(cursor, job.name)
+    connection.commit()
+    if done:
+        logger.info("Resuming backfill %s after %s rows (key %r)", job.name, done, last_key)
+
+    budget = None
+    if job.key is None:
+        # Without a key a row the update does not clear would be picked
+        # again forever: update at most the rows matching now.
+        cursor.execute(
+            sql.SQL("SELECT COUNT(*) AS count FROM {} WHERE {}").format(
+                sql.Identifier(job.table), job.predicate
+            )
+        )
+        budget = cursor.fetchone()["count"]
+        connection.commit()
+
+    started = time.monotonic()
+    attempt = 0
+    walk_end = None  # set once the keyed walk is over: the sweep stops there
+    while True:
+        batch_started = time.monotonic()
+        limit = batch_size if budget is None else min(batch_size, budget)
+        try:
+            _set_timeouts(cursor)
+            if limit:
+                cursor.execute(
+                    batch_statement(
+                        job, after_key=last_key is not None, up_to_key=walk_end is not None
+                    ),
+                    {"limit": limit, "last_key": last_key, "upper": walk_end},
+                )
+                row = cursor.fetchone()
+            else:
+                row = {"rows": 0, "last_key": None}
+            # A walk that started from the first key has nothing behind it.
+            finished = row["rows"] == 0 and (
+                job.key is None or walk_end is not None or last_key is None
+            )
+            next_key, next_end = last_key, walk_end
+            if row["rows"]:
+                next_key = row["last_key"] if job.key else None
+            elif not finished:
+                # End of the keyed walk: sweep the keys it has passed, once.
+                next_key, next_end = None, last_key
+            cursor.execute(
+                """
+                UPDATE backfill_progress
+                SET last_key = %s, rows_done = %s, updated_at = NOW(),
+                    completed_at = CASE WHEN %s THEN NOW() END
+                WHERE name = %s
+                """,
+                (next_key, done + row["rows"], finished, job.name),
+            )
+            connection.commit()
+        except RETRYABLE as exc:
+            connection.rollback()
+            attempt += 1
+            if attempt >= MAX_RETRIES:
+                raise
+            if isinstance(exc, psycopg2.errors.QueryCanceled):
+                batch_size = max(1, batch_size // 2)
+            logger.warning(
+                "Backfill %s batch failed (%s), retrying with %d rows",
+                job.name,
+                exc.pgcode,
+                batch_size,
+            )
+            _backoff(attempt)
+            continue
+
+        attempt = 0
+        last_key, walk_end = next_key, next_end
+        done += row["rows"]
+        if budget is not None:
+            budget -= row["rows"]
+        if finished:
+            break
+        if not row["rows"]:
+            continue
+        elapsed = time.monotonic() - started
+        logger.info(
+            "Backfill %s: %d rows (%.0f rows/s)",
+            job.name,
+            done,
+            done / elapsed if elapsed else 0.0,
+            extra={
+                "event": "backfill_progress",
+                "duration_ms": round((time.monotonic() - batch_started) * 1000, 1),
+            },
+        )
+        time.sleep(SLEEP_MS / 1000)
+
+    logger.info("Backfill %s complete: %d rows", job.name, done)
+    return done
@@ -0,0 +1,287 @@
+"""Query tracing and slow-query log for PostgreSQL connections.
+
+Every statement executed through a connection created with :func:`connect`
+is timed and attributed to the helper that issued it.  The slowest
+statements are kept in a bounded, process-wide log that the bot exposes
+through an admin command and that the maintenance scripts print on exit.
+
+Configuration (environment variables):
+
+``DB_TRACE_ENABLED``
+    Set to ``0`` to disable tracing entirely (default ``1``).
+``DB_SLOW_QUERY_TOP_N``
+    Number of slow statements kept in the rolling log (default ``20``).
+``DB_SLOW_QUERY_MS``
+    Statements faster than this are only aggregated, never logged as slow
+    (default ``50``).
+``DB_EXPLAIN_THRESHOLD_MS``
+    Opt-in.  When set, read-only statements slower than this value are
+    re-planned with ``EXPLAIN`` and the plan is attached to the slow-query
+    entry.  The ``EXPLAIN`` runs inside a savepoint, so a failure never
+    aborts the caller's transaction.
+``DB_EXPLAIN_ANALYZE``
+    Set to ``1`` to use ``EXPLAIN (ANALYZE, BUFFERS)`` instead (default
+    ``0``).  This executes the statement a second time, including any side
+    effect of a ``SELECT`` (``nextval()``, advisory locks...).
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+
+logger = logging.getLogger(__name__)
+
+TRACE_ENABLED = os.getenv("DB_TRACE_ENABLED", "1") != "0"
+SLOW_QUERY_TOP_N = int(os.getenv("DB_SLOW_QUERY_TOP_N", "20"))
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "50"))
+_explain_threshold = os.getenv("DB_EXPLAIN_THRESHOLD_MS")
+EXPLAIN_THRESHOLD_MS: Optional[float] = (
+    float(_explain_threshold) if _explain_threshold else None
+)
+EXPLAIN_ANALYZE = os.getenv("DB_EXPLAIN_ANALYZE", "0") == "1"
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_READ_ONLY = re.compile(r"^\s*(?:SELECT|WITH\b(?!.*\b(?:INSERT|UPDATE|DELETE)\b))", re.I | re.S)
+
+_THIS_FILE = os.path.normcase(os.path.abspath(__file__))
+_PSYCOPG_DIR = os.path.normcase(os.path.dirname(os.path.abspath(psycopg2.__file__)))
+
+
+def fingerprint(query: str) -> str:
+    """Return ``query`` with literals and whitespace normalised.
+
+    Two executions of the same helper with different parameters produce the
+    same fingerprint, which is what the aggregates are keyed on.
+    """
+    text = _STRING_LITERAL.sub("?", query)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = text.replace("%s", "?")
+    text = re.sub(r"%\(\w+\)s", "?", text)
+    text = _PLACEHOLDER_LIST.sub("(?)", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _find_caller() -> str:
+    """Return ``function (file:line)`` for the first frame outside the DB layer."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.normcase(os.path.abspath(frame.f_code.co_filename))
+        if filename != _THIS_FILE and not filename.startswith(_PSYCOPG_DIR):
+            return (
+                f"{frame.f_code.co_name} "
+                f"({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"
+            )
+        frame = frame.f_back
+    return "unknown"
+
+
+@dataclass
+class QueryRecord:
+    """A single traced statement."""
+
+    fingerprint: str
+    duration_ms: float
+    rows: int
+    caller: str
+    recorded_at: float = field(default_factory=time.time)
+    explain: Optional[str] = None
+
+
+@dataclass
+class QueryAggregate:
+    """Running totals for one (fingerprint, caller) pair."""
+
+    fingerprint: str
+    caller: str
+    calls: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.calls if self.calls else 0.0
+
+
+class SlowQueryLog:
+    """Thread-safe rolling top-N of the slowest statements plus aggregates."""
+
+    def __init__(self, top_n: int = SLOW_QUERY_TOP_N, threshold_ms: float = SLOW_QUERY_MS):
+        self.top_n = top_n
+        self.threshold_ms = threshold_ms
+        self._lock = threading.Lock()
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+        self._aggregates: Dict[tuple, QueryAggregate] = {}
+
+    def record(self, record: QueryRecord) -> None:
+        with self._lock:
+            key = (record.fingerprint, record.caller)
+            aggregate = self._aggregates.get(key)
+            if aggregate is None:
+                aggregate = QueryAggregate(record.fingerprint, record.caller)
+                self._aggregates[key] = aggregate
+            aggregate.calls += 1
+            aggregate.total_ms += record.duration_ms
+            aggregate.max_ms = max(aggregate.max_ms, record.duration_ms)
+            aggregate.rows += max(record.rows, 0)
+
+            if record.duration_ms < self.threshold_ms:
+                return
+            entry = (record.duration_ms, next(self._counter), record)
+            if len(self._heap) < self.top_n:
+                heapq.heappush(self._heap, entry)
+            elif entry[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def slowest(self, limit: Optional[int] = None) -> List[QueryRecord]:
+        """Return the slowest recorded statements, slowest first."""
+        with self._lock:
+            entries = sorted(self._heap, reverse=True)
+        records = [entry[2] for entry in entries]
+        return records[:limit] if limit else records
+
+    def top_by_total_time(self, limit: int = 10) -> List[QueryAggregate]:
+        """Return the (fingerprint, caller) pairs that cost the most overall."""
+        with self._lock:
+            aggregates = list(self._aggregates.values())
+        aggregates.sort(key=lambda agg: agg.total_ms, reverse=True)
+        return aggregates[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._heap.clear()
+            self._aggregates.clear()
+
+
+slow_query_log = SlowQueryLog()
+
+
+class TracingCursor(RealDictCursor):
+    """``RealDictCursor`` that reports every statement to :data:`slow_query_log`."""
+
+    def execute(self, query, vars=None):
+        if not TRACE_ENABLED:
+            return super().execute(query, vars)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._trace(query, vars, start)
+
+    def executemany(self, query, vars_list):
+        if not TRACE_ENABLED:
+            return super().executemany(query, vars_list)
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._trace(query, None, start, explain=False)
+
+    def _trace(self, query, vars, start: float, explain: bool = True) -> None:
+        duration_ms = (time.perf_counter() - start) * 1000
+        try:
+            text = query.as_string(self.connection) if hasattr(query, "as_string") else query
+            if isinstance(text, bytes):
+                text = text.decode("utf-8", "replace")
+            record = QueryRecord(
+                fingerprint=fingerprint(text),
+                duration_ms=duration_ms,
+                rows=self.rowcount,
+                caller=_find_caller(),
+            )
+            if (
+                explain
+                and EXPLAIN_THRESHOLD_MS is not None
+                and duration_ms >= EXPLAIN_THRESHOLD_MS
+                and _READ_ONLY.match(text)
+            ):
+                record.explain = self._explain(text, vars)
+            slow_query_log.record(record)
+            if duration_ms >= slow_query_log.threshold_ms:
+                logger.debug(
+                    "Slow query %.1f ms (%s rows) from %s: %s",
+                    duration_ms,
+                    record.rows,
+                    record.caller,
+                    record.fingerprint,
+                    extra={"event": "slow_query", "duration_ms": round(duration_ms, 1)},
+                )
+        except Exception:  # Tracing must never break the caller.
+            logger.debug("Failed to trace query", exc_info=True)
+
+    def _explain(self, text: str, vars) -> Optional[str]:
+        status = self.connection.get_transaction_status()
+        if status == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            return None
+        # Outside a transaction (autocommit) there is nothing to protect and
+        # SAVEPOINT is not allowed.
+        savepoint = status == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        explain = "EXPLAIN (ANALYZE, BUFFERS) " if EXPLAIN_ANALYZE else "EXPLAIN "
+        with self.connection.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            if savepoint:
+                cursor.execute("SAVEPOINT db_tracing_explain")
+            try:
+                cursor.execute(explain + text, vars)
+                return "\n".join(row[0] for row in cursor.fetchall())
+            except psycopg2.Error as exc:
+                return f"EXPLAIN failed: {exc}"
+            finally:
+                if savepoint:
+                    cursor.execute("ROLLBACK TO SAVEPOINT db_tracing_explain")
+                    cursor.execute("RELEASE SAVEPOINT db_tracing_explain")
+
+
+def connect(dsn: str, **kwargs) -> psycopg2.extensions.connection:
+    """Open a connection whose cursors are traced ``RealDictCursor`` instances."""
+    kwargs.setdefault("cursor_factory", TracingCursor)
+    return psycopg2.connect(dsn, **kwargs)
+
+
+def format_slow_queries(limit: int = 10, width: int = 160) -> List[str]:
+    """Return human readable lines describing the slow-query log."""
+    lines: List[str] = []
+    for index, record in enumerate(slow_query_log.slowest(limit), start=1):
+        query = record.fingerprint
+        if len(query) > width:
+            query = query[: width - 1] + "…"
+        lines.append(
+            f"{index}. {record.duration_ms:.1f} ms · {record.rows} rows · {record.caller}"
+        )
+        lines.append(f"   {query}")
+        if record.explain:
+            lines.append("   (plan EXPLAIN disponible)")
+    return lines
+
+
+def log_summary(limit: int = 10) -> None:
+    """Log the most expensive statements of this process (used by scripts)."""
+    aggregates = slow_query_log.top_by_total_time(limit)
+    if not aggregates:
+        return
+    logger.info("Top %d statements by total time:", len(aggregates))
+    for aggregate in aggregates:
+        logger.info(
+            "  %8.1f ms total · %5d calls · %6.1f ms max · %s · %s",
+            aggregate.total_ms,
+            aggregate.calls,
+            aggregate.max_ms,
+            aggregate.caller,
+            aggregate.fingerprint[:120],
+        )
@@ -0,0 +1,189 @@
+"""Batched digests for the Discord log channel.
+
+Instead of one ``channel.send`` per match created or result confirmed, events
+are appended to a per-channel buffer and flushed as a single digest message
+when the buffer is large enough, when the oldest entry has waited
+``LOG_DIGEST_INTERVAL`` seconds, or immediately for errors.
+
+Each channel also has a token bucket so digests never exceed
+``LOG_DIGEST_RATE`` messages per ``LOG_DIGEST_PER`` seconds; anything that does
+not fit waits in the buffer for the next window instead of competing with the
+match announcements for Discord's per-channel rate limit.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 2000
+DIGEST_MAX_EVENTS = int(os.getenv("LOG_DIGEST_MAX_EVENTS", "10"))
+DIGEST_INTERVAL = float(os.getenv("LOG_DIGEST_INTERVAL", "30"))
+DIGEST_RATE = int(os.getenv("LOG_DIGEST_RATE", "2"))
+DIGEST_PER = float(os.getenv("LOG_DIGEST_PER", "10"))
+
+Sender = Callable[[int, str], Awaitable[None]]
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens refilled every ``per`` seconds."""
+
+    def __init__(self, rate: int, per: float) -> None:
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated_at) * self.rate / self.per)
+        self.updated_at = now
+
+    def delay(self) -> float:
+        """Seconds to wait before a token is available (0 if available now)."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.per / self.rate
+
+    def consume(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+
+@dataclass
+class _ChannelBuffer:
+    entries: List[str] = field(default_factory=list)
+    first_at: Optional[float] = None
+    urgent: bool = False
+    bucket: TokenBucket = field(default_factory=lambda: TokenBucket(DIGEST_RATE, DIGEST_PER))
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    task: Optional[asyncio.Task] = None
+
+
+def pack_messages(entries: List[str], limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Join ``entries`` into as few messages of at most ``limit`` chars as possible."""
+    messages: List[str] = []
+    current = ""
+    for entry in entries:
+        while len(entry) > limit:
+            if current:
+                messages.append(current)
+                current = ""
+            messages.append(entry[:limit])
+            entry = entry[limit:]
+        candidate = f"{current}\n\n{entry}" if current else entry
+        if len(candidate) > limit:
+            messages.append(current)
+            current = entry
+        else:
+            current = candidate
+    if current:
+        messages.append(current)
+    return messages
+
+
+class LogDigest:
+    """Buffer log-channel events and flush them as digest messages."""
+
+    def __init__(
+        self,
+        sender: Sender,
+        max_events: int = DIGEST_MAX_EVENTS,
+        interval: float = DIGEST_INTERVAL,
+    ) -> None:
+        self.sender = sender
+        self.max_events = max_events
+        self.interval = interval
+        self._buffers: Dict[int, _ChannelBuffer] = {}
+
+    def post(self, channel_id: int, content: str) -> None:
+        """Queue ``content`` for the next digest of ``channel_id``."""
+        self._enqueue(channel_id, content, urgent=False)
+
+    def error(self, channel_id: int, content: str) -> None:
+        """Queue ``content`` and flush the channel as soon as the rate limit allows."""
+        self._enqueue(channel_id, content, urgent=True)
+
+    async def flush(self) -> None:
+        """Send every pending entry now, ignoring the interval and rate limit.
+
+        Called when the bot shuts down so buffered events are not lost.
+        """
+        for channel_id, buffer in list(self._buffers.items()):
+            entries = buffer.entries
+            buffer.entries = []
+            buffer.first_at = None
+            buffer.urgent = False
+            if buffer.task is not None and not buffer.task.done():
+                # With the buffer empty the task exits once its current send
+                # (if any) completes.
+                buffer.wakeup.set()
+                await buffer.task
+            for message in pack_messages(entries):
+                try:
+                    await self.sender(channel_id, message)
+                except Exception:
+                    logger.exception(
+                        "Failed to send log digest", extra={"event": "log_digest_error"}
+                    )
+
+    def _enqueue(self, channel_id: int, content: str, urgent: bool) -> None:
+        if not content:
+            return
+        buffer = self._buffers.get(channel_id)
+        if buffer is None:
+            buffer = self._buffers[channel_id] = _ChannelBuffer()
+        if not buffer.entries:
+            buffer.first_at = time.monotonic()
+        buffer.entries.append(content)
+        buffer.urgent = buffer.urgent or urgent
+        if buffer.task is None or buffer.task.done():
+            buffer.task = asyncio.create_task(self._run(channel_id, buffer))
+        if urgent or len(buffer.entries) >= self.max_events:
+            buffer.wakeup.set()
+
+    async def _run(self, channel_id: int, buffer: _ChannelBuffer) -> None:
+        while buffer.entries:
+            if not buffer.urgent and len(buffer.entries) < self.max_events:
+                remaining = self.interval - (time.monotonic() - buffer.first_at)
+                if remaining > 0:
+                    buffer.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(buffer.wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+            delay = buffer.bucket.delay()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+
+            entries = buffer.entries
+            buffer.entries = []
+            buffer.first_at = None
+            buffer.urgent = False
+            messages = pack_messages(entries)
+            if not messages:
+                continue
+            # Send what the bucket allows now; the rest goes back to the front.
+            buffer.bucket.consume()
+            leftover = messages[1:]
+            if leftover:
+                buffer.entries = leftover + buffer.entries
+                buffer.first_at = time.monotonic()
+                buffer.urgent = True
+            try:
+                await self.sender(channel_id, messages[0])
+            except Exception:
+                logger.exception(
+                    "Failed to send log digest", extra={"event": "log_digest_error"}
+                )
+
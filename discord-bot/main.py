@@ -5,26 +5,37 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
+import io
 import json
 import logging
 import os
 import random
+import threading
+import time
 from collections import Counter
 from dataclasses import dataclass
 from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
 import discord
 import psycopg2
+from discord import app_commands
 from discord.ext import commands
-from psycopg2.extras import RealDictCursor
 
-from smart_migration import ensure_players_schema
+from db_tracing import connect as db_connect
+from db_tracing import format_slow_queries, slow_query_log
+from log_digest import LogDigest
+from member_cache import member_cache
+from outbound import Priority, scheduler
+from perf_tools import MemoryTracker, StackSampler, describe_tasks, install_task_factory
+from smart_migration import run_migrations
+from structured_logging import configure_logging
 
 # ----------------------------------------------------------------------------
 # Configuration
 # ----------------------------------------------------------------------------
 
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 TOKEN = os.getenv("DISCORD_TOKEN")
@@ -69,16 +80,67 @@ MAP_ROTATION = [
 ]
 
 DEFAULT_DIVISION = os.getenv("MATCHMAKING_DEFAULT_DIVISION", "solo")
+# Skip guild chunking and discord.py's member cache; members are cached
+# lazily by member_cache instead.
+SLIM_GATEWAY = os.getenv("SLIM_GATEWAY", "0") == "1"
+# Set to 0 to only serve slash commands: the bot then no longer receives
+# guild messages at all.
+PREFIX_COMMANDS = os.getenv("PREFIX_COMMANDS", "1") != "0"
+COMMAND_PREFIX = "!" if PREFIX_COMMANDS else "/"
+# bot_state key holding the digest of the last synced command tree.
+COMMAND_TREE_STATE_KEY = "command_tree_sha256"
+COMMAND_SYNC_GUILD_ID = os.getenv("COMMAND_SYNC_GUILD_ID")
 
 intents = discord.Intents.default()
-intents.message_content = True
 intents.members = True
-
-bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
+if PREFIX_COMMANDS:
+    intents.message_content = True
+else:
+    intents.messages = False
+
+gateway_options = {}
+if SLIM_GATEWAY:
+    gateway_options = {
+        "chunk_guilds_at_startup": False,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+    }
+
+bot = commands.Bot(
+    command_prefix="!" if PREFIX_COMMANDS else commands.when_mentioned,
+    intents=intents,
+    help_command=None,
+    **gateway_options,
+)
 queue_lock = asyncio.Lock()
 vote_lock = asyncio.Lock()
 solo_queue: List[int] = []
 match_votes: Dict[int, Dict[int, str]] = {}
+stack_sampler = StackSampler()
+memory_tracker = MemoryTracker()
+profile_task: Optional[asyncio.Task] = None
+
+
+async def send_log_message(channel_id: int, content: str) -> None:
+    channel = bot.get_channel(channel_id)
+    if channel is None:
+        logger.warning("Log channel %s not found, dropping digest", channel_id)
+        return
+    await scheduler.send(channel, content, priority=Priority.LOG, merge_key="log")
+
+
+log_digest = LogDigest(send_log_message)
+
+
+async def reply(ctx: commands.Context, content: Optional[str] = None, **kwargs):
+    """Answer a command through the outbound scheduler.
+
+    Interaction responses bypass the queue: they use the interaction
+    callback route, not the channel's message bucket, and must be sent
+    within Discord's 3 second window.
+    """
+    if ctx.interaction is not None:
+        return await ctx.send(content, **kwargs)
+    return await scheduler.send(ctx.channel, content, priority=Priority.REPLY, **kwargs)
 
 # ----------------------------------------------------------------------------
 # Database helpers
@@ -89,32 +151,46 @@ def get_connection():
     """Create a PostgreSQL connection."""
     if not DATABASE_URL:
         raise RuntimeError("DATABASE_URL environment variable is not set")
-    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+    return db_connect(DATABASE_URL)
 
 
 def init_db() -> None:
-    """Ensure the required tables exist and have the correct columns."""
+    """Apply pending schema migrations (a single read when up to date)."""
     conn = get_connection()
     try:
         with conn.cursor() as cursor:
-            ensure_players_schema(cursor)
+            applied = run_migrations(cursor)
+        conn.commit()
+        for migration in applied:
+            logger.info("Applied migration %04d %s", migration.version, migration.name)
+    finally:
+        conn.close()
+
 
+def load_state(key: str) -> Optional[str]:
+    """Read a value from ``bot_state`` (persists across redeploys)."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT value FROM bot_state WHERE key = %s", (key,))
+            row = cursor.fetchone()
+        return row["value"] if row else None
+    finally:
+        conn.close()
+
+
+def save_state(key: str, value: str) -> None:
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
             cursor.execute(
                 """
-                CREATE TABLE IF NOT EXISTS solo_matches (
-                    id SERIAL PRIMARY KEY,
-                    division TEXT NOT NULL,
-                    team1_ids TEXT NOT NULL,
-                    team2_ids TEXT NOT NULL,
-                    room_code TEXT NOT NULL,
-                    status TEXT NOT NULL DEFAULT 'pending',
-                    winner TEXT,
-                    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
-                    completed_at TIMESTAMP WITHOUT TIME ZONE
-                )
-                """
+                INSERT INTO bot_state (key, value) VALUES (%s, %s)
+                ON CONFLICT (key) DO UPDATE
+                    SET value = EXCLUDED.value, updated_at = NOW()
+                """,
+                (key, value),
             )
-
         conn.commit()
     finally:
         conn.close()
@@ -352,9 +428,7 @@ def finalize_match_result(
 
     missing_ids = [pid for pid in winning_ids + losing_ids if pid not in player_map]
     for pid in missing_ids:
-        member = guild.get_member(pid) if guild else None
-        name = member.display_name if member else f"Joueur {pid}"
-        player_map[pid] = ensure_player(pid, name)
+        player_map[pid] = ensure_player(pid, member_cache.display_name(guild, pid))
 
     summary_lines: List[str] = []
     summary_lines.append("🔵 Équipe Bleue :")
@@ -424,6 +498,7 @@ class MatchVoteView(discord.ui.View):
         match_votes.setdefault(match_id, {})
 
     async def _register_vote(self, interaction: discord.Interaction, winner: str) -> None:
+        member_cache.remember(interaction.user)
         if interaction.user.id not in self.participants:
             await interaction.response.send_message(
                 "❌ Seuls les joueurs du match peuvent voter.", ephemeral=True
@@ -443,9 +518,24 @@ class MatchVoteView(discord.ui.View):
         if not majority_reached:
             return
 
+        # Names are only needed for players missing from the database: warm
+        # the member cache for those alone (one query_members at most).
+        participants = sorted(self.participants)
+        known = {player.discord_id for player in fetch_players(participants)}
+        missing = [pid for pid in participants if pid not in known]
+        await member_cache.fetch_many(interaction.guild, missing)
         summary = finalize_match_result(self.match_id, winner, interaction.guild)
         if not summary:
             return
+        logger.info(
+            "Match result confirmed: %s",
+            winner,
+            extra={
+                "event": "match_result",
+                "match_id": self.match_id,
+                "user": interaction.user.id,
+            },
+        )
 
         match_votes.pop(self.match_id, None)
         self.disable_all_items()
@@ -456,12 +546,9 @@ class MatchVoteView(discord.ui.View):
 
         channel = interaction.channel
         if channel:
-            await channel.send(summary)
+            await scheduler.send(channel, summary, priority=Priority.MATCH)
 
-        if interaction.guild:
-            log_channel = interaction.guild.get_channel(LOG_CHANNEL_ID)
-            if log_channel:
-                await log_channel.send(summary)
+        log_digest.post(LOG_CHANNEL_ID, summary)
 
     @discord.ui.button(label="Victoire Bleue", style=discord.ButtonStyle.primary, emoji="🔵")
     async def vote_blue(
@@ -493,7 +580,7 @@ async def send_match_message(
     if channel is None:
         logger.warning("No channel available to send match message")
         return
-    await channel.send(content, view=view)
+    await scheduler.send(channel, content, view=view, priority=Priority.MATCH)
 
 
 async def create_match_if_possible(ctx: commands.Context) -> None:
@@ -513,9 +600,10 @@ async def create_match_if_possible(ctx: commands.Context) -> None:
 
     # Ensure we have data for everyone in the queue snapshot
     missing = [pid for pid in selected_ids if pid not in player_map]
+    members = await member_cache.fetch_many(guild, missing)
     for pid in missing:
         logger.warning("Missing player %s in database, creating default entry", pid)
-        member = guild.get_member(pid)
+        member = members.get(pid)
         name = member.display_name if member else f"Joueur {pid}"
         player = ensure_player(pid, name)
         player_map[pid] = player
@@ -554,12 +642,12 @@ async def create_match_if_possible(ctx: commands.Context) -> None:
             message_lines.append(f"• {emoji} {mode_name} : {map_name}")
 
     await send_match_message(guild, "\n".join(message_lines), view=view)
+    logger.info(
+        "Match created",
+        extra={"event": "match_created", "match_id": match_id},
+    )
 
-    log_channel = guild.get_channel(LOG_CHANNEL_ID)
-    if log_channel:
-        await log_channel.send(
-            f"📝 Nouveau match Solo #{match_id} généré."
-        )
+    log_digest.post(LOG_CHANNEL_ID, f"📝 Nouveau match Solo #{match_id} généré.")
 
 
 # ----------------------------------------------------------------------------
@@ -567,51 +655,154 @@ async def create_match_if_possible(ctx: commands.Context) -> None:
 # ----------------------------------------------------------------------------
 
 
+async def sync_command_tree() -> None:
+    """Sync application commands only when their definition changed."""
+    guild = discord.Object(int(COMMAND_SYNC_GUILD_ID)) if COMMAND_SYNC_GUILD_ID else None
+    if guild is not None:
+        bot.tree.copy_global_to(guild=guild)
+
+    payload = {
+        "guild": COMMAND_SYNC_GUILD_ID,
+        "commands": [
+            command.to_dict(bot.tree) for command in bot.tree.get_commands(guild=guild)
+        ],
+    }
+    digest = hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+    # Stored in the database: the container filesystem is wiped on redeploy.
+    try:
+        if await asyncio.to_thread(load_state, COMMAND_TREE_STATE_KEY) == digest:
+            logger.info("Application commands unchanged, skipping sync")
+            return
+    except psycopg2.Error as exc:
+        logger.warning("Could not read command tree digest: %s", exc)
+
+    synced = await bot.tree.sync(guild=guild)
+    logger.info("Synced %d application commands", len(synced))
+    try:
+        await asyncio.to_thread(save_state, COMMAND_TREE_STATE_KEY, digest)
+    except psycopg2.Error as exc:
+        logger.warning("Could not store command tree digest: %s", exc)
+
+
+bot.setup_hook = sync_command_tree
+_close_bot = bot.close
+
+
+async def close_bot() -> None:
+    """Send pending log digests, then stop the outbound queue and disconnect."""
+    await log_digest.flush()
+    await scheduler.close()
+    await _close_bot()
+
+
+bot.close = close_bot
+
+
 @bot.event
 async def on_ready():
     logger.info("Logged in as %s", bot.user)
 
 
-@bot.command(name="ping")
+@bot.before_invoke
+async def stamp_command_start(ctx: commands.Context) -> None:
+    ctx.command_started_at = time.perf_counter()
+
+
+def command_log_fields(ctx: commands.Context) -> Dict:
+    started = getattr(ctx, "command_started_at", None)
+    return {
+        "event": "command",
+        "command": ctx.command.qualified_name if ctx.command else None,
+        "user": ctx.author.id if ctx.author else None,
+        "duration_ms": (
+            round((time.perf_counter() - started) * 1000, 1) if started else None
+        ),
+    }
+
+
+@bot.event
+async def on_command_completion(ctx: commands.Context) -> None:
+    logger.info("Command completed", extra=command_log_fields(ctx))
+
+
+@bot.event
+async def on_command_error(ctx: commands.Context, error: commands.CommandError) -> None:
+    if isinstance(error, commands.CommandNotFound):
+        return
+    if ctx.command and ctx.command.has_error_handler():
+        return
+    fields = command_log_fields(ctx)
+    # Erreurs de l'utilisateur : une réponse suffit, pas d'alerte dans les logs.
+    if isinstance(error, (commands.UserInputError, commands.CheckFailure)):
+        fields["event"] = "command_rejected"
+        logger.debug("Command rejected: %s", error, extra=fields)
+        if isinstance(error, commands.UserInputError):
+            message = f"❌ Paramètres invalides : {error}"
+        else:
+            message = "❌ Vous ne pouvez pas utiliser cette commande ici."
+        await reply(ctx, message)
+        return
+    fields["event"] = "command_error"
+    logger.error(
+        "Command failed: %s",
+        error,
+        exc_info=(type(error), error, error.__traceback__),
+        extra=fields,
+    )
+    log_digest.error(
+        LOG_CHANNEL_ID, f"❌ Erreur sur `{COMMAND_PREFIX}{fields['command']}` : {error}"
+    )
+
+
+@bot.hybrid_command(name="ping", description="Activer ou désactiver les notifications de nouveaux lobbys")
 async def ping_role(ctx: commands.Context):
     guild = ctx.guild
     member = ctx.author
 
     if guild is None or not isinstance(member, discord.Member):
-        await ctx.send("❌ Cette commande doit être utilisée dans un serveur.")
+        await reply(ctx, "❌ Cette commande doit être utilisée dans un serveur.")
         return
 
     role = guild.get_role(PING_ROLE_ID)
     if role is None:
-        await ctx.send(
+        await reply(
+            ctx,
             "❌ Le rôle de notification n'est pas configuré. Contactez un administrateur."
         )
         return
 
     if role in member.roles:
         await member.remove_roles(role, reason="Désinscription ping matchmaking solo")
-        await ctx.send(
+        await reply(
+            ctx,
             f"🔕 {member.mention} ne recevra plus les notifications de nouveaux lobbys."
         )
     else:
         await member.add_roles(role, reason="Inscription ping matchmaking solo")
-        await ctx.send(
+        await reply(
+            ctx,
             f"🔔 {member.mention} recevra désormais les notifications de nouveaux lobbys."
         )
 
 
-@bot.command(name="join")
+@bot.hybrid_command(name="join", description="Rejoindre la file solo 3v3")
 async def join(ctx: commands.Context):
+    await ctx.defer()
     member = ctx.author
     if not isinstance(member, discord.Member):
-        await ctx.send("❌ Cette commande doit être utilisée dans un serveur.")
+        await reply(ctx, "❌ Cette commande doit être utilisée dans un serveur.")
         return
 
+    member_cache.remember(member)
     player = ensure_player(member.id, member.display_name)
 
     async with queue_lock:
         if member.id in solo_queue:
-            await ctx.send(
+            await reply(
+                ctx,
                 f"{member.mention} est déjà dans la file solo. "
                 f"({format_queue_position()})"
             )
@@ -620,14 +811,15 @@ async def join(ctx: commands.Context):
         solo_queue.append(member.id)
         position = len(solo_queue)
 
-    await ctx.send(
+    await reply(
+        ctx,
         f"✅ {member.mention} rejoint la file solo (ELO {player.solo_elo}). "
         f"Position : {position}/{QUEUE_TARGET_SIZE}."
     )
     await create_match_if_possible(ctx)
 
 
-@bot.command(name="leave")
+@bot.hybrid_command(name="leave", description="Quitter la file solo")
 async def leave(ctx: commands.Context):
     member = ctx.author
     removed = False
@@ -638,13 +830,14 @@ async def leave(ctx: commands.Context):
             removed = True
 
     if removed:
-        await ctx.send(f"👋 {member.mention} quitte la file solo.")
+        await reply(ctx, f"👋 {member.mention} quitte la file solo.")
     else:
-        await ctx.send(f"{member.mention} n'est pas dans une file solo.")
+        await reply(ctx, f"{member.mention} n'est pas dans une file solo.")
 
 
-@bot.command(name="queue")
+@bot.hybrid_command(name="queue", description="Voir la file solo actuelle")
 async def queue(ctx: commands.Context):
+    await ctx.defer()
     lines: List[str] = []
     async with queue_lock:
         queue_snapshot = list(solo_queue)
@@ -662,10 +855,10 @@ async def queue(ctx: commands.Context):
             lines.append(f"{index}. <@{discord_id}> ({elo} ELO)")
         lines.append("")
 
-    await ctx.send("\n".join(lines) if lines else "Aucune file en cours.")
+    await reply(ctx, "\n".join(lines) if lines else "Aucune file en cours.")
 
 
-@bot.command(name="maps")
+@bot.hybrid_command(name="maps", description="Voir la rotation des maps")
 async def maps_command(ctx: commands.Context):
     lines = ["🗺️ **Rotation des maps disponibles**", ""]
     for mode_info in MAP_ROTATION:
@@ -674,11 +867,12 @@ async def maps_command(ctx: commands.Context):
         maps = ", ".join(mode_info["maps"])
         lines.append(f"{emoji} **{mode}** : {maps}")
 
-    await ctx.send("\n".join(lines))
+    await reply(ctx, "\n".join(lines))
 
 
-@bot.command(name="elo")
+@bot.hybrid_command(name="elo", description="Voir l'ELO solo d'un joueur")
 async def elo_command(ctx: commands.Context, member: Optional[discord.Member] = None):
+    await ctx.defer()
     target = member or ctx.author
     player = fetch_player(target.id)
     if not player:
@@ -687,15 +881,18 @@ async def elo_command(ctx: commands.Context, member: Optional[discord.Member] =
     total_games = player.solo_wins + player.solo_losses
     win_rate = (player.solo_wins / total_games * 100) if total_games else 0.0
 
-    await ctx.send(
+    await reply(
+        ctx,
         f"📊 ELO Solo de {target.mention} : {player.solo_elo} "
         f"({player.solo_wins} victoires / {player.solo_losses} défaites, {win_rate:.1f}% WR)"
     )
 
 
-@bot.command(name="resetstats")
+@bot.hybrid_command(name="resetstats", description="Réinitialiser toutes les statistiques (administrateurs)")
 @commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
 async def reset_stats(ctx: commands.Context):
+    await ctx.defer()
     conn = get_connection()
     try:
         with conn.cursor() as cursor:
@@ -714,30 +911,213 @@ async def reset_stats(ctx: commands.Context):
     async with queue_lock:
         solo_queue.clear()
 
-    await ctx.send("♻️ Toutes les statistiques des joueurs ont été réinitialisées.")
+    await reply(ctx, "♻️ Toutes les statistiques des joueurs ont été réinitialisées.")
 
 
 @reset_stats.error
 async def reset_stats_error(ctx: commands.Context, error: commands.CommandError):
     if isinstance(error, commands.MissingPermissions):
-        await ctx.send("❌ Vous n'avez pas la permission de réinitialiser les statistiques.")
+        await reply(ctx, "❌ Vous n'avez pas la permission de réinitialiser les statistiques.")
     else:
         raise error
 
 
-@bot.command(name="help")
+def text_attachment(content: str, filename: str) -> discord.File:
+    return discord.File(io.BytesIO(content.encode("utf-8")), filename=filename)
+
+
+@bot.hybrid_command(name="slowqueries", description="Requêtes SQL les plus lentes (administrateurs)")
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+async def slow_queries_command(ctx: commands.Context, limit: int = 10):
+    lines = format_slow_queries(limit)
+    if not lines:
+        await reply(ctx, "✅ Aucune requête lente enregistrée depuis le démarrage.")
+        return
+
+    body = "\n".join(["🐢 **Requêtes les plus lentes**", *lines])
+    plans = [
+        f"-- {record.duration_ms:.1f} ms · {record.caller}\n{record.fingerprint}\n{record.explain}"
+        for record in slow_query_log.slowest(limit)
+        if record.explain
+    ]
+    if len(body) <= 1900 and not plans:
+        await reply(ctx, body)
+        return
+
+    report = "\n".join(lines)
+    if plans:
+        report += "\n\n" + "\n\n".join(plans)
+    await reply(
+        ctx,
+        "🐢 Rapport des requêtes lentes en pièce jointe.",
+        file=text_attachment(report, "slow_queries.txt"),
+    )
+
+
+@slow_queries_command.error
+async def slow_queries_error(ctx: commands.Context, error: commands.CommandError):
+    if isinstance(error, commands.MissingPermissions):
+        await reply(ctx, "❌ Cette commande est réservée aux administrateurs.")
+    else:
+        raise error
+
+
+async def send_profile(channel: discord.abc.Messageable) -> None:
+    stack_sampler.stop()
+    await scheduler.send(
+        channel,
+        f"📈 Profil terminé ({stack_sampler.sample_count} échantillons).",
+        priority=Priority.REPLY,
+        files=[
+            text_attachment(stack_sampler.summary(), "profile_summary.txt"),
+            text_attachment(stack_sampler.collapsed(), "profile_collapsed.txt"),
+        ],
+    )
+
+
+async def finish_profile_later(channel: discord.abc.Messageable, seconds: int) -> None:
+    global profile_task
+    try:
+        await asyncio.sleep(seconds)
+        await send_profile(channel)
+    finally:
+        profile_task = None
+
+
+@bot.hybrid_group(
+    name="perf",
+    description="Diagnostic des performances (administrateurs)",
+    invoke_without_command=True,
+    fallback="aide",
+)
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+async def perf_group(ctx: commands.Context):
+    await reply(
+        ctx,
+        "\n".join(
+            [
+                "🩺 **Diagnostic des performances**",
+                f"• `{COMMAND_PREFIX}perf start [secondes]` – Profiler la boucle d'événements (30s par défaut)",
+                f"• `{COMMAND_PREFIX}perf stop` – Arrêter le profilage et envoyer les résultats",
+                f"• `{COMMAND_PREFIX}perf tasks` – Lister les tâches asyncio les plus anciennes",
+                f"• `{COMMAND_PREFIX}perf outbound` – Profondeur de la file d'envoi et latences",
+                f"• `{COMMAND_PREFIX}perf mem` – Snapshot mémoire `tracemalloc` (diff avec le précédent)",
+                f"• `{COMMAND_PREFIX}perf memstop` – Arrêter le suivi mémoire",
+            ]
+        )
+    )
+
+
+@perf_group.command(name="start", description="Profiler la boucle d'événements pendant N secondes")
+@commands.has_permissions(administrator=True)
+async def perf_start(ctx: commands.Context, seconds: int = 30):
+    global profile_task
+    if stack_sampler.running:
+        await reply(ctx, f"⚠️ Un profilage est déjà en cours. Utilisez `{COMMAND_PREFIX}perf stop`.")
+        return
+
+    seconds = max(1, min(seconds, 600))
+    stack_sampler.start(threading.get_ident())
+    profile_task = asyncio.create_task(finish_profile_later(ctx.channel, seconds))
+    await reply(ctx, f"⏱️ Profilage démarré pour {seconds}s.")
+
+
+@perf_group.command(name="stop", description="Arrêter le profilage et envoyer les résultats")
+@commands.has_permissions(administrator=True)
+async def perf_stop(ctx: commands.Context):
+    global profile_task
+    if not stack_sampler.running:
+        await reply(ctx, "ℹ️ Aucun profilage en cours.")
+        return
+
+    if profile_task:
+        profile_task.cancel()
+        profile_task = None
+    if ctx.interaction is not None:
+        # Le profil part dans le salon : on acquitte la commande slash.
+        await reply(ctx, "⏹️ Profilage arrêté.", ephemeral=True)
+    await send_profile(ctx.channel)
+
+
+@perf_group.command(name="tasks", description="Lister les tâches asyncio les plus anciennes")
+@commands.has_permissions(administrator=True)
+async def perf_tasks(ctx: commands.Context, limit: int = 50):
+    report = describe_tasks(limit)
+    await reply(
+        ctx,
+        f"🧵 {len(asyncio.all_tasks())} tâches asyncio.",
+        file=text_attachment(report, "tasks.txt"),
+    )
+
+
+@perf_group.command(name="outbound", description="Profondeur de la file d'envoi et latences")
+@commands.has_permissions(administrator=True)
+async def perf_outbound(ctx: commands.Context):
+    lines = [f"📬 **File d'envoi** ({scheduler.depth()} messages en attente)"]
+    for name, stats in scheduler.stats().items():
+        latency = (
+            f"p50 {stats['p50_ms']} ms / p95 {stats['p95_ms']} ms"
+            if stats["p50_ms"] is not None
+            else "aucun envoi"
+        )
+        lines.append(
+            f"• `{name}` : {stats['queued']} en attente, {stats['sent']} envoyés, "
+            f"{stats['merged']} fusionnés, {stats['dropped']} abandonnés, "
+            f"{stats['failed']} échecs – {latency}"
+        )
+    await reply(ctx, "\n".join(lines))
+
+
+@perf_group.command(name="mem", description="Snapshot mémoire tracemalloc (diff avec le précédent)")
+@commands.has_permissions(administrator=True)
+async def perf_mem(ctx: commands.Context, limit: int = 30):
+    await ctx.defer()
+    report = await asyncio.to_thread(memory_tracker.snapshot, limit)
+    await reply(
+        ctx,
+        "🧠 Snapshot mémoire effectué.",
+        file=text_attachment(report, "tracemalloc.txt"),
+    )
+
+
+@perf_group.command(name="memstop", description="Arrêter le suivi mémoire")
+@commands.has_permissions(administrator=True)
+async def perf_memstop(ctx: commands.Context):
+    memory_tracker.stop()
+    await reply(ctx, "🧠 Suivi mémoire arrêté.")
+
+
+@perf_group.error
+async def perf_error(ctx: commands.Context, error: commands.CommandError):
+    if isinstance(error, commands.MissingPermissions):
+        await reply(ctx, "❌ Cette commande est réservée aux administrateurs.")
+    else:
+        raise error
+
+
+# Les sous-commandes ne passent pas par les checks du groupe
+# (invoke_without_command) : chacune porte son propre check et ce handler.
+for perf_subcommand in perf_group.commands:
+    perf_subcommand.error(perf_error)
+
+
+@bot.hybrid_command(name="help", description="Liste des commandes du matchmaking")
 async def help_command(ctx: commands.Context):
     lines = [
         "🤖 **Commandes Matchmaking Solo**",
-        "• `!join` – Rejoindre la file 3v3",
-        "• `!leave` – Quitter la file",
-        "• `!queue` – Voir les files actuelles",
-        "• `!ping` – Activer ou désactiver les notifications de nouveaux lobbys",
-        "• `!elo [@joueur]` – Voir l'ELO solo",
+        f"• `{COMMAND_PREFIX}join` – Rejoindre la file 3v3",
+        f"• `{COMMAND_PREFIX}leave` – Quitter la file",
+        f"• `{COMMAND_PREFIX}queue` – Voir les files actuelles",
+        f"• `{COMMAND_PREFIX}ping` – Activer ou désactiver les notifications de nouveaux lobbys",
+        f"• `{COMMAND_PREFIX}elo [@joueur]` – Voir l'ELO solo",
         "• Votez pour le vainqueur grâce aux boutons du match",
-        "• `!resetstats` – Réinitialiser toutes les stats (administrateurs)",
+        f"• `{COMMAND_PREFIX}resetstats` – Réinitialiser toutes les stats (administrateurs)",
+        f"• `{COMMAND_PREFIX}slowqueries [n]` – Requêtes SQL les plus lentes (administrateurs)",
+        f"• `{COMMAND_PREFIX}perf` – Profilage et diagnostic en direct (administrateurs)",
     ]
-    await ctx.send("\n".join(lines))
+    await reply(ctx, "\n".join(lines))
 
 
 # ----------------------------------------------------------------------------
@@ -751,6 +1131,7 @@ async def main():
     if not DATABASE_URL:
         raise RuntimeError("DATABASE_URL environment variable is not set")
 
+    install_task_factory(asyncio.get_running_loop())
     init_db()
     await bot.start(TOKEN)
 
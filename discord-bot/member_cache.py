@@ -0,0 +1,103 @@
+"""Bounded, lazily populated guild member cache.
+
+With ``SLIM_GATEWAY=1`` the bot no longer chunks guilds at startup nor lets
+discord.py cache every member.  The only members the bot needs are the ones
+who queue or vote, so they are kept in a small LRU instead: members seen in
+commands and interactions are remembered, and anyone else is fetched on
+demand with ``Guild.query_members(user_ids=...)`` in batches of up to 100.
+
+Configuration (environment variables):
+
+``MEMBER_CACHE_SIZE``
+    Maximum number of members kept (default ``2000``).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+MEMBER_CACHE_SIZE = int(os.getenv("MEMBER_CACHE_SIZE", "2000"))
+QUERY_BATCH_SIZE = 100
+
+
+class MemberCache:
+    """LRU of :class:`discord.Member` keyed by ``(guild_id, user_id)``."""
+
+    def __init__(self, max_size: int = MEMBER_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._members: "OrderedDict[Tuple[int, int], discord.Member]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def remember(self, member: discord.abc.User) -> None:
+        if not isinstance(member, discord.Member):
+            return
+        key = (member.guild.id, member.id)
+        self._members[key] = member
+        self._members.move_to_end(key)
+        while len(self._members) > self.max_size:
+            self._members.popitem(last=False)
+
+    def get(self, guild: Optional[discord.Guild], user_id: int) -> Optional[discord.Member]:
+        """Return a cached member without touching the gateway."""
+        if guild is None:
+            return None
+        key = (guild.id, user_id)
+        member = self._members.get(key)
+        if member is not None:
+            self._members.move_to_end(key)
+            self.hits += 1
+            return member
+        member = guild.get_member(user_id)
+        if member is not None:
+            self.remember(member)
+            self.hits += 1
+        return member
+
+    def display_name(self, guild: Optional[discord.Guild], user_id: int) -> str:
+        member = self.get(guild, user_id)
+        return member.display_name if member else f"Joueur {user_id}"
+
+    async def fetch_many(
+        self, guild: Optional[discord.Guild], user_ids: Iterable[int]
+    ) -> Dict[int, discord.Member]:
+        """Return the requested members, querying the gateway for cache misses."""
+        found: Dict[int, discord.Member] = {}
+        if guild is None:
+            return found
+
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            member = self.get(guild, user_id)
+            if member is not None:
+                found[user_id] = member
+            else:
+                missing.append(user_id)
+
+        self.misses += len(missing)
+        for start in range(0, len(missing), QUERY_BATCH_SIZE):
+            batch = missing[start : start + QUERY_BATCH_SIZE]
+            try:
+                members = await guild.query_members(
+                    user_ids=batch, limit=len(batch), cache=False
+                )
+            except (discord.HTTPException, discord.ClientException, TimeoutError) as exc:
+                logger.warning("Failed to query %d members: %s", len(batch), exc)
+                continue
+            for member in members:
+                self.remember(member)
+                found[member.id] = member
+        return found
+
+
+member_cache = MemberCache()
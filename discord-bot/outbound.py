@@ -0,0 +1,336 @@
+"""Priority-aware scheduler for outbound Discord messages.
+
+Every message the bot posts in a channel goes through :data:`scheduler`
+instead of calling ``channel.send`` directly.  Messages are queued per rate
+limit bucket (Discord limits ``POST /channels/{channel_id}/messages`` per
+channel, plus a global per-bot limit) and dispatched highest priority first:
+
+``MATCH`` > ``REPLY`` > ``LOG``
+
+(Interaction responses do not go through the scheduler: they use the
+interaction callback route, not the channel bucket.)  Log messages are merged
+with a pending message of the same ``merge_key`` when the result still fits in
+one message, and those that have waited longer than their ``max_age`` are
+dropped when the queue is under pressure; match announcements and command
+replies never expire.  :meth:`OutboundScheduler.stats` exposes queue depth
+and send latency per priority.
+
+Configuration (environment variables):
+
+``OUTBOUND_CHANNEL_RATE`` / ``OUTBOUND_CHANNEL_PER``
+    Per-channel bucket (default 5 messages per 5 seconds).
+``OUTBOUND_GLOBAL_RATE``
+    Global requests per second (default ``45``).
+``OUTBOUND_PRESSURE_DEPTH``
+    Queue depth above which stale log messages are dropped
+    (default ``20``).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import enum
+import itertools
+import logging
+import os
+import statistics
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set
+
+from log_digest import MESSAGE_LIMIT, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_RATE = int(os.getenv("OUTBOUND_CHANNEL_RATE", "5"))
+CHANNEL_PER = float(os.getenv("OUTBOUND_CHANNEL_PER", "5"))
+GLOBAL_RATE = int(os.getenv("OUTBOUND_GLOBAL_RATE", "45"))
+PRESSURE_DEPTH = int(os.getenv("OUTBOUND_PRESSURE_DEPTH", "20"))
+
+
+class Priority(enum.IntEnum):
+    MATCH = 0
+    REPLY = 1
+    LOG = 2
+
+
+# A user waiting for an answer must get it, however late: only logs expire.
+DEFAULT_MAX_AGE: Dict[Priority, Optional[float]] = {
+    Priority.MATCH: None,
+    Priority.REPLY: None,
+    Priority.LOG: 300.0,
+}
+
+
+@dataclass
+class _Outgoing:
+    priority: Priority
+    seq: int
+    bucket: Hashable
+    factory: Callable[["_Outgoing"], Awaitable[Any]]
+    enqueued_at: float
+    max_age: Optional[float]
+    content: Optional[str] = None
+    merge_key: Optional[Hashable] = None
+    futures: List[asyncio.Future] = field(default_factory=list)
+
+    def stale(self, now: float) -> bool:
+        return self.max_age is not None and now - self.enqueued_at > self.max_age
+
+
+class OutboundScheduler:
+    """Queue outbound sends per bucket and dispatch them by priority."""
+
+    def __init__(
+        self,
+        channel_rate: int = CHANNEL_RATE,
+        channel_per: float = CHANNEL_PER,
+        global_rate: int = GLOBAL_RATE,
+        pressure_depth: int = PRESSURE_DEPTH,
+    ) -> None:
+        self.channel_rate = channel_rate
+        self.channel_per = channel_per
+        self.pressure_depth = pressure_depth
+        self._global_bucket = TokenBucket(global_rate, 1.0)
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._queues: Dict[Hashable, List[_Outgoing]] = {}
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Strong references to in-flight sends (the loop only keeps weak ones).
+        self._deliveries: Set[asyncio.Task] = set()
+        self._latencies: Dict[Priority, Deque[float]] = {
+            priority: deque(maxlen=500) for priority in Priority
+        }
+        self.sent = {priority: 0 for priority in Priority}
+        self.dropped = {priority: 0 for priority in Priority}
+        self.merged = {priority: 0 for priority in Priority}
+        self.failed = {priority: 0 for priority in Priority}
+
+    # ------------------------------------------------------------------ API
+
+    def send(
+        self,
+        channel,
+        content: Optional[str] = None,
+        *,
+        priority: Priority = Priority.REPLY,
+        merge_key: Optional[Hashable] = None,
+        max_age: Optional[float] = None,
+        **kwargs,
+    ) -> "asyncio.Future":
+        """Schedule ``channel.send(content, **kwargs)``.
+
+        Returns a future resolved with the sent message, or ``None`` if the
+        message was dropped as stale.
+        """
+        if merge_key is not None and content is not None and not kwargs:
+            merged = self._try_merge(channel.id, merge_key, priority, content)
+            if merged is not None:
+                return merged
+
+        item = self._enqueue(
+            bucket=("channel", channel.id),
+            factory=lambda item: channel.send(item.content, **kwargs),
+            priority=priority,
+            max_age=max_age,
+            content=content,
+            merge_key=merge_key if not kwargs else None,
+        )
+        return item.futures[0]
+
+    def submit(
+        self,
+        bucket: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        *,
+        priority: Priority = Priority.REPLY,
+        max_age: Optional[float] = None,
+    ) -> "asyncio.Future":
+        """Schedule an arbitrary rate-limited call (e.g. a webhook follow-up)."""
+        return self._enqueue(bucket, lambda item: factory(), priority, max_age).futures[0]
+
+    async def close(self) -> None:
+        """Stop dispatching and cancel in-flight sends (bot shutdown)."""
+        tasks = list(self._deliveries)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for queue in self._queues.values():
+            for item in queue:
+                for future in item.futures:
+                    future.cancel()
+            queue.clear()
+
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return queue depth, counters and send latency (ms) per priority."""
+        depth = {priority: 0 for priority in Priority}
+        for queue in self._queues.values():
+            for item in queue:
+                depth[item.priority] += 1
+
+        result: Dict[str, Dict[str, Any]] = {}
+        for priority in Priority:
+            samples = sorted(self._latencies[priority])
+            result[priority.name.lower()] = {
+                "queued": depth[priority],
+                "sent": self.sent[priority],
+                "merged": self.merged[priority],
+                "dropped": self.dropped[priority],
+                "failed": self.failed[priority],
+                "p50_ms": round(statistics.median(samples) * 1000, 1) if samples else None,
+                "p95_ms": (
+                    round(samples[int(0.95 * (len(samples) - 1))] * 1000, 1)
+                    if samples
+                    else None
+                ),
+            }
+        return result
+
+    # ------------------------------------------------------------ internals
+
+    def _enqueue(
+        self,
+        bucket: Hashable,
+        factory: Callable[[_Outgoing], Awaitable[Any]],
+        priority: Priority,
+        max_age: Optional[float],
+        content: Optional[str] = None,
+        merge_key: Optional[Hashable] = None,
+    ) -> _Outgoing:
+        loop = asyncio.get_running_loop()
+        item = _Outgoing(
+            priority=priority,
+            seq=next(self._seq),
+            bucket=bucket,
+            factory=factory,
+            enqueued_at=time.monotonic(),
+            max_age=max_age if max_age is not None else DEFAULT_MAX_AGE[priority],
+            content=content,
+            merge_key=merge_key,
+            futures=[loop.create_future()],
+        )
+        self._queues.setdefault(bucket, []).append(item)
+        self._ensure_dispatcher()
+        self._wakeup.set()
+        return item
+
+    def _try_merge(
+        self, channel_id: int, merge_key: Hashable, priority: Priority, content: str
+    ) -> Optional["asyncio.Future"]:
+        for item in self._queues.get(("channel", channel_id), ()):
+            if item.merge_key != merge_key or item.priority != priority:
+                continue
+            combined = f"{item.content}\n\n{content}"
+            if len(combined) > MESSAGE_LIMIT:
+                continue
+            item.content = combined
+            future = asyncio.get_running_loop().create_future()
+            item.futures.append(future)
+            self.merged[priority] += 1
+            return future
+        return None
+
+    def _ensure_dispatcher(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch_loop())
+
+    def _bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.channel_rate, self.channel_per)
+        return bucket
+
+    def _drop_stale(self, now: float) -> None:
+        if self.depth() < self.pressure_depth:
+            return
+        for queue in self._queues.values():
+            for item in [item for item in queue if item.stale(now)]:
+                queue.remove(item)
+                self.dropped[item.priority] += 1
+                for future in item.futures:
+                    if not future.done():
+                        future.set_result(None)
+                logger.warning(
+                    "Dropped stale %s message after %.1fs",
+                    item.priority.name,
+                    now - item.enqueued_at,
+                    extra={"event": "outbound_dropped"},
+                )
+
+    def _next_ready(self) -> tuple:
+        """Return ``(item, delay)``: the best sendable item or how long to wait."""
+        best: Optional[_Outgoing] = None
+        wait: Optional[float] = None
+        for key, queue in self._queues.items():
+            if not queue:
+                continue
+            head = min(queue, key=lambda item: (item.priority, item.seq))
+            delay = self._bucket(key).delay()
+            if delay:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            if best is None or (head.priority, head.seq) < (best.priority, best.seq):
+                best = head
+        return best, wait
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            self._drop_stale(now)
+            item, wait = self._next_ready()
+
+            if item is None:
+                if not self.depth():
+                    await self._wakeup.wait()
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            global_delay = self._global_bucket.delay()
+            if global_delay:
+                await asyncio.sleep(global_delay)
+                continue
+
+            self._queues[item.bucket].remove(item)
+            self._bucket(item.bucket).consume()
+            self._global_bucket.consume()
+            task = asyncio.create_task(self._deliver(item))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, item: _Outgoing) -> None:
+        try:
+            result = await item.factory(item)
+        except asyncio.CancelledError:
+            for future in item.futures:
+                future.cancel()
+            raise
+        except Exception as exc:
+            self.failed[item.priority] += 1
+            for future in item.futures:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        self.sent[item.priority] += 1
+        self._latencies[item.priority].append(time.monotonic() - item.enqueued_at)
+        for future in item.futures:
+            if not future.done():
+                future.set_result(result)
+
+
+scheduler = OutboundScheduler()
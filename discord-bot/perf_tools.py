@@ -0,0 +1,207 @@
+"""Live diagnostics for the running bot.
+
+These helpers back the admin-only ``!perf`` command group:
+
+* :class:`StackSampler` is a low-overhead sampling profiler.  A background
+  thread periodically captures the event loop thread's Python stack and
+  aggregates the samples into collapsed stacks (the input format of
+  ``flamegraph.pl`` / speedscope) plus a per-function summary.
+* :func:`install_task_factory` stamps every asyncio task with its creation
+  time so :func:`describe_tasks` can report the oldest tasks and where each
+  one is currently suspended.
+* :class:`MemoryTracker` takes ``tracemalloc`` snapshots and diffs each one
+  against the previous snapshot.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import linecache
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import Counter
+from typing import List, Optional
+
+_task_created_at: "weakref.WeakKeyDictionary[asyncio.Task, float]" = weakref.WeakKeyDictionary()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Sample the stack of one thread at a fixed interval."""
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64) -> None:
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._target_thread_id: Optional[int] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_id: Optional[int] = None) -> None:
+        """Start sampling ``thread_id`` (defaults to the calling thread)."""
+        if self.running:
+            raise RuntimeError("Sampler already running")
+        self.samples.clear()
+        self.sample_count = 0
+        self.started_at = time.monotonic()
+        self.stopped_at = None
+        self._target_thread_id = thread_id or threading.get_ident()
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="perf-stack-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self.stopped_at = time.monotonic()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is None:
+                continue
+            stack: List[str] = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def collapsed(self) -> str:
+        """Return the samples in collapsed-stack format."""
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self.samples.most_common()
+        )
+
+    def summary(self, limit: int = 30) -> str:
+        """Return the hottest functions by self and cumulative samples."""
+        own: Counter = Counter()
+        cumulative: Counter = Counter()
+        for stack, count in self.samples.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for label in set(frames):
+                cumulative[label] += count
+
+        total = max(self.sample_count, 1)
+        end = self.stopped_at or time.monotonic()
+        duration = end - (self.started_at or end)
+        lines = [
+            f"{self.sample_count} samples over {duration:.1f}s "
+            f"(interval {self.interval * 1000:.1f} ms)",
+            "",
+            "Self time:",
+        ]
+        for label, count in own.most_common(limit):
+            lines.append(f"  {count / total:6.1%}  {label}")
+        lines.extend(["", "Cumulative time:"])
+        for label, count in cumulative.most_common(limit):
+            lines.append(f"  {count / total:6.1%}  {label}")
+        return "\n".join(lines)
+
+
+def install_task_factory(loop: asyncio.AbstractEventLoop) -> None:
+    """Record the creation time of every task created on ``loop``."""
+    previous = loop.get_task_factory()
+
+    def factory(loop, coro, **kwargs):
+        if previous is not None:
+            task = previous(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        _task_created_at[task] = time.monotonic()
+        return task
+
+    loop.set_task_factory(factory)
+
+
+def describe_tasks(limit: int = 50) -> str:
+    """Return the oldest pending tasks with their age and suspension point."""
+    now = time.monotonic()
+    tasks = [task for task in asyncio.all_tasks() if not task.done()]
+    tasks.sort(key=lambda task: _task_created_at.get(task, now))
+
+    lines = [f"{len(tasks)} pending tasks", ""]
+    for task in tasks[:limit]:
+        created = _task_created_at.get(task)
+        age = f"{now - created:9.1f}s" if created is not None else "        ?"
+        coro = task.get_coro()
+        name = getattr(coro, "__qualname__", repr(coro))
+        lines.append(f"{age}  {task.get_name()}  {name}")
+        for frame in task.get_stack(limit=1):
+            filename = frame.f_code.co_filename
+            line = linecache.getline(filename, frame.f_lineno).strip()
+            lines.append(f"           at {os.path.basename(filename)}:{frame.f_lineno}  {line}")
+    if len(tasks) > limit:
+        lines.append(f"... {len(tasks) - limit} more")
+    return "\n".join(lines)
+
+
+class MemoryTracker:
+    """Take ``tracemalloc`` snapshots and diff consecutive ones."""
+
+    def __init__(self, frames: int = 10) -> None:
+        self.frames = frames
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    def snapshot(self, limit: int = 30) -> str:
+        started = False
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            started = True
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"Traced memory: {current / 1024:.1f} KiB (peak {peak / 1024:.1f} KiB)",
+            "",
+        ]
+        if started:
+            lines.append(
+                "tracemalloc just started: allocations made before now are not "
+                "traced. Take another snapshot later to get a useful diff."
+            )
+            lines.append("")
+
+        if self._previous is not None:
+            lines.append("Diff against previous snapshot:")
+            for stat in snapshot.compare_to(self._previous, "lineno")[:limit]:
+                lines.append(f"  {stat}")
+            lines.append("")
+
+        lines.append("Top allocations:")
+        for stat in snapshot.statistics("lineno")[:limit]:
+            lines.append(f"  {stat}")
+
+        self._previous = snapshot
+        return "\n".join(lines)
+
+    def stop(self) -> None:
+        self._previous = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
@@ -0,0 +1,425 @@
+"""Catalog snapshot and declarative schema planner.
+
+:meth:`Catalog.load` reads every table of a schema -- columns, types,
+defaults, constraints and indexes -- from ``pg_catalog`` in a single query,
+instead of one slow ``information_schema`` query per table and per question.
+:func:`get_catalog` memoizes that snapshot for the whole process and
+persists it to disk keyed by a cheap schema hash (:data:`SCHEMA_HASH_QUERY`),
+so the maintenance scripts share one catalog load per schema version.
+
+:func:`plan_table` diffs a :class:`TableSpec` against that snapshot and emits
+the minimal DDL to converge: one ``CREATE TABLE`` for a missing table, or a
+single combined ``ALTER TABLE`` per table.  Columns that must be filled with
+their default before ``SET NOT NULL`` are listed in :attr:`TablePlan.fills`
+so the caller can backfill them in batches first.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import tempfile
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from psycopg2 import sql
+
+logger = logging.getLogger(__name__)
+
+# Directory for persisted snapshots; an empty value disables persistence.
+CACHE_DIR = os.getenv(
+    "SCHEMA_CATALOG_CACHE", os.path.join(tempfile.gettempdir(), "prissleague-catalog")
+)
+
+CATALOG_QUERY = """
+SELECT
+    c.relname AS table_name,
+    COALESCE((
+        SELECT json_agg(json_build_object(
+                   'name', a.attname,
+                   'type', format_type(a.atttypid, a.atttypmod),
+                   'not_null', a.attnotnull,
+                   'default', pg_get_expr(d.adbin, d.adrelid)
+               ) ORDER BY a.attnum)
+        FROM pg_attribute a
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    ), '[]'::json) AS columns,
+    COALESCE((
+        SELECT json_agg(json_build_object(
+                   'name', con.conname,
+                   'type', con.contype,
+                   'definition', pg_get_constraintdef(con.oid),
+                   'columns', (
+                       SELECT json_agg(att.attname ORDER BY k.ord)
+                       FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+                       JOIN pg_attribute att
+                         ON att.attrelid = con.conrelid AND att.attnum = k.attnum
+                   ),
+                   'referenced_table', ref.relname
+               ) ORDER BY con.conname)
+        FROM pg_constraint con
+        LEFT JOIN pg_class ref ON ref.oid = con.confrelid
+        WHERE con.conrelid = c.oid
+    ), '[]'::json) AS constraints,
+    COALESCE((
+        SELECT json_agg(json_build_object(
+                   'name', ic.relname,
+                   'definition', pg_get_indexdef(i.indexrelid),
+                   'unique', i.indisunique,
+                   'primary', i.indisprimary
+               ) ORDER BY ic.relname)
+        FROM pg_index i
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+        WHERE i.indrelid = c.oid
+    ), '[]'::json) AS indexes
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = %s AND c.relkind IN ('r', 'p')
+ORDER BY c.relname
+"""
+
+
+# Any DDL on the schema rewrites or adds rows in these catalogs, which gives
+# them a new ``xmin``: hashing (oid, xmin) pairs detects schema changes
+# without deparsing a single definition.
+SCHEMA_HASH_QUERY = """
+SELECT md5(current_database() || ':' || COALESCE(string_agg(entry, ',' ORDER BY entry), ''))
+       AS schema_hash
+FROM (
+    SELECT 'c' || c.oid || ':' || c.xmin AS entry
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = %(schema)s
+    UNION ALL
+    SELECT 'a' || a.attrelid || '.' || a.attnum || ':' || a.xmin
+    FROM pg_attribute a
+    JOIN pg_class c ON c.oid = a.attrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = %(schema)s AND a.attnum > 0
+    UNION ALL
+    SELECT 'd' || d.oid || ':' || d.xmin
+    FROM pg_attrdef d
+    JOIN pg_class c ON c.oid = d.adrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = %(schema)s
+    UNION ALL
+    SELECT 'k' || con.oid || ':' || con.xmin
+    FROM pg_constraint con
+    JOIN pg_namespace n ON n.oid = con.connamespace
+    WHERE n.nspname = %(schema)s
+) AS entries
+"""
+
+
+@dataclass
+class Column:
+    name: str
+    type: str
+    not_null: bool
+    default: Optional[str]
+
+
+@dataclass
+class Constraint:
+    name: str
+    type: str  # 'p' primary key, 'f' foreign key, 'u' unique, 'c' check
+    definition: str
+    columns: List[str]
+    referenced_table: Optional[str] = None
+
+
+@dataclass
+class Index:
+    name: str
+    definition: str
+    unique: bool
+    primary: bool
+
+
+@dataclass
+class Table:
+    name: str
+    columns: Dict[str, Column]
+    constraints: List[Constraint] = field(default_factory=list)
+    indexes: List[Index] = field(default_factory=list)
+
+    @property
+    def primary_key(self) -> Optional[Constraint]:
+        for constraint in self.constraints:
+            if constraint.type == "p":
+                return constraint
+        return None
+
+    @property
+    def primary_key_columns(self) -> Tuple[str, ...]:
+        constraint = self.primary_key
+        return tuple(constraint.columns) if constraint else ()
+
+
+@dataclass
+class Catalog:
+    schema: str
+    tables: Dict[str, Table]
+
+    @classmethod
+    def load(cls, cursor, schema: str = "public") -> "Catalog":
+        cursor.execute(CATALOG_QUERY, (schema,))
+        return cls.from_rows(schema, cursor.fetchall())
+
+    @classmethod
+    def from_rows(cls, schema: str, rows: Sequence[dict]) -> "Catalog":
+        """Build a catalog from :data:`CATALOG_QUERY` rows (or :meth:`to_rows`)."""
+        tables: Dict[str, Table] = {}
+        for row in rows:
+            tables[row["table_name"]] = Table(
+                name=row["table_name"],
+                columns={col["name"]: Column(**col) for col in row["columns"]},
+                constraints=[Constraint(**con) for con in row["constraints"]],
+                indexes=[Index(**idx) for idx in row["indexes"]],
+            )
+        return cls(schema=schema, tables=tables)
+
+    def to_rows(self) -> List[dict]:
+        """JSON-serializable form accepted by :meth:`from_rows`."""
+        return [
+            {
+                "table_name": table.name,
+                "columns": [asdict(column) for column in table.columns.values()],
+                "constraints": [asdict(constraint) for constraint in table.constraints],
+                "indexes": [asdict(index) for index in table.indexes],
+            }
+            for table in self.tables.values()
+        ]
+
+    def table(self, name: str) -> Optional[Table]:
+        return self.tables.get(name)
+
+
+_memo: Dict[Tuple[str, str], Tuple[str, Catalog]] = {}
+
+
+def schema_hash(cursor, schema: str = "public") -> str:
+    cursor.execute(SCHEMA_HASH_QUERY, {"schema": schema})
+    return cursor.fetchone()["schema_hash"]
+
+
+def _snapshot_path(schema: str, digest: str) -> Optional[str]:
+    if not CACHE_DIR:
+        return None
+    return os.path.join(CACHE_DIR, f"catalog-{schema}-{digest}.json")
+
+
+def _read_snapshot(schema: str, digest: str) -> Optional[Catalog]:
+    path = _snapshot_path(schema, digest)
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return Catalog.from_rows(schema, json.load(f))
+    except (OSError, ValueError, TypeError, KeyError) as exc:
+        logger.warning("Ignoring unreadable catalog snapshot %s: %s", path, exc)
+        return None
+
+
+def _write_snapshot(catalog: Catalog, digest: str) -> None:
+    path = _snapshot_path(catalog.schema, digest)
+    if path is None:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(catalog.to_rows(), f)
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        logger.warning("Could not persist catalog snapshot %s: %s", path, exc)
+
+
+def get_catalog(cursor, schema: str = "public", verify: bool = False) -> Catalog:
+    """Shared, memoized :class:`Catalog` for the connection's database.
+
+    The first call of the process runs :data:`SCHEMA_HASH_QUERY` and reuses
+    the snapshot persisted for that hash, running :data:`CATALOG_QUERY` only
+    when none exists.  Later calls return the memoized catalog without any
+    query; ``verify=True`` re-checks the hash first, for callers that must
+    see DDL applied since (restores, migrations).
+    """
+    key = (cursor.connection.dsn, schema)
+    cached = _memo.get(key)
+    if cached is not None and not verify:
+        return cached[1]
+
+    digest = schema_hash(cursor, schema)
+    if cached is not None and cached[0] == digest:
+        return cached[1]
+    catalog = _read_snapshot(schema, digest)
+    if catalog is None:
+        catalog = Catalog.load(cursor, schema)
+        _write_snapshot(catalog, digest)
+    _memo[key] = (digest, catalog)
+    return catalog
+
+
+def invalidate_catalog() -> None:
+    """Forget memoized catalogs (persisted snapshots stay valid by hash)."""
+    _memo.clear()
+
+
+# ----------------------------------------------------------------------------
+# Desired schema and planning
+# ----------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class ColumnSpec:
+    name: str
+    type: str
+    not_null: bool = False
+    default: Optional[str] = None
+    serial: bool = False
+
+    def definition(self) -> str:
+        if self.serial:
+            return "SERIAL"
+        parts = [self.type.upper()]
+        if self.not_null:
+            parts.append("NOT NULL")
+        if self.default is not None:
+            parts.append(f"DEFAULT {self.default}")
+        return " ".join(parts)
+
+
+@dataclass(frozen=True)
+class TableSpec:
+    name: str
+    columns: Tuple[ColumnSpec, ...]
+    primary_key: Tuple[str, ...]
+
+    def column(self, name: str) -> Optional[ColumnSpec]:
+        for column in self.columns:
+            if column.name == name:
+                return column
+        return None
+
+    def create_statement(self) -> sql.Composable:
+        items = [
+            sql.SQL("{} {}").format(sql.Identifier(col.name), sql.SQL(col.definition()))
+            for col in self.columns
+        ]
+        items.append(
+            sql.SQL("PRIMARY KEY ({})").format(
+                sql.SQL(", ").join(map(sql.Identifier, self.primary_key))
+            )
+        )
+        return sql.SQL("CREATE TABLE {} ({})").format(
+            sql.Identifier(self.name), sql.SQL(", ").join(items)
+        )
+
+
+@dataclass
+class TablePlan:
+    """Changes needed to bring one table to its spec.
+
+    ``fills`` (``(column, default)`` pairs) must be applied before
+    ``statements``.
+    """
+
+    table: str
+    fills: List[Tuple[str, str]] = field(default_factory=list)
+    statements: List[sql.Composable] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.fills or self.statements)
+
+
+_CAST_SUFFIX = re.compile(r"::[a-z_ ]+(\[\])?$")
+
+
+def normalize_default(expression: Optional[str]) -> Optional[str]:
+    """Normalise a default expression so catalog and spec forms compare equal."""
+    if expression is None:
+        return None
+    text = expression.strip().lower()
+    while _CAST_SUFFIX.search(text):
+        text = _CAST_SUFFIX.sub("", text).strip()
+    if text.startswith("(") and text.endswith(")"):
+        text = text[1:-1].strip()
+    return {"current_timestamp": "now()"}.get(text, text)
+
+
+def plan_table(spec: TableSpec, table: Optional[Table]) -> TablePlan:
+    """Return the minimal statements converging ``table`` to ``spec``."""
+    plan = TablePlan(spec.name)
+    if table is None:
+        plan.statements.append(spec.create_statement())
+        return plan
+
+    actions: List[sql.Composable] = []
+
+    for column in spec.columns:
+        ident = sql.Identifier(column.name)
+        current = table.columns.get(column.name)
+        if current is None:
+            actions.append(
+                sql.SQL("ADD COLUMN {} {}").format(ident, sql.SQL(column.definition()))
+            )
+            continue
+        if column.serial:
+            continue
+
+        if current.type != column.type:
+            actions.append(
+                sql.SQL("ALTER COLUMN {col} TYPE {type} USING {col}::{type}").format(
+                    col=ident, type=sql.SQL(column.type.upper())
+                )
+            )
+        if column.default is not None and normalize_default(
+            current.default
+        ) != normalize_default(column.default):
+            actions.append(
+                sql.SQL("ALTER COLUMN {} SET DEFAULT {}").format(
+                    ident, sql.SQL(column.default)
+                )
+            )
+        if column.not_null and not current.not_null:
+            if column.default is not None:
+                plan.fills.append((column.name, column.default))
+            actions.append(sql.SQL("ALTER COLUMN {} SET NOT NULL").format(ident))
+
+    if table.primary_key_columns != spec.primary_key:
+        if table.primary_key is not None:
+            actions.append(
+                sql.SQL("DROP CONSTRAINT {}").format(sql.Identifier(table.primary_key.name))
+            )
+        actions.append(
+            sql.SQL("ADD PRIMARY KEY ({})").format(
+                sql.SQL(", ").join(map(sql.Identifier, spec.primary_key))
+            )
+        )
+
+    if actions:
+        plan.statements.append(
+            sql.SQL("ALTER TABLE {} {}").format(
+                sql.Identifier(spec.name), sql.SQL(", ").join(actions)
+            )
+        )
+    return plan
+
+
+def null_fill_clauses(
+    fills: Sequence[Tuple[str, str]],
+) -> Tuple[sql.Composable, sql.Composable]:
+    """Return ``(assignments, predicate)`` replacing NULLs with defaults."""
+    assignments = sql.SQL(", ").join(
+        sql.SQL("{col} = COALESCE({col}, {default})").format(
+            col=sql.Identifier(name), default=sql.SQL(default)
+        )
+        for name, default in fills
+    )
+    predicate = sql.SQL(" OR ").join(
+        sql.SQL("{} IS NULL").format(sql.Identifier(name)) for name, _ in fills
+    )
+    return assignments, predicate
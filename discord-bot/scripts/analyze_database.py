@@ -1,41 +1,178 @@
 #!/usr/bin/env python3
-import psycopg2
-from psycopg2.extras import RealDictCursor
+"""Vue d'ensemble des tables de la base.
+
+Par défaut, les statistiques viennent du catalogue (``pg_class.reltuples``,
+``pg_stat_user_tables``, tailles des relations) : deux requêtes en tout,
+sans parcourir les tables, donc sans charge sur la production.  Le nombre
+de lignes est une estimation mise à jour par (auto)vacuum/analyze.
+
+Usage :
+    python3 scripts/analyze_database.py              # colonnes + statistiques rapides
+    python3 scripts/analyze_database.py --exact      # + SELECT COUNT(*) par table (lent)
+    python3 scripts/analyze_database.py --json       # statistiques en JSON (suivi dans le temps)
+"""
+
+import argparse
+import json
 import os
+import sys
+from datetime import datetime, timezone
 
-DATABASE_URL = os.getenv('DATABASE_URL')
-
-conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-with conn.cursor() as c:
-    # Lister toutes les tables
-    c.execute("""
-        SELECT table_name 
-        FROM information_schema.tables 
-        WHERE table_schema = 'public' 
-        ORDER BY table_name
-    """)
-    tables = [r['table_name'] for r in c.fetchall()]
-    
-    print("📋 TABLES EXISTANTES:")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from psycopg2 import sql  # noqa: E402
+
+from db_tracing import connect, log_summary  # noqa: E402
+from schema_catalog import get_catalog  # noqa: E402
+from structured_logging import configure_logging  # noqa: E402
+
+TABLE_STATS_QUERY = """
+    SELECT c.relname AS table,
+           CASE WHEN c.reltuples >= 0 THEN c.reltuples::bigint END AS estimated_rows,
+           pg_relation_size(c.oid) AS table_bytes,
+           pg_indexes_size(c.oid) AS index_bytes,
+           COALESCE(pg_total_relation_size(NULLIF(c.reltoastrelid, 0)), 0) AS toast_bytes,
+           pg_total_relation_size(c.oid) AS total_bytes,
+           s.n_live_tup AS live_tuples,
+           s.n_dead_tup AS dead_tuples,
+           s.seq_scan,
+           s.idx_scan,
+           s.last_vacuum,
+           s.last_autovacuum,
+           s.last_analyze,
+           s.last_autoanalyze
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE n.nspname = %s AND c.relkind IN ('r', 'p')
+    ORDER BY pg_total_relation_size(c.oid) DESC, c.relname
+"""
+
+# Index jamais utilisés depuis la dernière remise à zéro des statistiques ;
+# les index uniques restent nécessaires même sans lecture.
+UNUSED_INDEXES_QUERY = """
+    SELECT s.relname AS table,
+           s.indexrelname AS index,
+           pg_relation_size(s.indexrelid) AS bytes
+    FROM pg_stat_user_indexes s
+    JOIN pg_index i ON i.indexrelid = s.indexrelid
+    WHERE s.schemaname = %s AND s.idx_scan = 0 AND NOT i.indisunique
+    ORDER BY bytes DESC, s.relname, s.indexrelname
+"""
+
+
+def collect_stats(cursor, schema="public"):
+    """Statistiques du catalogue : ``{'tables': [...], 'unused_indexes': [...]}``."""
+    cursor.execute(TABLE_STATS_QUERY, (schema,))
+    tables = []
+    for row in cursor.fetchall():
+        table = dict(row)
+        live, dead = table['live_tuples'] or 0, table['dead_tuples'] or 0
+        table['dead_ratio'] = round(dead / (live + dead), 4) if live + dead else 0.0
+        tables.append(table)
+
+    cursor.execute(UNUSED_INDEXES_QUERY, (schema,))
+    return {
+        'collected_at': datetime.now(timezone.utc),
+        'schema': schema,
+        'tables': tables,
+        'unused_indexes': [dict(row) for row in cursor.fetchall()],
+    }
+
+
+def count_rows(cursor, tables, schema="public"):
+    """``SELECT COUNT(*)`` exact de chaque table (parcourt toutes les lignes)."""
+    counts = {}
     for table in tables:
+        cursor.execute(
+            sql.SQL("SELECT COUNT(*) AS count FROM {}").format(sql.Identifier(schema, table))
+        )
+        counts[table] = cursor.fetchone()['count']
+    return counts
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _mb(size):
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+def _last(first, second):
+    """Plus récente des deux dates (vacuum manuel / auto), ou ``jamais``."""
+    dates = [date for date in (first, second) if date is not None]
+    return max(dates).strftime('%Y-%m-%d %H:%M') if dates else "jamais"
+
+
+def print_report(catalog, stats, exact_counts=None):
+    table_stats = {table['table']: table for table in stats['tables']}
+
+    print("📋 TABLES EXISTANTES:")
+    for table, info in sorted(catalog.tables.items()):
         print(f"\n🔹 {table}")
-        
-        # Colonnes de chaque table
-        c.execute("""
-            SELECT column_name, data_type, column_default, is_nullable
-            FROM information_schema.columns
-            WHERE table_name = %s AND table_schema = 'public'
-            ORDER BY ordinal_position
-        """, (table,))
-        
-        for col in c.fetchall():
-            nullable = "NULL" if col['is_nullable'] == 'YES' else "NOT NULL"
-            default = f" DEFAULT {col['column_default']}" if col['column_default'] else ""
-            print(f"  - {col['column_name']}: {col['data_type']} {nullable}{default}")
-        
-        # Compter les enregistrements
-        c.execute(f'SELECT COUNT(*) as count FROM "{table}"')
-        count = c.fetchone()['count']
-        print(f"  📊 {count} enregistrements")
-
-conn.close()
+
+        for col in info.columns.values():
+            nullable = "NOT NULL" if col.not_null else "NULL"
+            default = f" DEFAULT {col.default}" if col.default else ""
+            print(f"  - {col.name}: {col.type} {nullable}{default}")
+
+        if exact_counts is not None:
+            print(f"  📊 {exact_counts[table]} enregistrements")
+        current = table_stats.get(table)
+        if current is None:
+            continue
+        estimate = current['estimated_rows']
+        if estimate is not None:
+            print(f"  📈 ~{estimate} enregistrements (estimation)")
+        else:
+            print("  📈 estimation indisponible (table jamais analysée)")
+        print(
+            f"  💾 {_mb(current['total_bytes'])} "
+            f"(table {_mb(current['table_bytes'])}, index {_mb(current['index_bytes'])}, "
+            f"TOAST {_mb(current['toast_bytes'])})"
+        )
+        print(
+            f"  🧹 {current['dead_ratio']:.1%} de lignes mortes, "
+            f"vacuum : {_last(current['last_vacuum'], current['last_autovacuum'])}, "
+            f"analyze : {_last(current['last_analyze'], current['last_autoanalyze'])}"
+        )
+
+    if stats['unused_indexes']:
+        print("\n⚠️ INDEX JAMAIS UTILISÉS:")
+        for index in stats['unused_indexes']:
+            print(f"  - {index['index']} sur {index['table']} ({_mb(index['bytes'])})")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--exact", action="store_true", help="compte exact des lignes (SELECT COUNT(*), lent)")
+    parser.add_argument("--json", action="store_true", help="affiche les statistiques en JSON")
+    parser.add_argument("--schema", default="public", help="schéma analysé (défaut : public)")
+    args = parser.parse_args()
+
+    configure_logging()
+    conn = connect(os.getenv('DATABASE_URL'))
+    try:
+        with conn.cursor() as c:
+            stats = collect_stats(c, args.schema)
+            if args.json:
+                if args.exact:
+                    counts = count_rows(c, [table['table'] for table in stats['tables']], args.schema)
+                    for table in stats['tables']:
+                        table['exact_rows'] = counts[table['table']]
+                print(json.dumps(stats, indent=2, default=_json_default))
+            else:
+                # Toutes les tables et leurs colonnes, depuis le catalogue partagé
+                catalog = get_catalog(c, args.schema)
+                counts = count_rows(c, sorted(catalog.tables), args.schema) if args.exact else None
+                print_report(catalog, stats, counts)
+    finally:
+        conn.close()
+        log_summary()
+
+
+if __name__ == "__main__":
+    main()
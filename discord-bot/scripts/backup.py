@@ -6,60 +6,598 @@ Compatible avec Koyeb et environnements en lecture seule
 """
 
 import os
+import sys
 import json
 import logging
 import asyncio
+import contextlib
 import gzip
+import hashlib
+import io
+import time
+import queue
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
 import glob
+from decimal import Decimal
 from urllib.parse import urlparse
-import psycopg2
-from psycopg2.extras import RealDictCursor
+
+import psycopg2.extensions
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backup_archive  # noqa: E402
+from backup_archive import FORMAT_ARCHIVE, ArchiveWriter  # noqa: E402
+from backup_storage import S3Storage  # noqa: E402
+from db_tracing import connect  # noqa: E402
+from schema_catalog import get_catalog  # noqa: E402
 
 logger = logging.getLogger(__name__)
 
+FORMAT_NDJSON = "ndjson-v1"
+FORMAT_COPY = "copy-v1"
+MANIFEST_NAME = "manifest.json"
+BACKUP_MODE = os.getenv("BACKUP_FORMAT", "copy")
+COPY_COMPRESSLEVEL = int(os.getenv("BACKUP_COMPRESSLEVEL", "6"))
+COPY_BUFFER_SIZE = 1 << 16
+BACKUP_WORKERS = int(os.getenv("BACKUP_WORKERS", str(min(4, os.cpu_count() or 1))))
+RESTORE_WORKERS = int(os.getenv("RESTORE_WORKERS", str(BACKUP_WORKERS)))
+BACKUP_FULL_EVERY = int(os.getenv("BACKUP_FULL_EVERY", "8"))
+# Session basse priorité et débit maximal des backups (0 = illimité).
+# Le débit est freiné dans le rappel d'écriture de COPY, donc pendant la
+# requête : une table de plusieurs Gio à 16 Mio/s (partagés entre les
+# workers) dépasserait n'importe quel statement_timeout fixe.  Avec un débit
+# maximal, les sessions de backup n'ont que lock_timeout ;
+# BACKUP_STATEMENT_TIMEOUT ne s'applique qu'aux backups non freinés.
+BACKUP_STATEMENT_TIMEOUT = os.getenv("BACKUP_STATEMENT_TIMEOUT", "15min")
+BACKUP_LOCK_TIMEOUT = os.getenv("BACKUP_LOCK_TIMEOUT", "5s")
+BACKUP_MAX_ROWS_PER_SEC = float(os.getenv("BACKUP_MAX_ROWS_PER_SEC", "50000"))
+BACKUP_MAX_BYTES_PER_SEC = float(os.getenv("BACKUP_MAX_BYTES_PER_SEC", str(16 * 2**20)))
+BACKUP_ITERSIZE = int(os.getenv("BACKUP_ITERSIZE", "2000"))
+RESTORE_BATCH_SIZE = int(os.getenv("RESTORE_BATCH_SIZE", "1000"))
+# Rétention grand-père/père/fils : backups gardés par heure, jour et semaine
+BACKUP_KEEP_HOURLY = int(os.getenv("BACKUP_KEEP_HOURLY", "4"))
+BACKUP_KEEP_DAILY = int(os.getenv("BACKUP_KEEP_DAILY", "7"))
+BACKUP_KEEP_WEEKLY = int(os.getenv("BACKUP_KEEP_WEEKLY", "4"))
+BACKUP_DISK_BUDGET_MB = float(os.getenv("BACKUP_DISK_BUDGET_MB", "1024"))
+INDEX_NAME = "backups.json"
+# Empreinte SQL de chaque table (COUNT + somme de md5) stockée dans le backup.
+# Optionnelle : elle relit chaque table en entier une seconde fois.
+BACKUP_SQL_HASH = os.getenv("BACKUP_SQL_HASH", "0") == "1"
+
+
+def _json_default(obj):
+    """Convertit les types PostgreSQL non JSON (dates, numeric, bytea)."""
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, memoryview):
+        return '\\x' + obj.tobytes().hex()
+    raise TypeError(f'Object of type {type(obj)} is not JSON serializable')
+
+
+def _import_snapshot(conn, snapshot_id):
+    """Place la transaction de ``conn`` sur un instantané exporté."""
+    with conn.cursor() as c:
+        c.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+
+
+class Throttle:
+    """Limite un débit (unités par seconde) partagé entre threads ; 0 = illimité."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self, amount):
+        if self.rate <= 0 or amount <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + amount / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class _ThrottledWriter:
+    """Fichier binaire qui compte et limite les octets et lignes reçus de ``COPY``.
+
+    ``digest`` (``hashlib``) reçoit aussi les données, avant compression.
+    """
+
+    def __init__(self, raw, manager, digest=None):
+        self.raw = raw
+        self.manager = manager
+        self.digest = digest
+
+    def write(self, data):
+        self.manager._account(data.count(b"\n"), len(data))
+        if self.digest is not None:
+            self.digest.update(data)
+        return self.raw.write(data)
+
+
+class _CsvRecordCounter:
+    """Compte les enregistrements d'un flux CSV lu par morceaux, en mémoire constante.
+
+    Un saut de ligne termine un enregistrement s'il est hors guillemets ;
+    les guillemets doublés (``""``) basculent deux fois et s'annulent.
+    """
+
+    def __init__(self):
+        self.records = 0
+        self._quoted = False
+
+    def feed(self, data):
+        for i, part in enumerate(data.split(b'"')):
+            if i:
+                self._quoted = not self._quoted
+            if not self._quoted:
+                self.records += part.count(b"\n")
+
+
+_CSV_DELIMITERS = re.compile(rb'["\n]')
+
+
+class _BlockSplitter:
+    """Découpe le flux CSV d'un ``COPY`` en blocs d'archive de ``BLOCK_ROWS`` lignes.
+
+    Les fins d'enregistrement sont repérées hors guillemets, comme dans
+    :class:`_CsvRecordCounter`.  Les bornes de clé d'un bloc sont le minimum
+    et le maximum calculés sur ses lignes (ordre Python) : elles restent
+    exactes quel que soit le collationnement du tri côté serveur.
+    """
+
+    def __init__(self, manager, writer, table, positions, key_types):
+        self.manager = manager
+        self.writer = writer
+        self.table = table
+        self.positions = positions
+        self.key_types = key_types
+        self.count = 0
+        self._buffer = bytearray()
+        self._rows = 0
+        self._quoted = False
+
+    def write(self, data):
+        self.manager._account(data.count(b"\n"), len(data))
+        offset = len(self._buffer)
+        self._buffer += data
+        for match in _CSV_DELIMITERS.finditer(data):
+            if match.group() == b'"':
+                self._quoted = not self._quoted
+            elif not self._quoted:
+                self._rows += 1
+                if self._rows == backup_archive.BLOCK_ROWS:
+                    end = offset + match.end()
+                    self._emit(end)
+                    offset -= end
+        return len(data)
+
+    def _emit(self, end):
+        data = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        low = high = None
+        if self.positions:
+            for fields, _raw in backup_archive.iter_records(data):
+                key = backup_archive.parse_key(
+                    [fields[i] for i in self.positions], self.key_types
+                )
+                if low is None or key < low:
+                    low = key
+                if high is None or key > high:
+                    high = key
+        self.writer.write_block(self.table, data, self._rows, low, high)
+        self.count += self._rows
+        self._rows = 0
+
+    def close(self):
+        """Écrit le dernier bloc, incomplet."""
+        if self._rows:
+            self._emit(len(self._buffer))
+
+
+class _HashingReader:
+    """Fichier binaire en lecture qui calcule le ``sha256`` des données lues."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.digest.update(data)
+        return data
+
+
+def _table_hashes(cursor, tables):
+    """Empreinte de chaque table, indépendante de l'ordre des lignes.
+
+    ``hash`` est la somme des 64 premiers bits du ``md5`` de chaque ligne :
+    calculée côté serveur, elle se compare entre un backup et la base sans
+    transférer les données.
+    """
+    hashes = {}
+    for table in tables:
+        cursor.execute(
+            sql.SQL(
+                "SELECT COUNT(*) AS rows, COALESCE(SUM("
+                "('x' || substr(md5(t::text), 1, 16))::bit(64)::bigint), 0)::text AS hash "
+                "FROM {} t"
+            ).format(sql.Identifier(table))
+        )
+        row = cursor.fetchone()
+        hashes[table] = {'rows': row['rows'], 'hash': row['hash']}
+    return hashes
+
+
+def _read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _reset_sequences(cursor, plan):
+    """Recale chaque séquence ``serial`` du plan sur le maximum de sa colonne."""
+    for table_name, column in plan.sequences:
+        cursor.execute(
+            sql.SQL(
+                "SELECT setval(pg_get_serial_sequence(quote_ident(%s), %s), "
+                "COALESCE(MAX({column}), 1), MAX({column}) IS NOT NULL) FROM {table}"
+            ).format(column=sql.Identifier(column), table=sql.Identifier(table_name)),
+            (table_name, column),
+        )
+
+
+def _delete_missing(cursor, table_name, keys, source):
+    """Supprime de ``table_name`` les lignes dont la clé est absente de ``source``."""
+    keys = [sql.Identifier(key) for key in keys]
+    cursor.execute(
+        sql.SQL(
+            "DELETE FROM {table} t WHERE NOT EXISTS ("
+            "SELECT 1 FROM {source} k WHERE ({k_keys}) = ({t_keys}))"
+        ).format(
+            table=sql.Identifier(table_name),
+            source=sql.Identifier(source),
+            k_keys=sql.SQL(', ').join(sql.SQL("k.{}").format(key) for key in keys),
+            t_keys=sql.SQL(', ').join(sql.SQL("t.{}").format(key) for key in keys),
+        )
+    )
+
+
+def _upsert_from_temp(cursor, table_name, columns, keys):
+    """Insère ou met à jour ``table_name`` depuis ``_restore_delta``, puis la supprime."""
+    updates = [col for col in columns if col not in keys]
+    column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+    on_conflict = sql.SQL("DO NOTHING")
+    if updates:
+        on_conflict = sql.SQL("DO UPDATE SET {}").format(
+            sql.SQL(', ').join(
+                sql.SQL("{col} = EXCLUDED.{col}").format(col=sql.Identifier(col))
+                for col in updates
+            )
+        )
+    cursor.execute(
+        sql.SQL(
+            "INSERT INTO {table} ({columns}) SELECT {columns} FROM _restore_delta "
+            "ON CONFLICT ({keys}) {on_conflict}"
+        ).format(
+            table=sql.Identifier(table_name),
+            columns=column_list,
+            keys=sql.SQL(', ').join(map(sql.Identifier, keys)),
+            on_conflict=on_conflict,
+        )
+    )
+    cursor.execute("DROP TABLE _restore_delta")
+
+
+def _scan_csv(path):
+    """Relit un ``.csv.gz`` en flux ; retourne ``(enregistrements, sha256)``."""
+    digest = hashlib.sha256()
+    counter = _CsvRecordCounter()
+    with gzip.open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b""):
+            digest.update(chunk)
+            counter.feed(chunk)
+    return counter.records, digest.hexdigest()
+
+
+def _backup_date(filename, path=None):
+    """Date d'un backup d'après son nom (``..._<AAAA-MM-JJ_HH-MM-SS>...``).
+
+    À défaut, mtime de ``path`` ; ``None`` sans ``path``.
+    """
+    stamp = filename.split("_backup_", 1)[-1][:19]
+    try:
+        return datetime.strptime(stamp, "%Y-%m-%d_%H-%M-%S")
+    except ValueError:
+        return datetime.fromtimestamp(os.path.getmtime(path)) if path else None
+
+
+def plan_retention(
+    entries,
+    hourly=BACKUP_KEEP_HOURLY,
+    daily=BACKUP_KEEP_DAILY,
+    weekly=BACKUP_KEEP_WEEKLY,
+    budget_bytes=BACKUP_DISK_BUDGET_MB * 2**20,
+):
+    """Choisit les backups à garder parmi les entrées de l'index.
+
+    Le plus récent backup de chacune des ``hourly`` dernières heures,
+    ``daily`` derniers jours et ``weekly`` dernières semaines est gardé,
+    avec toute sa chaîne s'il est incrémental.  Si le total dépasse
+    ``budget_bytes`` (0 = illimité), les plus anciens backups dont aucun
+    autre ne dépend sont retirés ; le plus récent est toujours gardé.
+
+    Retourne ``(gardés, supprimés)`` : ``{nom: tier}`` et liste de noms.
+    """
+    ordered = sorted(entries, key=lambda entry: entry['date'], reverse=True)
+    if not ordered:
+        return {}, []
+    by_name = {entry['filename']: entry for entry in ordered}
+    keep = {}
+    for tier, count, bucket_format in (
+        ("hourly", hourly, "%Y-%m-%d %H"),
+        ("daily", daily, "%Y-%m-%d"),
+        ("weekly", weekly, "%G-%V"),
+    ):
+        buckets = set()
+        for entry in ordered:
+            bucket = datetime.fromisoformat(entry['date']).strftime(bucket_format)
+            if bucket in buckets:
+                continue
+            if len(buckets) >= count:
+                break
+            buckets.add(bucket)
+            keep[entry['filename']] = tier
+    latest = ordered[0]['filename']
+    keep.setdefault(latest, "hourly")
+    
+    def needed_by_others(name):
+        return any(name in by_name[other].get('chain', ())[:-1] for other in keep if other != name)
+    
+    for name in list(keep):
+        for link in by_name[name].get('chain', ())[:-1]:
+            if link in by_name:
+                keep.setdefault(link, "chain")
+    
+    if budget_bytes:
+        total = sum(by_name[name]['size'] for name in keep)
+        removed = True
+        while total > budget_bytes and removed:
+            removed = False
+            for entry in reversed(ordered):
+                name = entry['filename']
+                if name not in keep or name == latest or needed_by_others(name):
+                    continue
+                del keep[name]
+                total -= entry['size']
+                removed = True
+                break
+    return keep, [entry['filename'] for entry in ordered if entry['filename'] not in keep]
+
+
+def _path_size(path):
+    """Taille en octets d'un fichier ou d'un répertoire de backup."""
+    if os.path.isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    return os.path.getsize(path)
+
+
+def _dumps(value):
+    return json.dumps(value, default=_json_default, separators=(',', ':'), ensure_ascii=False)
+
+@dataclass
+class RestorePlan:
+    """Ordre de chargement et objets à reconstruire pour une restauration."""
+
+    tables: list
+    levels: list = field(default_factory=list)
+    foreign_keys: list = field(default_factory=list)  # (table, Constraint)
+    indexes: list = field(default_factory=list)  # (table, Index)
+    sequences: list = field(default_factory=list)  # (table, colonne)
+
+
+def build_restore_plan(catalog, tables):
+    """Construit le :class:`RestorePlan` de ``tables`` à partir du catalogue.
+
+    Les tables sont regroupées en niveaux : une table ne dépend (clé
+    étrangère) que de tables des niveaux précédents ; les tables d'un même
+    niveau peuvent être chargées en parallèle.  Les cycles éventuels sont
+    placés dans un dernier niveau.
+    """
+    plan = RestorePlan(tables=[t for t in tables if catalog.table(t) is not None])
+    restored = set(plan.tables)
+    depends_on = {name: set() for name in plan.tables}
+    
+    for table in catalog.tables.values():
+        constraint_names = {constraint.name for constraint in table.constraints}
+        for constraint in table.constraints:
+            if constraint.type != 'f':
+                continue
+            # Les FK qui pointent vers une table restaurée empêcheraient le TRUNCATE.
+            if table.name in restored or constraint.referenced_table in restored:
+                plan.foreign_keys.append((table.name, constraint))
+            if (
+                table.name in restored
+                and constraint.referenced_table in restored
+                and constraint.referenced_table != table.name
+            ):
+                depends_on[table.name].add(constraint.referenced_table)
+        if table.name not in restored:
+            continue
+        for index in table.indexes:
+            if not index.primary and index.name not in constraint_names:
+                plan.indexes.append((table.name, index))
+        for column in table.columns.values():
+            if column.default and column.default.startswith("nextval("):
+                plan.sequences.append((table.name, column.name))
+    
+    remaining = dict(depends_on)
+    while remaining:
+        level = sorted(name for name, deps in remaining.items() if not deps & remaining.keys())
+        if not level:
+            level = sorted(remaining)
+        plan.levels.append(level)
+        for name in level:
+            del remaining[name]
+    return plan
+
+
 class PythonBackupManager:
     def __init__(self, database_url, backup_path="/tmp/backups"):
         self.database_url = database_url
         self.backup_path = backup_path
-        self.max_backups = 10
         self.backup_frequency_hours = 6
         self.backup_task = None
         self.is_running = False
+        # Un seul backup à la fois, hors de la boucle asyncio
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backup")
+        self._row_throttle = Throttle(BACKUP_MAX_ROWS_PER_SEC)
+        self._byte_throttle = Throttle(BACKUP_MAX_BYTES_PER_SEC)
+        self._metrics_lock = threading.Lock()
+        self.storage = S3Storage.from_env()
+        self.metrics = {
+            'state': 'idle',
+            'reason': None,
+            'started_at': None,
+            'tables_done': 0,
+            'tables_total': 0,
+            'rows': 0,
+            'bytes': 0,
+            'last_duration_s': None,
+            'last_success': None,
+            'last_size_kb': None,
+        }
         
         # Utiliser /tmp car c'est écrivable sur Koyeb
         os.makedirs(backup_path, exist_ok=True)
         
-        print(f"📁 Backup Python configuré: {backup_path}")
-        print(f"🕕 Fréquence: {self.backup_frequency_hours}h")
-        print(f"🗂️ Max fichiers: {self.max_backups}")
-        print("⚡ Mode: Python pur (compatible Koyeb)")
+        logger.info(f"📁 Backup Python configuré: {backup_path}")
+        logger.info(f"🕕 Fréquence: {self.backup_frequency_hours}h")
+        logger.info(
+            f"🗂️ Rétention: {BACKUP_KEEP_HOURLY} horaires, {BACKUP_KEEP_DAILY} quotidiens, "
+            f"{BACKUP_KEEP_WEEKLY} hebdomadaires, budget {BACKUP_DISK_BUDGET_MB:.0f} Mo"
+        )
+        logger.info("⚡ Mode: Python pur (compatible Koyeb)")
+        if self.storage is not None:
+            logger.info(f"☁️ Stockage S3: {self.storage.bucket}/{self.storage.prefix}")
     
-    def get_connection(self):
-        """Obtient une connexion à la base"""
+    def get_connection(self, low_priority=False):
+        """Obtient une connexion à la base.
+
+        ``low_priority`` ouvre une session de backup : ``lock_timeout`` borné
+        pour ne jamais bloquer le trafic du bot, et ``statement_timeout``
+        seulement si le débit n'est pas limité (le freinage allonge les
+        ``COPY`` d'une durée qu'aucun délai fixe ne peut prévoir).
+        """
         try:
-            return psycopg2.connect(self.database_url, cursor_factory=RealDictCursor)
+            if low_priority:
+                throttled = self._row_throttle.rate > 0 or self._byte_throttle.rate > 0
+                statement_timeout = 0 if throttled else BACKUP_STATEMENT_TIMEOUT
+                return connect(
+                    self.database_url,
+                    application_name="prissleague-backup",
+                    options=(
+                        f"-c statement_timeout={statement_timeout} "
+                        f"-c lock_timeout={BACKUP_LOCK_TIMEOUT}"
+                    ),
+                )
+            return connect(self.database_url)
         except Exception as e:
             logger.error(f"Erreur connexion backup: {e}")
             return None
     
-    def create_backup(self, reason="scheduled"):
-        """Crée un backup complet de TOUTE la base Supabase"""
+    def _account(self, rows, size):
+        """Met à jour les métriques du backup en cours et applique le débit maximal."""
+        with self._metrics_lock:
+            self.metrics['rows'] += rows
+            self.metrics['bytes'] += size
+        self._row_throttle.wait(rows)
+        self._byte_throttle.wait(size)
+    
+    async def create_backup_async(self, reason="scheduled", **kwargs):
+        """Lance ``create_backup`` dans un thread dédié sans bloquer la boucle asyncio."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, lambda: self.create_backup(reason, **kwargs)
+        )
+    
+    def create_backup(self, reason="scheduled", fmt=None, incremental=None):
+        """Crée un backup complet de TOUTE la base Supabase.
+
+        ``fmt`` vaut ``"copy"`` (défaut, voir ``BACKUP_MODE``), ``"archive"``
+        ou ``"ndjson"``.  Avec un bucket S3 configuré (``self.storage``), le
+        backup est envoyé en flux vers le bucket sans fichier local ; le
+        format ``copy`` y est remplacé par ``archive``.
+
+        Format ``copy`` : un répertoire ``supabase_backup_<date>.copy`` contenant
+        un ``<table>.csv.gz`` par table produit par ``COPY ... TO STDOUT`` et un
+        ``manifest.json``.  S'il existe un backup ``copy`` précédent et que sa
+        chaîne compte moins de ``BACKUP_FULL_EVERY`` éléments, le backup est
+        incrémental (``supabase_backup_<date>.delta.copy``) : seules les lignes
+        modifiées depuis le précédent sont copiées, plus la liste des clés
+        primaires pour rejouer les suppressions.  ``incremental=False`` force
+        un backup complet, ``True`` un incrémental si possible.
+
+        Format ``archive`` : un fichier ``supabase_backup_<date>.pba`` de blocs
+        compressés indépendamment et indexés par table et plage de clé
+        primaire (voir ``backup_archive``), pour extraire ou restaurer une
+        table ou un joueur sans lire toute l'archive.
+
+        Format ``ndjson`` : un NDJSON compressé écrit au fil de l'eau : une
+        ligne d'en-tête par table (``{"table": ..., "columns": [...]}``), puis
+        une ligne par enregistrement (liste des valeurs), et enfin une ligne
+        ``{"_metadata": {...}}``.  Les lignes sont lues par un curseur serveur
+        nommé, la mémoire reste donc constante quelle que soit la taille des
+        tables.
+        """
+        fmt = fmt or BACKUP_MODE
+        if self.storage is not None and fmt == "copy":
+            # Un répertoire par backup ne se prête pas à l'envoi en flux vers S3
+            logger.info("ℹ️ Stockage S3 : format copy remplacé par archive")
+            fmt = "archive"
+        started = time.perf_counter()
         try:
+            parent = None
+            if fmt == "copy" and incremental is not False:
+                parent = self._incremental_parent(force=bool(incremental))
             timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            filename = f"supabase_backup_{timestamp}.json.gz"
+            extension = ".ndjson.gz"
+            if fmt == "copy":
+                extension = ".delta.copy" if parent else ".copy"
+            elif fmt == "archive":
+                extension = ".pba"
+            filename = f"supabase_backup_{timestamp}{extension}"
             filepath = os.path.join(self.backup_path, filename)
             
-            print(f"🔄 Création backup complet Supabase ({reason})...")
+            logger.info(f"🔄 Création backup complet Supabase ({reason}, {fmt})...")
+            with self._metrics_lock:
+                self.metrics.update(
+                    state='running', reason=reason, started_at=datetime.now().isoformat(),
+                    tables_done=0, tables_total=0, rows=0, bytes=0,
+                )
             
-            conn = self.get_connection()
+            conn = self.get_connection(low_priority=True)
             if not conn:
-                print("❌ Impossible de se connecter à la base")
+                logger.error("❌ Impossible de se connecter à la base")
                 return False
             
-            backup_data = {}
-            
             try:
+                # Un seul instantané cohérent pour toutes les tables
+                conn.set_session(
+                    isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ,
+                    readonly=True,
+                )
                 with conn.cursor() as c:
                     # Récupérer la liste de TOUTES les tables utilisateur
                     c.execute("""
@@ -71,48 +609,44 @@ class PythonBackupManager:
                     """)
                     
                     tables = [row['table_name'] for row in c.fetchall()]
-                    print(f"📋 Tables détectées: {', '.join(tables)}")
-                    
-                    total_records = 0
-                    
-                    # Backup de chaque table
-                    for table in tables:
-                        try:
-                            c.execute(f'SELECT * FROM "{table}" ORDER BY 1')
-                            rows = c.fetchall()
-                            backup_data[table] = [dict(row) for row in rows]
-                            table_count = len(backup_data[table])
-                            total_records += table_count
-                            print(f"  ✅ {table}: {table_count} enregistrements")
-                        except Exception as table_error:
-                            print(f"  ⚠️ Erreur table {table}: {table_error}")
-                            backup_data[table] = []
+                logger.info(f"📋 Tables détectées: {', '.join(tables)}")
+                self.metrics['tables_total'] = len(tables)
                 
-                # Ajouter métadonnées
-                backup_data['_metadata'] = {
+                metadata = {
                     'backup_date': timestamp,
                     'backup_reason': reason,
                     'database_type': 'supabase_complete',
-                    'tables_backed_up': len(tables),
-                    'total_records': total_records,
-                    'tables_list': tables
+                    'format': {"copy": FORMAT_COPY, "archive": FORMAT_ARCHIVE}.get(fmt, FORMAT_NDJSON),
+                    'tables_list': tables,
                 }
+                hashes = self._snapshot_hashes(conn, tables) if BACKUP_SQL_HASH else None
+                if hashes is not None:
+                    metadata['table_hashes'] = hashes
+                if fmt == "copy":
+                    deltas = self._prepare_chain(conn, filename, tables, metadata, parent)
+                    table_counts = self._write_copy_backup(
+                        conn, filepath, tables, metadata, deltas
+                    )
+                    file_size = _path_size(filepath) / 1024  # KB
+                elif fmt == "archive":
+                    table_counts = self._write_archive_backup(conn, filename, tables, metadata)
+                    file_size = self._backup_size(filename) / 1024  # KB
+                else:
+                    table_counts = self._write_ndjson_backup(conn, filename, tables, metadata)
+                    file_size = self._backup_size(filename) / 1024  # KB
+                total_records = sum(table_counts.values())
                 
-                # Convertir les datetime en string pour JSON
-                def datetime_handler(obj):
-                    if hasattr(obj, 'isoformat'):
-                        return obj.isoformat()
-                    raise TypeError(f'Object of type {type(obj)} is not JSON serializable')
-                
-                # Écrire en JSON compressé
-                with gzip.open(filepath, 'wt', encoding='utf-8') as f:
-                    json.dump(backup_data, f, default=datetime_handler, indent=2, ensure_ascii=False)
-                
-                file_size = os.path.getsize(filepath) / 1024  # KB
-                
-                print(f"✅ Backup Supabase créé: {filename}")
-                print(f"📊 {len(tables)} tables, {total_records} enregistrements")
-                print(f"💾 Taille: {file_size:.1f} KB")
+                logger.info(
+                    f"✅ Backup Supabase créé: {filename}",
+                    extra={
+                        "event": "backup_created",
+                        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                    },
+                )
+                logger.info(f"📊 {len(tables)} tables, {total_records} enregistrements")
+                logger.info(f"💾 Taille: {file_size:.1f} KB")
+                self._finish_metrics(started, True, file_size)
+                self._register_backup(filename, timestamp, metadata, file_size * 1024)
                 
                 # Nettoyer les anciens backups
                 self.cleanup_old_backups()
@@ -122,127 +656,1257 @@ class PythonBackupManager:
                 conn.close()
                 
         except Exception as e:
-            print(f"❌ Erreur backup: {e}")
+            logger.error(f"❌ Erreur backup: {e}")
+            self._finish_metrics(started, False)
             return False
     
+    def _snapshot_hashes(self, conn, tables):
+        """Empreintes SQL des tables dans l'instantané du backup, ou ``None``.
+
+        Chaque table relue compte dans ``BACKUP_MAX_ROWS_PER_SEC``.  Un échec
+        est annulé par savepoint : l'instantané du backup est conservé.
+        """
+        hashes = {}
+        with conn.cursor() as c:
+            c.execute("SAVEPOINT table_hashes")
+            try:
+                for table in tables:
+                    hashes.update(_table_hashes(c, [table]))
+                    self._row_throttle.wait(hashes[table]['rows'])
+            except psycopg2.Error as hash_error:
+                logger.warning(f"⚠️ Empreintes SQL non calculées: {hash_error}")
+                c.execute("ROLLBACK TO SAVEPOINT table_hashes")
+                return None
+            c.execute("RELEASE SAVEPOINT table_hashes")
+        return hashes
+    
+    def _finish_metrics(self, started, success, size_kb=None):
+        with self._metrics_lock:
+            self.metrics.update(
+                state='idle',
+                last_duration_s=round(time.perf_counter() - started, 1),
+                last_success=success,
+                last_size_kb=round(size_kb, 1) if size_kb is not None else None,
+            )
+    
+    def _table_done(self, table):
+        with self._metrics_lock:
+            self.metrics['tables_done'] += 1
+            done, total = self.metrics['tables_done'], self.metrics['tables_total']
+            rows = self.metrics['rows']
+        logger.debug(
+            f"Backup {done}/{total} tables ({table}), {rows} lignes",
+            extra={"event": "backup_progress"},
+        )
+    
+    def _finish_metadata(self, metadata, table_counts, checksums):
+        """Complète ``metadata`` : lignes et ``sha256`` des données écrites par table."""
+        metadata['tables_backed_up'] = len(table_counts)
+        metadata['total_records'] = sum(table_counts.values())
+        metadata['table_counts'] = table_counts
+        metadata['checksums'] = checksums
+        return metadata
+    
+    @contextlib.contextmanager
+    def _open_output(self, filename):
+        """Fichier de backup en écriture : local, ou upload multipart vers S3.
+
+        En cas d'erreur, le fichier partiel est supprimé (l'upload annulé).
+        """
+        if self.storage is not None:
+            upload = self.storage.open_write(filename)
+            try:
+                yield upload
+                upload.close()
+            except BaseException:
+                upload.abort()
+                raise
+            return
+        path = os.path.join(self.backup_path, filename)
+        try:
+            with open(path, 'wb') as f:
+                yield f
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+    
+    def _is_remote(self, backup_file):
+        """Vrai si ``backup_file`` n'existe que dans le bucket S3."""
+        return (
+            self.storage is not None
+            and not os.path.exists(os.path.join(self.backup_path, backup_file))
+        )
+    
+    def _open_backup(self, backup_file, seekable=False):
+        """Ouvre un backup en lecture binaire, localement ou en flux depuis S3.
+
+        ``seekable`` lit l'objet par plages d'octets (archives ``.pba``).
+        """
+        if not self._is_remote(backup_file):
+            return open(os.path.join(self.backup_path, backup_file), 'rb')
+        if seekable:
+            return self.storage.open_range(backup_file)
+        return contextlib.closing(self.storage.open_read(backup_file))
+    
+    def _backup_exists(self, backup_file):
+        if not self._is_remote(backup_file):
+            return os.path.exists(os.path.join(self.backup_path, backup_file))
+        return self.storage.exists(backup_file)
+    
+    def _backup_size(self, backup_file):
+        if self._is_remote(backup_file):
+            return self.storage.size(backup_file)
+        return _path_size(os.path.join(self.backup_path, backup_file))
+    
+    def _write_ndjson_backup(self, conn, filename, tables, metadata):
+        table_counts = {}
+        checksums = {}
+        with self._open_output(filename) as raw, gzip.open(raw, 'wt', encoding='utf-8') as f:
+            for table in tables:
+                try:
+                    table_counts[table], checksums[table] = self._write_table(conn, f, table)
+                    logger.info(f"  ✅ {table}: {table_counts[table]} enregistrements")
+                except Exception as table_error:
+                    logger.warning(f"  ⚠️ Erreur table {table}: {table_error}")
+                    conn.rollback()
+            
+            metadata = self._finish_metadata(metadata, table_counts, checksums)
+            f.write(_dumps({'_metadata': metadata}) + "\n")
+        return table_counts
+    
+    def _write_copy_backup(self, conn, directory, tables, metadata, deltas=None):
+        """Exporte chaque table avec ``COPY ... TO STDOUT`` dans ``<table>.csv.gz``.
+
+        Avec plusieurs workers (``BACKUP_WORKERS``), la transaction de ``conn``
+        exporte son instantané (``pg_export_snapshot``) ; chaque worker ouvre
+        sa propre connexion, importe cet instantané puis copie les tables,
+        les plus grosses d'abord.  Le backup reste cohérent à un instant donné.
+        """
+        os.makedirs(directory)
+        results = {}
+        workers = min(BACKUP_WORKERS, len(tables))
+        snapshot_id = self._export_snapshot(conn) if workers > 1 else None
+        
+        if snapshot_id:
+            pending = queue.Queue()
+            for table in self._tables_by_size(conn, tables):
+                pending.put(table)
+            logger.info(f"⚡ {workers} workers sur l'instantané {snapshot_id}")
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(
+                        self._copy_worker, snapshot_id, directory, pending, results, deltas
+                    )
+                    for _ in range(workers)
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            for table in tables:
+                try:
+                    results[table] = self._copy_table_out(
+                        conn, directory, table, (deltas or {}).get(table)
+                    )
+                except Exception as table_error:
+                    logger.warning(f"  ⚠️ Erreur table {table}: {table_error}")
+                    conn.rollback()
+        
+        table_counts = {table: results[table][1] for table in tables if table in results}
+        metadata = self._finish_metadata(
+            metadata, table_counts, {table: results[table][2] for table in table_counts}
+        )
+        metadata['columns'] = {table: results[table][0] for table in table_counts}
+        key_checksums = {table: results[table][3] for table in table_counts if results[table][3]}
+        if key_checksums:
+            metadata['key_checksums'] = key_checksums
+        metadata['snapshot'] = snapshot_id
+        metadata['workers'] = workers if snapshot_id else 1
+        with open(os.path.join(directory, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+        return table_counts
+    
+    def _export_snapshot(self, conn):
+        """Exporte l'instantané de la transaction en cours (``None`` si impossible)."""
+        try:
+            with conn.cursor() as c:
+                c.execute("SELECT pg_export_snapshot() AS snapshot_id")
+                return c.fetchone()['snapshot_id']
+        except Exception as e:
+            logger.warning(f"⚠️ Export d'instantané impossible, backup séquentiel: {e}")
+            conn.rollback()
+            return None
+    
+    def _tables_by_size(self, conn, tables):
+        with conn.cursor() as c:
+            c.execute(
+                """
+                SELECT c.relname
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'public' AND c.relname = ANY(%s)
+                ORDER BY pg_total_relation_size(c.oid) DESC
+                """,
+                (list(tables),),
+            )
+            return [row['relname'] for row in c.fetchall()]
+    
+    def _copy_worker(self, snapshot_id, directory, pending, results, deltas=None):
+        """Copie des tables de ``pending`` jusqu'à épuisement, sur ``snapshot_id``."""
+        conn = self.get_connection(low_priority=True)
+        if conn is None:
+            raise RuntimeError("connexion du worker de backup impossible")
+        try:
+            conn.set_session(
+                isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ,
+                readonly=True,
+            )
+            _import_snapshot(conn, snapshot_id)
+            while True:
+                try:
+                    table = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results[table] = self._copy_table_out(
+                        conn, directory, table, (deltas or {}).get(table)
+                    )
+                except Exception as table_error:
+                    logger.warning(f"  ⚠️ Erreur table {table}: {table_error}")
+                    conn.rollback()
+                    _import_snapshot(conn, snapshot_id)
+        finally:
+            conn.close()
+    
+    def _copy_table_out(self, conn, directory, table, delta=None):
+        """Copie ``table`` dans ``<table>.csv.gz``.
+
+        Retourne ``(colonnes, lignes, sha256, sha256_des_clés)``.  ``delta``
+        vaut ``(filtre, clés_primaires)`` pour un backup incrémental : seules
+        les lignes filtrées sont copiées, et toutes les valeurs de clé
+        primaire sont écrites dans ``<table>.keys.csv.gz``.
+        """
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as c:
+            c.execute(sql.SQL("SELECT * FROM {} LIMIT 0").format(sql.Identifier(table)))
+            columns = [col.name for col in c.description]
+            where = delta[0] if delta else sql.SQL("TRUE")
+            digest = hashlib.sha256()
+            key_digest = None
+            path = os.path.join(directory, f"{table}.csv.gz")
+            with gzip.open(path, 'wb', compresslevel=COPY_COMPRESSLEVEL) as f:
+                c.copy_expert(
+                    sql.SQL(
+                        "COPY (SELECT * FROM {} WHERE {} ORDER BY 1) TO STDOUT WITH (FORMAT csv)"
+                    ).format(sql.Identifier(table), where),
+                    _ThrottledWriter(f, self, digest),
+                    size=COPY_BUFFER_SIZE,
+                )
+            count = c.rowcount
+            if delta:
+                keys = sql.SQL(', ').join(map(sql.Identifier, delta[1]))
+                key_digest = hashlib.sha256()
+                path = os.path.join(directory, f"{table}.keys.csv.gz")
+                with gzip.open(path, 'wb', compresslevel=COPY_COMPRESSLEVEL) as f:
+                    c.copy_expert(
+                        sql.SQL("COPY (SELECT {} FROM {}) TO STDOUT WITH (FORMAT csv)").format(
+                            keys, sql.Identifier(table)
+                        ),
+                        _ThrottledWriter(f, self, key_digest),
+                        size=COPY_BUFFER_SIZE,
+                    )
+        logger.info(f"  ✅ {table}: {count} enregistrements{' modifiés' if delta else ''}")
+        self._table_done(table)
+        return columns, count, digest.hexdigest(), key_digest and key_digest.hexdigest()
+
+    def _write_archive_backup(self, conn, filename, tables, metadata):
+        """Écrit une archive ``.pba`` : blocs de ``BACKUP_BLOCK_ROWS`` lignes par table."""
+        with conn.cursor() as c:
+            # Le gestionnaire vit tout le processus : revérifier le schéma
+            # (dans l'instantané du backup) avant chaque backup
+            catalog = get_catalog(c, verify=True)
+        table_counts = {}
+        with self._open_output(filename) as raw:
+            writer = ArchiveWriter(raw, COPY_COMPRESSLEVEL)
+            for table in tables:
+                try:
+                    if catalog.table(table) is None:
+                        raise LookupError("absente du catalogue")
+                    table_counts[table] = self._archive_table(conn, writer, catalog.table(table))
+                    logger.info(f"  ✅ {table}: {table_counts[table]} enregistrements")
+                    self._table_done(table)
+                except Exception as table_error:
+                    logger.warning(f"  ⚠️ Erreur table {table}: {table_error}")
+                    writer.discard_table(table)
+                    conn.rollback()
+            checksums = {table: writer.tables[table]['sha256'] for table in table_counts}
+            writer.close(self._finish_metadata(metadata, table_counts, checksums))
+        return table_counts
+
+    def _archive_table(self, conn, writer, table):
+        """Copie ``table`` en un seul ``COPY`` découpé en blocs (voir :class:`_BlockSplitter`).
+
+        Les lignes sortent triées sur la clé primaire, ce qui suit son index ;
+        seul le bloc en cours est gardé en mémoire.
+        """
+        columns = list(table.columns)
+        keys = list(table.primary_key_columns)
+        key_types = [table.columns[key].type for key in keys]
+        writer.add_table(table.name, columns, keys, key_types)
+        query = sql.SQL("SELECT {} FROM {}").format(
+            sql.SQL(', ').join(map(sql.Identifier, columns)), sql.Identifier(table.name)
+        )
+        if keys:
+            query = sql.SQL("{} ORDER BY {}").format(
+                query, sql.SQL(', ').join(map(sql.Identifier, keys))
+            )
+        splitter = _BlockSplitter(
+            self, writer, table.name, [columns.index(key) for key in keys], key_types
+        )
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as c:
+            c.copy_expert(
+                sql.SQL("COPY ({}) TO STDOUT WITH (FORMAT csv)").format(query),
+                splitter,
+                size=COPY_BUFFER_SIZE,
+            )
+        splitter.close()
+        return splitter.count
+
+    def _incremental_parent(self, force=False):
+        """Dernier backup ``copy`` sur lequel chaîner un incrémental, ou ``None``.
+
+        Le candidat et sa chaîne sont cherchés dans l'index ; seul le
+        manifest du candidat est lu (pour son ``snapshot_xmin``).
+        """
+        entries = [
+            entry for entry in self._load_index()
+            if entry.get('format') == FORMAT_COPY and entry.get('location', 'local') == 'local'
+        ]
+        if not entries:
+            return None
+        latest = max(entries, key=lambda entry: entry['date'])
+        name = latest['filename']
+        try:
+            manifest = _read_manifest(os.path.join(self.backup_path, name))
+        except (OSError, ValueError):
+            return None
+        if 'snapshot_xmin' not in manifest:
+            return None
+        chain = manifest.get('chain', [name])
+        known = {entry['filename'] for entry in entries}
+        if any(link not in known for link in chain):
+            logger.warning("⚠️ Chaîne de backups incomplète, backup complet")
+            return None
+        if not force and len(chain) >= BACKUP_FULL_EVERY:
+            return None
+        return name, manifest
+    
+    def _prepare_chain(self, conn, filename, tables, metadata, parent):
+        """Complète ``metadata`` (chaîne, instantané) et retourne les filtres incrémentaux."""
+        with conn.cursor() as c:
+            c.execute(
+                "SELECT NOW() AS db_time, "
+                "txid_snapshot_xmin(txid_current_snapshot()) AS snapshot_xmin"
+            )
+            row = c.fetchone()
+            catalog = get_catalog(c, verify=True)
+        metadata['db_time'] = row['db_time'].isoformat()
+        metadata['snapshot_xmin'] = row['snapshot_xmin']
+        metadata['primary_keys'] = {
+            table: list(catalog.table(table).primary_key_columns)
+            for table in tables
+            if catalog.table(table) is not None
+        }
+        
+        if parent is None:
+            metadata['kind'] = 'base'
+            metadata['chain'] = [filename]
+            metadata['modes'] = {table: 'full' for table in tables}
+            return {}
+        
+        parent_name, parent_manifest = parent
+        metadata['kind'] = 'incremental'
+        metadata['parent'] = parent_name
+        metadata['chain'] = parent_manifest.get('chain', [parent_name]) + [filename]
+        deltas = {}
+        for table in tables:
+            keys = metadata['primary_keys'].get(table)
+            if not keys:
+                continue
+            # xmin : transaction ayant écrit la version courante de la ligne.
+            # Tout ce qui est au moins aussi récent que le xmin de l'instantané
+            # précédent a pu lui échapper ; un updated_at ne suffirait pas (une
+            # transaction commencée avant le backup peut valider après).
+            where = sql.SQL("age(xmin) <= age({}::text::xid)").format(
+                sql.Literal(str(parent_manifest['snapshot_xmin'] % 2**32))
+            )
+            deltas[table] = (where, keys)
+        metadata['modes'] = {table: 'delta' if table in deltas else 'full' for table in tables}
+        logger.info(f"🧩 Backup incrémental sur {parent_name} ({len(deltas)} tables en delta)")
+        return deltas
+    
+    def _write_table(self, conn, f, table):
+        """Écrit l'en-tête puis les lignes de ``table`` dans ``f``.
+
+        Retourne ``(lignes, sha256)`` ; l'empreinte couvre les lignes de
+        données telles qu'écrites (UTF-8), pas l'en-tête.
+        """
+        count = 0
+        digest = hashlib.sha256()
+        header_written = False
+        with conn.cursor(
+            name=f"backup_{table}", cursor_factory=psycopg2.extensions.cursor
+        ) as c:
+            c.itersize = BACKUP_ITERSIZE
+            c.execute(sql.SQL("SELECT * FROM {} ORDER BY 1").format(sql.Identifier(table)))
+            while True:
+                rows = c.fetchmany(BACKUP_ITERSIZE)
+                if not header_written:
+                    columns = [col.name for col in c.description]
+                    f.write(_dumps({'table': table, 'columns': columns}) + "\n")
+                    header_written = True
+                if not rows:
+                    break
+                chunk = "".join(_dumps(row) + "\n" for row in rows)
+                f.write(chunk)
+                digest.update(chunk.encode('utf-8'))
+                count += len(rows)
+                self._account(len(rows), len(chunk))
+        self._table_done(table)
+        return count, digest.hexdigest()
+    
+    def _iter_backup(self, backup_file):
+        """Parcourt un backup et produit ``(table, columns, lot_de_lignes)``.
+
+        Lit le format NDJSON en flux ; les anciens backups JSON (un seul
+        document) sont chargés en entier.
+        """
+        if backup_file.endswith(".json.gz"):
+            with self._open_backup(backup_file) as raw, gzip.open(raw, 'rt', encoding='utf-8') as f:
+                backup_data = json.load(f)
+            for table, rows in backup_data.items():
+                if table == '_metadata':
+                    continue
+                columns = list(rows[0].keys()) if rows else []
+                yield table, columns, [[row[col] for col in columns] for row in rows]
+            return
+        
+        table = None
+        columns = []
+        batch = []
+        with self._open_backup(backup_file) as raw, gzip.open(raw, 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if isinstance(record, list):
+                    batch.append(record)
+                    if len(batch) >= RESTORE_BATCH_SIZE:
+                        yield table, columns, batch
+                        batch = []
+                    continue
+                if table is not None:
+                    yield table, columns, batch
+                    batch = []
+                if '_metadata' in record:
+                    table = None
+                    continue
+                table, columns = record['table'], record['columns']
+        if table is not None:
+            yield table, columns, batch
+    
     def restore_from_backup(self, backup_file):
         """Restore depuis un backup complet (ATTENTION: écrase TOUTES les données!)"""
         try:
             filepath = os.path.join(self.backup_path, backup_file)
             
-            if not os.path.exists(filepath):
-                print(f"❌ Fichier {backup_file} introuvable")
+            if not self._backup_exists(backup_file):
+                logger.error(f"❌ Fichier {backup_file} introuvable")
                 return False
             
-            print(f"🔄 Restoration complète depuis {backup_file}...")
-            print("⚠️  ATTENTION: Cela va ÉCRASER TOUTES les données de TOUTE la base!")
-            
-            # Lire les données
-            with gzip.open(filepath, 'rt', encoding='utf-8') as f:
-                backup_data = json.load(f)
-            
-            metadata = backup_data.get('_metadata', {})
-            tables_to_restore = [k for k in backup_data.keys() if k != '_metadata']
-            
-            print(f"📋 Tables à restaurer: {', '.join(tables_to_restore)}")
+            logger.info(f"🔄 Restoration complète depuis {backup_file}...")
+            logger.warning("⚠️  ATTENTION: Cela va ÉCRASER TOUTES les données de TOUTE la base!")
             
             conn = self.get_connection()
             if not conn:
                 return False
             
+            if os.path.isdir(filepath):
+                try:
+                    return self._restore_copy(conn, filepath)
+                finally:
+                    conn.close()
+            if backup_file.endswith(".pba"):
+                try:
+                    return self._restore_archive(conn, backup_file)
+                finally:
+                    conn.close()
+            
             try:
                 with conn.cursor() as c:
                     restored_count = 0
+                    table_counts = {}
+                    failed_tables = set()
                     
-                    # Restaurer chaque table
-                    for table_name in tables_to_restore:
-                        table_data = backup_data[table_name]
-                        
-                        if not table_data:
-                            print(f"  ⏭️ {table_name}: vide")
+                    for table_name, columns, rows in self._iter_backup(backup_file):
+                        if table_name in failed_tables:
                             continue
-                        
                         try:
-                            # Vider la table
-                            c.execute(f'TRUNCATE "{table_name}" CASCADE')
+                            if table_name not in table_counts:
+                                # Vider la table
+                                c.execute(
+                                    sql.SQL("TRUNCATE {} CASCADE").format(sql.Identifier(table_name))
+                                )
+                                table_counts[table_name] = 0
+                            if not rows:
+                                continue
                             
-                            # Obtenir les colonnes
-                            first_row = table_data[0]
-                            columns = list(first_row.keys())
-                            
-                            # Construire la requête INSERT
-                            columns_str = ', '.join(f'"{col}"' for col in columns)
-                            placeholders = ', '.join(f'%({col})s' for col in columns)
-                            
-                            insert_query = f'''
-                                INSERT INTO "{table_name}" ({columns_str})
-                                VALUES ({placeholders})
-                            '''
-                            
-                            # Insérer tous les enregistrements
-                            c.executemany(insert_query, table_data)
-                            
-                            restored_count += len(table_data)
-                            print(f"  ✅ {table_name}: {len(table_data)} enregistrements")
+                            execute_values(
+                                c,
+                                sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+                                    sql.Identifier(table_name),
+                                    sql.SQL(', ').join(map(sql.Identifier, columns)),
+                                ),
+                                rows,
+                                page_size=RESTORE_BATCH_SIZE,
+                            )
+                            table_counts[table_name] += len(rows)
+                            restored_count += len(rows)
                             
                         except Exception as table_error:
-                            print(f"  ❌ Erreur {table_name}: {table_error}")
+                            logger.error(f"  ❌ Erreur {table_name}: {table_error}")
+                            failed_tables.add(table_name)
+                    
+                    for table_name, count in table_counts.items():
+                        if table_name in failed_tables:
+                            continue
+                        if count:
+                            logger.info(f"  ✅ {table_name}: {count} enregistrements")
+                        else:
+                            logger.info(f"  ⏭️ {table_name}: vide")
                     
                     conn.commit()
                     
-                    print(f"✅ Restoration terminée: {restored_count} enregistrements")
-                    print(f"📊 Backup du {metadata.get('backup_date', 'date inconnue')}")
+                    logger.info(f"✅ Restoration terminée: {restored_count} enregistrements")
                     return True
                     
             finally:
                 conn.close()
                 
         except Exception as e:
-            print(f"❌ Erreur restoration: {e}")
+            logger.error(f"❌ Erreur restoration: {e}")
             return False
     
-    def list_backups(self):
-        """Liste tous les backups disponibles"""
+    def _restore_copy(self, conn, directory):
+        """Recharge un backup ``copy`` : la base de sa chaîne puis chaque delta."""
+        chain = _read_manifest(directory).get('chain', [os.path.basename(directory)])
+        if not self._restore_base(conn, os.path.join(self.backup_path, chain[0])):
+            return False
+        for name in chain[1:]:
+            if not self._apply_delta(conn, os.path.join(self.backup_path, name)):
+                logger.error(f"❌ Deltas suivants non rejoués, base restaurée jusqu'avant {name}")
+                return False
+        if len(chain) > 1:
+            logger.info(f"🧩 {len(chain) - 1} backup(s) incrémental(aux) rejoué(s)")
+        return True
+    
+    def _apply_delta(self, conn, directory):
+        """Rejoue un backup incrémental dans une transaction.
+
+        Les lignes absentes de la liste de clés sont supprimées (enfants
+        d'abord), puis les lignes modifiées sont insérées ou mises à jour
+        (parents d'abord).  Les tables sans clé primaire sont rechargées
+        entièrement.  Retourne ``False`` (transaction annulée) en cas d'échec.
+        """
         try:
-            pattern = os.path.join(self.backup_path, "bot_backup_*.json.gz")
-            backup_files = glob.glob(pattern)
-            backup_files.sort(key=os.path.getmtime, reverse=True)
+            manifest = _read_manifest(directory)
+            tables = [t for t in manifest['tables_list'] if t in manifest.get('table_counts', {})]
+            with conn.cursor() as c:
+                plan = build_restore_plan(get_catalog(c, verify=True), tables)
+            ordered = [table for level in plan.levels for table in level]
+        
+            with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as c:
+                for table_name in reversed(ordered):
+                    table = sql.Identifier(table_name)
+                    if manifest['modes'].get(table_name) != 'delta':
+                        c.execute(sql.SQL("DELETE FROM {}").format(table))
+                        continue
+                    keys = manifest['primary_keys'][table_name]
+                    key_list = sql.SQL(', ').join(map(sql.Identifier, keys))
+                    c.execute(
+                        sql.SQL(
+                            "CREATE TEMP TABLE _restore_keys AS SELECT {} FROM {} WITH NO DATA"
+                        ).format(key_list, table)
+                    )
+                    with gzip.open(os.path.join(directory, f"{table_name}.keys.csv.gz"), 'rb') as f:
+                        c.copy_expert("COPY _restore_keys FROM STDIN WITH (FORMAT csv)", f)
+                    _delete_missing(c, table_name, keys, "_restore_keys")
+                    c.execute("DROP TABLE _restore_keys")
             
-            backups = []
-            for filepath in backup_files:
-                filename = os.path.basename(filepath)
-                size_kb = os.path.getsize(filepath) / 1024
-                date = datetime.fromtimestamp(os.path.getmtime(filepath))
-                
-                backups.append({
-                    'filename': filename,
-                    'date': date,
-                    'size_kb': size_kb
-                })
+                for table_name in ordered:
+                    table = sql.Identifier(table_name)
+                    columns = manifest['columns'][table_name]
+                    column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+                    path = os.path.join(directory, f"{table_name}.csv.gz")
+                    if manifest['modes'].get(table_name) != 'delta':
+                        with gzip.open(path, 'rb') as f:
+                            c.copy_expert(
+                                sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+                                    table, column_list
+                                ),
+                                f,
+                                size=COPY_BUFFER_SIZE,
+                            )
+                        continue
+                    keys = manifest['primary_keys'][table_name]
+                    c.execute(
+                        sql.SQL(
+                            "CREATE TEMP TABLE _restore_delta AS SELECT {} FROM {} WITH NO DATA"
+                        ).format(column_list, table)
+                    )
+                    with gzip.open(path, 'rb') as f:
+                        c.copy_expert(
+                            "COPY _restore_delta FROM STDIN WITH (FORMAT csv)", f, size=COPY_BUFFER_SIZE
+                        )
+                    _upsert_from_temp(c, table_name, columns, keys)
             
-            return backups
+                _reset_sequences(c, plan)
+            conn.commit()
+            logger.info(f"  ✅ Delta {os.path.basename(directory)}: {manifest.get('total_records', 0)} lignes")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"❌ Delta {os.path.basename(directory)} non appliqué: {e}")
+            return False
+        return True
+    
+    def _restore_base(self, conn, directory):
+        """Recharge un backup ``copy`` complet (voir :meth:`_restore_full`)."""
+        manifest = _read_manifest(directory)
+        tables = [t for t in manifest['tables_list'] if t in manifest.get('table_counts', {})]
+        checksums = manifest.get('checksums', {})
+        restored_count = self._restore_full(
+            conn,
+            tables,
+            manifest['columns'],
+            lambda table_name, target: self._copy_table_in(
+                directory,
+                table_name,
+                manifest['columns'][table_name],
+                target,
+                checksums.get(table_name),
+            ),
+            manifest['table_counts'],
+        )
+        if restored_count is None:
+            return False
+        
+        logger.info(f"✅ Restoration terminée: {restored_count} enregistrements")
+        logger.info(f"📊 Backup du {manifest.get('backup_date', 'date inconnue')}")
+        return True
+    
+    def _restore_full(self, conn, tables, columns, load, expected_counts):
+        """Remplace le contenu de ``tables`` d'un bloc, sans état intermédiaire visible.
+
+        1. ``load(table, table_de_travail)`` charge chaque table dans une
+           table de travail ``UNLOGGED`` sans index ni contrainte, en
+           parallèle sur ``RESTORE_WORKERS`` connexions ;
+        2. si un chargement échoue (données corrompues comprises) ou si un
+           comptage diffère de ``expected_counts``, la restauration s'arrête
+           avant de toucher la base ;
+        3. sinon une seule transaction supprime clés étrangères et index
+           secondaires, vide les tables, les remplit depuis les tables de
+           travail puis reconstruit index, contraintes et séquences ; un
+           échec l'annule entièrement.
+
+        Retourne le nombre de lignes restaurées, ou ``None`` si la base n'a
+        pas été modifiée.
+        """
+        with conn.cursor() as c:
+            plan = build_restore_plan(get_catalog(c, verify=True), tables)
+        for table_name in sorted(set(tables) - set(plan.tables)):
+            logger.warning(f"  ⚠️ {table_name}: absente de la base, ignorée")
+        logger.info(
+            f"🧭 Plan: {len(plan.levels)} niveau(x), {len(plan.foreign_keys)} clé(s) étrangère(s), "
+            f"{len(plan.indexes)} index à reconstruire"
+        )
+        
+        staging = {
+            table_name: f"_restore_{position}_{table_name}"[:63]
+            for position, table_name in enumerate(plan.tables)
+        }
+        with conn.cursor() as c:
+            for table_name, work in staging.items():
+                c.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(work)))
+                c.execute(
+                    sql.SQL("CREATE UNLOGGED TABLE {} (LIKE {})").format(
+                        sql.Identifier(work), sql.Identifier(table_name)
+                    )
+                )
+        conn.commit()
+        
+        try:
+            try:
+                counts = dict(zip(
+                    plan.tables,
+                    self._run_parallel(
+                        plan.tables, lambda table_name: load(table_name, staging[table_name])
+                    ),
+                ))
+            except Exception as e:
+                logger.error(f"❌ Chargement interrompu, base inchangée: {e}")
+                return None
             
+            mismatched = [
+                table_name for table_name in plan.tables
+                if table_name in expected_counts and counts[table_name] != expected_counts[table_name]
+            ]
+            for table_name in mismatched:
+                logger.error(
+                    f"  ❌ {table_name}: {counts[table_name]} lignes chargées, "
+                    f"{expected_counts[table_name]} attendues"
+                )
+            if mismatched:
+                logger.error("❌ Backup incohérent, base inchangée")
+                return None
+            
+            try:
+                self._swap_in(conn, plan, staging, columns)
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"❌ Restauration annulée, base inchangée: {e}")
+                return None
+        finally:
+            conn.rollback()
+            with conn.cursor() as c:
+                for work in staging.values():
+                    c.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(work)))
+            conn.commit()
+        return sum(counts.values())
+    
+    def _swap_in(self, conn, plan, staging, columns):
+        """Remplace les tables du plan par leurs tables de travail, en une transaction."""
+        with conn.cursor() as c:
+            for table_name, constraint in plan.foreign_keys:
+                c.execute(
+                    sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(
+                        sql.Identifier(table_name), sql.Identifier(constraint.name)
+                    )
+                )
+            for _table_name, index in plan.indexes:
+                c.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(index.name)))
+            c.execute(
+                sql.SQL("TRUNCATE {}").format(sql.SQL(', ').join(map(sql.Identifier, plan.tables)))
+            )
+            for level in plan.levels:
+                for table_name in level:
+                    column_list = sql.SQL(', ').join(map(sql.Identifier, columns[table_name]))
+                    c.execute(
+                        sql.SQL(
+                            "INSERT INTO {} ({}) OVERRIDING SYSTEM VALUE SELECT {} FROM {}"
+                        ).format(
+                            sql.Identifier(table_name),
+                            column_list,
+                            column_list,
+                            sql.Identifier(staging[table_name]),
+                        )
+                    )
+            for _table_name, index in plan.indexes:
+                c.execute(index.definition)
+            for table_name, constraint in plan.foreign_keys:
+                c.execute(
+                    sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} {}").format(
+                        sql.Identifier(table_name),
+                        sql.Identifier(constraint.name),
+                        sql.SQL(constraint.definition),
+                    )
+                )
+            _reset_sequences(c, plan)
+        conn.commit()
+        logger.info(
+            f"🔧 {len(plan.indexes)} index, {len(plan.foreign_keys)} contrainte(s) et "
+            f"{len(plan.sequences)} séquence(s) reconstruits"
+        )
+        with conn.cursor() as c:
+            for table_name in plan.tables:
+                c.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(table_name)))
+        conn.commit()
+    
+    def _restore_archive(self, conn, backup_file):
+        """Recharge toute une archive ``.pba`` comme un backup ``copy`` complet."""
+        with self._open_backup(backup_file, seekable=True) as f:
+            index = backup_archive.read_index(f)
+        metadata = index['metadata']
+        tables = [t for t in metadata['tables_list'] if t in index['tables']]
+        restored_count = self._restore_full(
+            conn,
+            tables,
+            {table_name: index['tables'][table_name]['columns'] for table_name in tables},
+            lambda table_name, target: self._archive_table_in(
+                backup_file, index, table_name, target
+            ),
+            {table_name: index['tables'][table_name]['rows'] for table_name in tables},
+        )
+        if restored_count is None:
+            return False
+        
+        logger.info(f"✅ Restoration terminée: {restored_count} enregistrements")
+        logger.info(f"📊 Backup du {metadata.get('backup_date', 'date inconnue')}")
+        return True
+    
+    def _archive_table_in(self, backup_file, index, table_name, target):
+        """Charge les blocs de ``table_name`` dans ``target`` en vérifiant leur ``sha256``."""
+        columns = index['tables'][table_name]['columns']
+        conn = connect(self.database_url)
+        count = 0
+        try:
+            with self._open_backup(backup_file, seekable=True) as f, conn.cursor(
+                cursor_factory=psycopg2.extensions.cursor
+            ) as c:
+                for block in backup_archive.select_blocks(index, table_name):
+                    data = backup_archive.read_block(f, block)
+                    if 'sha256' in block and hashlib.sha256(data).hexdigest() != block['sha256']:
+                        raise ValueError(f"{table_name}: bloc corrompu (offset {block['offset']})")
+                    c.copy_expert(
+                        sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+                            sql.Identifier(target),
+                            sql.SQL(', ').join(map(sql.Identifier, columns)),
+                        ),
+                        io.BytesIO(data),
+                        size=COPY_BUFFER_SIZE,
+                    )
+                    count += c.rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        logger.info(f"  ✅ {table_name}: {count} enregistrements")
+        return count
+    
+    def restore_from_archive(self, backup_file, table_name, key=None):
+        """Restaure une table, ou une seule ligne, depuis une archive ``.pba``.
+
+        Seuls les blocs de ``table_name`` (ceux dont la plage contient ``key``
+        si elle est donnée, par ex. un ``discord_id``) sont lus.  Sans ``key``
+        la table reprend exactement son contenu sauvegardé ; avec ``key``
+        seule cette ligne est réinsérée ou mise à jour.  Le reste de la base
+        n'est pas modifié.
+        """
+        if not self._backup_exists(backup_file):
+            logger.error(f"❌ Fichier {backup_file} introuvable")
+            return False
+        
+        conn = self.get_connection()
+        if not conn:
+            return False
+        try:
+            with self._open_backup(backup_file, seekable=True) as f:
+                index = backup_archive.read_index(f)
+                meta = index['tables'][table_name]
+                columns, keys = meta['columns'], meta['primary_key']
+                if key is not None:
+                    key = backup_archive.normalize_key(index, table_name, key)
+                    chunks = [backup_archive.extract(f, index, table_name, key)]
+                else:
+                    chunks = (
+                        backup_archive.read_block(f, block)
+                        for block in backup_archive.select_blocks(index, table_name)
+                    )
+                
+                with conn.cursor() as c:
+                    plan = build_restore_plan(get_catalog(c, verify=True), [table_name])
+                table = sql.Identifier(table_name)
+                column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+                target = table if not keys else sql.Identifier("_restore_delta")
+                count = 0
+                with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as c:
+                    if keys:
+                        c.execute(
+                            sql.SQL(
+                                "CREATE TEMP TABLE _restore_delta AS SELECT {} FROM {} WITH NO DATA"
+                            ).format(column_list, table)
+                        )
+                    else:
+                        c.execute(sql.SQL("DELETE FROM {}").format(table))
+                    for data in chunks:
+                        c.copy_expert(
+                            sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+                                target, column_list
+                            ),
+                            io.BytesIO(data),
+                            size=COPY_BUFFER_SIZE,
+                        )
+                        count += max(c.rowcount, 0)
+                    if keys:
+                        if key is None:
+                            _delete_missing(c, table_name, keys, "_restore_delta")
+                        _upsert_from_temp(c, table_name, columns, keys)
+                    _reset_sequences(c, plan)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"❌ Erreur restoration {table_name}: {e}")
+            return False
+        finally:
+            conn.close()
+        
+        if key is not None and not count:
+            logger.warning(f"⚠️ {table_name}: clé {key} absente de {backup_file}")
+            return False
+        logger.info(f"✅ {table_name} restaurée depuis {backup_file}: {count} enregistrement(s)")
+        return True
+    
+    def _run_parallel(self, items, func):
+        """Applique ``func`` à ``items`` sur ``RESTORE_WORKERS`` threads."""
+        if len(items) <= 1 or RESTORE_WORKERS <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(RESTORE_WORKERS, len(items))) as pool:
+            return list(pool.map(func, items))
+    
+    def _copy_table_in(self, directory, table_name, columns, target, checksum=None):
+        """Charge ``<table>.csv.gz`` dans ``target`` ; vérifie ``checksum`` (``sha256``) si donné."""
+        conn = connect(self.database_url)
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as c:
+                with gzip.open(os.path.join(directory, f"{table_name}.csv.gz"), 'rb') as f:
+                    reader = _HashingReader(f)
+                    c.copy_expert(
+                        sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+                            sql.Identifier(target),
+                            sql.SQL(', ').join(map(sql.Identifier, columns)),
+                        ),
+                        reader,
+                        size=COPY_BUFFER_SIZE,
+                    )
+                count = c.rowcount
+            if checksum is not None and reader.digest.hexdigest() != checksum:
+                raise ValueError(f"{table_name}: sha256 différent du manifest")
+            conn.commit()
+        finally:
+            conn.close()
+        logger.info(f"  ✅ {table_name}: {count} enregistrements")
+        return count
+    
+    def verify_backup(self, backup_file, against_db=False):
+        """Vérifie un backup sans le restaurer et retourne un rapport.
+
+        Le backup est relu en flux, en mémoire constante : pour chaque table,
+        le nombre de lignes et le ``sha256`` des données sont recalculés et
+        comparés à ceux enregistrés à l'écriture (un incrémental est vérifié
+        avec toute sa chaîne).  ``against_db`` compare en plus les empreintes
+        SQL (``table_hashes``) à la base actuelle, par ex. juste après une
+        restauration, sans transférer les données.
+
+        Le rapport contient ``ok``, ``files`` (``{fichier: {table: {...}}}``),
+        ``database`` (``{table: statut}``) et la liste ``errors``.
+        """
+        filepath = os.path.join(self.backup_path, backup_file)
+        report = {'backup': backup_file, 'ok': False, 'files': {}, 'database': {}, 'errors': []}
+        started = time.perf_counter()
+        try:
+            if os.path.isdir(filepath):
+                metadata = _read_manifest(filepath)
+                for name in metadata.get('chain', [backup_file]):
+                    self._verify_copy(os.path.join(self.backup_path, name), report)
+            elif backup_file.endswith(".pba"):
+                metadata = self._verify_archive(backup_file, report)
+            else:
+                metadata = self._verify_ndjson(backup_file, report)
+            if against_db and metadata is not None:
+                self._verify_database(metadata, report)
+        except Exception as e:
+            report['errors'].append(f"{backup_file}: {e}")
+        
+        report['ok'] = not report['errors']
+        for error in report['errors']:
+            logger.error(f"  ❌ {error}")
+        tables = sum(len(entries) for entries in report['files'].values())
+        logger.info(
+            f"{'✅' if report['ok'] else '❌'} Vérification {backup_file}: {tables} table(s), "
+            f"{len(report['errors'])} erreur(s)",
+            extra={
+                "event": "backup_verified",
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            },
+        )
+        return report
+    
+    def _check_table(self, report, name, table, rows, checksum, expected_rows, expected_checksum):
+        status = 'absent'
+        if expected_checksum is not None:
+            status = 'ok' if checksum == expected_checksum else 'différent'
+        report['files'].setdefault(name, {})[table] = {
+            'rows': rows, 'expected_rows': expected_rows, 'checksum': status,
+        }
+        if expected_rows is not None and rows != expected_rows:
+            report['errors'].append(f"{name}/{table}: {rows} lignes au lieu de {expected_rows}")
+        if status == 'différent':
+            report['errors'].append(f"{name}/{table}: sha256 différent")
+    
+    def _verify_copy(self, directory, report):
+        name = os.path.basename(directory)
+        manifest = _read_manifest(directory)
+        checksums = manifest.get('checksums', {})
+        key_checksums = manifest.get('key_checksums', {})
+        for table, expected_rows in manifest.get('table_counts', {}).items():
+            try:
+                rows, checksum = _scan_csv(os.path.join(directory, f"{table}.csv.gz"))
+                self._check_table(
+                    report, name, table, rows, checksum, expected_rows, checksums.get(table)
+                )
+                if table in key_checksums:
+                    _rows, checksum = _scan_csv(os.path.join(directory, f"{table}.keys.csv.gz"))
+                    if checksum != key_checksums[table]:
+                        report['errors'].append(f"{name}/{table}: sha256 des clés différent")
+            except (OSError, EOFError) as e:
+                report['errors'].append(f"{name}/{table}: {e}")
+        return manifest
+    
+    def _verify_archive(self, name, report):
+        with self._open_backup(name, seekable=True) as f:
+            index = backup_archive.read_index(f)
+            for table, meta in index['tables'].items():
+                digest = hashlib.sha256()
+                rows = 0
+                try:
+                    for block in backup_archive.select_blocks(index, table):
+                        data = backup_archive.read_block(f, block)
+                        counter = _CsvRecordCounter()
+                        counter.feed(data)
+                        if counter.records != block['rows'] or (
+                            'sha256' in block
+                            and hashlib.sha256(data).hexdigest() != block['sha256']
+                        ):
+                            report['errors'].append(
+                                f"{name}/{table}: bloc corrompu (offset {block['offset']})"
+                            )
+                        digest.update(data)
+                        rows += counter.records
+                except (OSError, EOFError) as e:
+                    report['errors'].append(f"{name}/{table}: {e}")
+                    continue
+                self._check_table(
+                    report, name, table, rows, digest.hexdigest(), meta['rows'], meta.get('sha256')
+                )
+        return index['metadata']
+    
+    def _verify_ndjson(self, name, report):
+        if name.endswith(".json.gz"):
+            # Ancien format sans empreintes : seule l'intégrité gzip (CRC) est vérifiable.
+            with self._open_backup(name) as raw, gzip.open(raw, 'rb') as f:
+                while f.read(COPY_BUFFER_SIZE):
+                    pass
+            logger.warning(f"⚠️ {name}: ancien format, pas de comptages ni d'empreintes")
+            return None
+        
+        metadata = None
+        counts = {}
+        digests = {}
+        table = None
+        with self._open_backup(name) as raw, gzip.open(raw, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('['):
+                    # Lignes de données : comptées et hachées sans être décodées
+                    counts[table] += 1
+                    digests[table].update(line.encode('utf-8'))
+                    continue
+                record = json.loads(line)
+                if '_metadata' in record:
+                    metadata = record['_metadata']
+                    continue
+                table = record['table']
+                counts[table] = 0
+                digests[table] = hashlib.sha256()
+        if metadata is None:
+            report['errors'].append(f"{name}: backup incomplet (métadonnées finales absentes)")
+            return None
+        
+        checksums = metadata.get('checksums', {})
+        for table, expected_rows in metadata.get('table_counts', {}).items():
+            if table not in counts:
+                report['errors'].append(f"{name}/{table}: table absente du fichier")
+                continue
+            self._check_table(
+                report, name, table, counts[table], digests[table].hexdigest(),
+                expected_rows, checksums.get(table),
+            )
+        return metadata
+    
+    def _verify_database(self, metadata, report):
+        """Compare les empreintes SQL du backup à celles de la base actuelle."""
+        expected = metadata.get('table_hashes')
+        if not expected:
+            report['errors'].append(f"{report['backup']}: pas d'empreintes SQL (BACKUP_SQL_HASH)")
+            return
+        conn = self.get_connection(low_priority=True)
+        if not conn:
+            report['errors'].append("connexion à la base impossible")
+            return
+        try:
+            with conn.cursor() as c:
+                for table, value in expected.items():
+                    try:
+                        live = _table_hashes(c, [table])[table]
+                    except psycopg2.Error as e:
+                        conn.rollback()
+                        report['database'][table] = 'absente'
+                        report['errors'].append(f"base/{table}: {e}")
+                        continue
+                    if live == value:
+                        report['database'][table] = 'identique'
+                        continue
+                    report['database'][table] = 'différente'
+                    report['errors'].append(
+                        f"base/{table}: empreinte différente "
+                        f"({live['rows']} lignes en base, {value['rows']} dans le backup)"
+                    )
+        finally:
+            conn.close()
+    
+    def _index_path(self):
+        return os.path.join(self.backup_path, INDEX_NAME)
+    
+    def _load_index(self):
+        """Entrées de l'index ``backups.json`` ; reconstruit s'il manque.
+
+        Avec S3, l'index est un objet du bucket partagé par toutes les
+        instances : un gestionnaire au répertoire local vide (redéploiement
+        Koyeb) reprend l'inventaire, et la rétention, des autres.
+        """
+        try:
+            if self.storage is not None:
+                if self.storage.exists(INDEX_NAME):
+                    return json.loads(self.storage.read_bytes(INDEX_NAME))['backups']
+            else:
+                with open(self._index_path(), encoding='utf-8') as f:
+                    return json.load(f)['backups']
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ Index des backups illisible, reconstruction: {e}")
+        entries = self._scan_backups()
+        self._save_index(entries)
+        return entries
+    
+    def _save_index(self, entries):
+        if self.storage is not None:
+            self.storage.write_bytes(
+                INDEX_NAME,
+                json.dumps({'backups': entries}, ensure_ascii=False, indent=2).encode('utf-8'),
+            )
+            return
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'backups': entries}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._index_path())
+    
+    def _scan_backups(self):
+        """Inventaire des backups présents (pour reconstruire l'index).
+
+        Avec S3, seul le bucket est inventorié : l'index y est partagé et un
+        répertoire local ne concerne qu'une instance.
+        """
+        entries = []
+        patterns = ("supabase_backup_*", "bot_backup_*.json.gz") if self.storage is None else ()
+        for pattern in patterns:
+            for path in glob.glob(os.path.join(self.backup_path, pattern)):
+                filename = os.path.basename(path)
+                entry = {
+                    'filename': filename,
+                    'date': _backup_date(filename, path).isoformat(),
+                    'size': _path_size(path),
+                    'format': None,
+                    'kind': 'full',
+                    'chain': [filename],
+                    'records': None,
+                    'checksums': None,
+                    'location': 'local',
+                    'tier': None,
+                }
+                if os.path.isdir(path):
+                    try:
+                        manifest = _read_manifest(path)
+                    except (OSError, ValueError):
+                        continue
+                    entry.update(
+                        format=manifest.get('format'),
+                        kind=manifest.get('kind', 'full'),
+                        chain=manifest.get('chain', [filename]),
+                        records=manifest.get('total_records'),
+                        checksums=manifest.get('checksums'),
+                    )
+                entries.append(entry)
+        if self.storage is not None:
+            for filename, size, modified in self.storage.list():
+                if filename.startswith("supabase_backup_"):
+                    date = _backup_date(filename) or modified.replace(tzinfo=None)
+                    entries.append({
+                        'filename': filename,
+                        'date': date.isoformat(),
+                        'size': size,
+                        'format': None,
+                        'kind': 'full',
+                        'chain': [filename],
+                        'records': None,
+                        'checksums': None,
+                        'location': 's3',
+                        'tier': None,
+                    })
+        entries.sort(key=lambda entry: entry['date'], reverse=True)
+        return entries
+    
+    def _register_backup(self, filename, timestamp, metadata, size):
+        """Ajoute un backup réussi à l'index."""
+        entries = [entry for entry in self._load_index() if entry['filename'] != filename]
+        entries.insert(0, {
+            'filename': filename,
+            'date': datetime.strptime(timestamp, "%Y-%m-%d_%H-%M-%S").isoformat(),
+            'size': int(size),
+            'format': metadata.get('format'),
+            'kind': metadata.get('kind', 'full'),
+            'chain': metadata.get('chain', [filename]),
+            'records': metadata.get('total_records'),
+            'checksums': metadata.get('checksums'),
+            'location': 's3' if self._is_remote(filename) else 'local',
+            'tier': None,
+        })
+        self._save_index(entries)
+    
+    def list_backups(self):
+        """Liste les backups disponibles, du plus récent au plus ancien.
+
+        Lit uniquement l'index ``backups.json`` (aucun ``stat`` par fichier).
+        """
+        try:
+            return [
+                dict(
+                    entry,
+                    date=datetime.fromisoformat(entry['date']),
+                    size_kb=entry['size'] / 1024,
+                )
+                for entry in self._load_index()
+            ]
         except Exception as e:
-            print(f"❌ Erreur liste backups: {e}")
+            logger.error(f"❌ Erreur liste backups: {e}")
             return []
     
     def cleanup_old_backups(self):
-        """Supprime les anciens backups"""
+        """Applique la rétention (voir :func:`plan_retention`) et met l'index à jour."""
         try:
-            pattern = os.path.join(self.backup_path, "bot_backup_*.json.gz")
-            backup_files = glob.glob(pattern)
+            entries = self._load_index()
+            keep, delete = plan_retention(entries)
+            locations = {entry['filename']: entry.get('location') for entry in entries}
+            for filename in delete:
+                path = os.path.join(self.backup_path, filename)
+                if locations[filename] == 's3':
+                    self.storage.delete(filename)
+                elif os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                elif os.path.exists(path):
+                    os.remove(path)
+                logger.info(f"🗑️ Ancien backup supprimé: {filename}")
+            
+            for entry in entries:
+                entry['tier'] = keep.get(entry['filename'])
+            self._save_index([entry for entry in entries if entry['filename'] in keep])
             
-            if len(backup_files) > self.max_backups:
-                backup_files.sort(key=os.path.getmtime)
-                files_to_delete = backup_files[:len(backup_files) - self.max_backups]
-                
-                for file_path in files_to_delete:
-                    os.remove(file_path)
-                    filename = os.path.basename(file_path)
-                    print(f"🗑️ Ancien backup supprimé: {filename}")
-                    
         except Exception as e:
-            print(f"❌ Erreur nettoyage: {e}")
+            logger.error(f"❌ Erreur nettoyage: {e}")
     
     async def start_auto_backup(self):
         """Démarre le backup automatique"""
@@ -250,25 +1914,23 @@ class PythonBackupManager:
             return
             
         self.is_running = True
-        print(f"🕕 Backup automatique démarré (toutes les {self.backup_frequency_hours}h)")
-        
-        # Backup initial
-        self.create_backup("startup")
+        logger.info(f"🕕 Backup automatique démarré (toutes les {self.backup_frequency_hours}h)")
         
-        # Tâche périodique
+        # Tâche périodique (backup initial compris), exécutée hors de la boucle
         self.backup_task = asyncio.create_task(self._backup_loop())
     
     async def _backup_loop(self):
         """Boucle de backup"""
         try:
+            await self.create_backup_async("startup")
             while self.is_running:
                 await asyncio.sleep(self.backup_frequency_hours * 3600)
                 if self.is_running:
-                    self.create_backup("scheduled")
+                    await self.create_backup_async("scheduled")
         except asyncio.CancelledError:
-            print("🛑 Backup automatique arrêté")
+            logger.info("🛑 Backup automatique arrêté")
         except Exception as e:
-            print(f"❌ Erreur boucle backup: {e}")
+            logger.error(f"❌ Erreur boucle backup: {e}")
     
     async def stop_auto_backup(self):
         """Arrête le backup automatique"""
@@ -279,16 +1941,16 @@ class PythonBackupManager:
                 await self.backup_task
             except asyncio.CancelledError:
                 pass
-        print("🛑 Backup automatique arrêté")
+        logger.info("🛑 Backup automatique arrêté")
     
     def backup_on_shutdown(self):
         """Backup synchrone au shutdown"""
-        print("🔄 Backup final avant arrêt...")
+        logger.info("🔄 Backup final avant arrêt...")
         success = self.create_backup("shutdown")
         if success:
-            print("✅ Backup final créé")
+            logger.info("✅ Backup final créé")
         else:
-            print("❌ Échec backup final")
+            logger.error("❌ Échec backup final")
 
 # Instance globale
 backup_manager = None
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Archive de backup indexée (format ``archive``)
+
+Un fichier ``supabase_backup_<date>.pba`` contient :
+
+- l'en-tête ``MAGIC`` ;
+- des blocs compressés indépendamment (un membre gzip chacun) de lignes CSV
+  produites par un seul ``COPY`` par table, triées par clé primaire, au
+  plus ``BACKUP_BLOCK_ROWS`` lignes par bloc ;
+- un index JSON compressé : tables (colonnes, clé primaire, ``sha256``) et,
+  pour chaque bloc, sa position, sa taille, son nombre de lignes, les
+  bornes de ses clés (``first_key`` / ``last_key`` : minimum et maximum) et
+  le ``sha256`` de ses données décompressées ;
+- un pied de page de taille fixe donnant la taille de l'index.
+
+Lire une table ou un seul ``discord_id`` ne décompresse que les blocs
+concernés : le coût dépend de ce qui est extrait, pas de la taille de
+l'archive.
+
+Usage :
+    python3 scripts/backup_archive.py list <archive>
+    python3 scripts/backup_archive.py extract <archive> <table> [--key ID] [-o fichier.csv]
+"""
+
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import struct
+import sys
+
+MAGIC = b"PRISSBK1\n"
+FOOTER_MAGIC = b"PRISSIDX"
+FOOTER = struct.Struct(">Q8s")
+FORMAT_ARCHIVE = "archive-v1"
+BLOCK_ROWS = int(os.getenv("BACKUP_BLOCK_ROWS", "5000"))
+
+INTEGER_TYPES = {"smallint", "integer", "bigint"}
+
+
+def is_text_type(type_name):
+    return type_name == "text" or type_name.startswith("character")
+
+
+def parse_key(values, types):
+    """Convertit des valeurs de clé CSV en valeurs Python comparables.
+
+    Les bornes des blocs sont calculées dans cet ordre (entiers, puis
+    chaînes Python), indépendamment du collationnement de la base.
+    """
+    return [
+        int(value) if type_name in INTEGER_TYPES else value
+        for value, type_name in zip(values, types)
+    ]
+
+
+def iter_records(data):
+    """Produit ``(champs, texte_brut)`` pour chaque enregistrement CSV de ``data``.
+
+    Le texte brut est conservé tel quel pour rester fidèle à ``COPY`` (NULL
+    non quoté et chaîne vide ``""`` sont distincts).
+    """
+    lines = io.StringIO(data.decode("utf-8"), newline="").readlines()
+    reader = csv.reader(iter(lines))
+    consumed = 0
+    for fields in reader:
+        yield fields, "".join(lines[consumed:reader.line_num])
+        consumed = reader.line_num
+
+
+class ArchiveWriter:
+    """Écrit une archive bloc par bloc puis son index dans ``fileobj``.
+
+    ``fileobj`` n'a besoin que de ``write`` et ``tell`` : un fichier local ou
+    un upload en flux.  Il reste ouvert après :meth:`close`.
+    """
+
+    def __init__(self, fileobj, compresslevel=6):
+        self.compresslevel = compresslevel
+        self.tables = {}
+        self.blocks = []
+        self._digests = {}
+        self._file = fileobj
+        self._file.write(MAGIC)
+
+    def add_table(self, name, columns, primary_key, key_types):
+        self.tables[name] = {
+            "columns": columns,
+            "primary_key": primary_key,
+            "key_types": key_types,
+            "rows": 0,
+            "sha256": hashlib.sha256().hexdigest(),
+        }
+        self._digests[name] = hashlib.sha256()
+
+    def write_block(self, table, data, rows, first_key=None, last_key=None):
+        offset = self._file.tell()
+        self._file.write(gzip.compress(data, self.compresslevel))
+        self.blocks.append({
+            "table": table,
+            "offset": offset,
+            "length": self._file.tell() - offset,
+            "rows": rows,
+            "first_key": first_key,
+            "last_key": last_key,
+            "sha256": hashlib.sha256(data).hexdigest(),
+        })
+        self.tables[table]["rows"] += rows
+        self._digests[table].update(data)
+        self.tables[table]["sha256"] = self._digests[table].hexdigest()
+
+    def discard_table(self, table):
+        """Retire ``table`` de l'index (ses blocs déjà écrits restent inutilisés)."""
+        self.tables.pop(table, None)
+        self._digests.pop(table, None)
+        self.blocks = [block for block in self.blocks if block["table"] != table]
+
+    def close(self, metadata):
+        index = {"metadata": metadata, "tables": self.tables, "blocks": self.blocks}
+        payload = gzip.compress(json.dumps(index, separators=(",", ":")).encode("utf-8"))
+        self._file.write(payload)
+        self._file.write(FOOTER.pack(len(payload), FOOTER_MAGIC))
+
+
+def read_index(f):
+    """Lit l'index d'une archive ouverte en binaire."""
+    f.seek(-FOOTER.size, os.SEEK_END)
+    length, magic = FOOTER.unpack(f.read(FOOTER.size))
+    if magic != FOOTER_MAGIC:
+        raise ValueError("archive de backup invalide (pied de page absent)")
+    f.seek(-(FOOTER.size + length), os.SEEK_END)
+    return json.loads(gzip.decompress(f.read(length)))
+
+
+def select_blocks(index, table, key=None):
+    """Blocs de ``table`` pouvant contenir ``key`` (liste de valeurs), ou tous."""
+    if table not in index["tables"]:
+        raise KeyError(f"table {table} absente de l'archive")
+    blocks = [block for block in index["blocks"] if block["table"] == table]
+    if key is None:
+        return blocks
+    return [
+        block for block in blocks
+        if block["first_key"] is None or block["first_key"] <= key <= block["last_key"]
+    ]
+
+
+def read_block(f, block):
+    f.seek(block["offset"])
+    return gzip.decompress(f.read(block["length"]))
+
+
+def extract(f, index, table, key=None):
+    """Retourne le CSV (``bytes``) de ``table``, restreint à ``key`` si donné."""
+    meta = index["tables"][table]
+    positions = [meta["columns"].index(column) for column in meta["primary_key"]]
+    out = io.BytesIO()
+    for block in select_blocks(index, table, key):
+        data = read_block(f, block)
+        if key is None:
+            out.write(data)
+            continue
+        for fields, raw in iter_records(data):
+            if parse_key([fields[i] for i in positions], meta["key_types"]) == key:
+                out.write(raw.encode("utf-8"))
+    return out.getvalue()
+
+
+def normalize_key(index, table, value):
+    """Convertit un argument ``--key`` (ex. un ``discord_id``) en clé de l'archive."""
+    meta = index["tables"][table]
+    if len(meta["primary_key"]) != 1:
+        raise ValueError(f"{table} a une clé primaire composite, extraction par clé impossible")
+    return parse_key([value], meta["key_types"])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_parser = sub.add_parser("list", help="affiche les tables et blocs de l'archive")
+    list_parser.add_argument("archive")
+    extract_parser = sub.add_parser("extract", help="extrait une table (ou une clé) en CSV")
+    extract_parser.add_argument("archive")
+    extract_parser.add_argument("table")
+    extract_parser.add_argument("--key", help="valeur de clé primaire, ex. un discord_id")
+    extract_parser.add_argument("-o", "--output", help="fichier CSV (défaut : sortie standard)")
+    args = parser.parse_args()
+
+    with open(args.archive, "rb") as f:
+        index = read_index(f)
+        if args.command == "list":
+            print(f"📦 {args.archive} ({index['metadata'].get('backup_date', '?')})")
+            for name, meta in index["tables"].items():
+                blocks = sum(1 for block in index["blocks"] if block["table"] == name)
+                print(f"  🔹 {name}: {meta['rows']} lignes, {blocks} bloc(s), clé {meta['primary_key']}")
+            return
+
+        key = normalize_key(index, args.table, args.key) if args.key is not None else None
+        data = extract(f, index, args.table, key)
+    if args.output:
+        with open(args.output, "wb") as out:
+            out.write(data)
+    else:
+        sys.stdout.buffer.write(data)
+
+
+if __name__ == "__main__":
+    main()
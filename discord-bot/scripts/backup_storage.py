@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stockage des backups sur un bucket compatible S3 (AWS S3, MinIO, R2...)
+
+``/tmp/backups`` disparaît à chaque remplacement de l'instance Koyeb. Avec
+``BACKUP_S3_BUCKET``, les backups sont envoyés en flux vers le bucket par
+upload multipart pendant leur écriture, sans fichier local intermédiaire,
+et relus en flux (ou par plages d'octets pour les archives ``.pba``).
+
+Configuration :
+    BACKUP_S3_BUCKET         bucket cible (active le stockage distant)
+    BACKUP_S3_PREFIX         préfixe des objets (défaut ``backups/``)
+    BACKUP_S3_ENDPOINT_URL   endpoint compatible S3, ex. ``http://localhost:9000`` (MinIO)
+    BACKUP_S3_REGION         région (optionnelle)
+    BACKUP_S3_PART_SIZE_MB   taille des parties (défaut 8, minimum S3 : 5)
+    BACKUP_S3_CONCURRENCY    parties envoyées en parallèle (défaut 4)
+
+Les identifiants sont ceux de boto3 (``AWS_ACCESS_KEY_ID``,
+``AWS_SECRET_ACCESS_KEY``...).  boto3 est optionnel : sans lui, ou sans
+bucket, les backups restent locaux.
+"""
+
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # dépendance optionnelle
+    boto3 = None
+    ClientError = Exception
+
+logger = logging.getLogger(__name__)
+
+S3_PREFIX = os.getenv("BACKUP_S3_PREFIX", "backups/")
+S3_PART_SIZE = max(5, int(os.getenv("BACKUP_S3_PART_SIZE_MB", "8"))) * 2**20
+S3_CONCURRENCY = max(1, int(os.getenv("BACKUP_S3_CONCURRENCY", "4")))
+
+
+class MultipartUpload:
+    """Fichier binaire en écriture seule envoyé partie par partie.
+
+    Au plus ``concurrency`` parties sont en mémoire ou en cours d'envoi :
+    ``write`` attend qu'un envoi se termine avant d'en lancer un autre.
+    """
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.key = storage.key(name)
+        self._upload_id = storage.client.create_multipart_upload(
+            Bucket=storage.bucket, Key=self.key
+        )['UploadId']
+        self._buffer = bytearray()
+        self._futures = []
+        self._size = 0
+        self._done = False
+
+    def write(self, data):
+        self._buffer += data
+        self._size += len(data)
+        while len(self._buffer) >= self.storage.part_size:
+            self._submit(bytes(self._buffer[:self.storage.part_size]))
+            del self._buffer[:self.storage.part_size]
+        return len(data)
+
+    def tell(self):
+        return self._size
+
+    def flush(self):
+        pass
+
+    def _submit(self, data):
+        self.storage._slots.acquire()
+        number = len(self._futures) + 1
+        self._futures.append(self.storage._pool.submit(self._upload_part, number, data))
+
+    def _upload_part(self, number, data):
+        try:
+            response = self.storage.client.upload_part(
+                Bucket=self.storage.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                PartNumber=number,
+                Body=data,
+            )
+            return {'PartNumber': number, 'ETag': response['ETag']}
+        finally:
+            self.storage._slots.release()
+
+    def close(self):
+        """Envoie la dernière partie et finalise l'objet."""
+        if self._done:
+            return
+        if self._buffer or not self._futures:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        parts = [future.result() for future in self._futures]
+        self.storage.client.complete_multipart_upload(
+            Bucket=self.storage.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={'Parts': parts},
+        )
+        self._done = True
+
+    def abort(self):
+        """Annule l'upload : aucune partie n'est conservée dans le bucket."""
+        if self._done:
+            return
+        self._done = True
+        for future in self._futures:
+            future.exception()
+        self.storage.client.abort_multipart_upload(
+            Bucket=self.storage.bucket, Key=self.key, UploadId=self._upload_id
+        )
+
+
+class RangeReader(io.RawIOBase):
+    """Objet S3 lu comme un fichier positionnable, par requêtes ``Range``."""
+
+    def __init__(self, storage, name):
+        super().__init__()
+        self.storage = storage
+        self.key = storage.key(name)
+        self._length = storage.size(name)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._length
+        self._position = max(0, offset)
+        return self._position
+
+    def read(self, size=-1):
+        end = self._length if size is None or size < 0 else min(self._length, self._position + size)
+        if end <= self._position:
+            return b""
+        data = self.storage.client.get_object(
+            Bucket=self.storage.bucket,
+            Key=self.key,
+            Range=f"bytes={self._position}-{end - 1}",
+        )['Body'].read()
+        self._position += len(data)
+        return data
+
+
+class S3Storage:
+    """Bucket de backups : un objet par fichier, sous ``prefix``."""
+
+    def __init__(self, bucket, prefix=S3_PREFIX, endpoint_url=None, region=None,
+                 part_size=S3_PART_SIZE, concurrency=S3_CONCURRENCY):
+        if boto3 is None:
+            raise RuntimeError("boto3 n'est pas installé (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="s3-upload")
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    @classmethod
+    def from_env(cls):
+        """Stockage configuré par l'environnement, ou ``None`` (backups locaux)."""
+        bucket = os.getenv("BACKUP_S3_BUCKET")
+        if not bucket:
+            return None
+        if boto3 is None:
+            logger.warning("⚠️ BACKUP_S3_BUCKET défini mais boto3 absent : backups locaux")
+            return None
+        return cls(
+            bucket,
+            endpoint_url=os.getenv("BACKUP_S3_ENDPOINT_URL") or None,
+            region=os.getenv("BACKUP_S3_REGION") or None,
+        )
+
+    def key(self, name):
+        return self.prefix + name
+
+    def open_write(self, name):
+        return MultipartUpload(self, name)
+
+    def open_read(self, name):
+        """Flux séquentiel sur l'objet (corps de ``GetObject``)."""
+        return self.client.get_object(Bucket=self.bucket, Key=self.key(name))['Body']
+
+    def open_range(self, name):
+        return RangeReader(self, name)
+
+    def read_bytes(self, name):
+        return self.client.get_object(Bucket=self.bucket, Key=self.key(name))['Body'].read()
+
+    def write_bytes(self, name, data):
+        """Écrit un petit objet en une requête (index des backups)."""
+        self.client.put_object(Bucket=self.bucket, Key=self.key(name), Body=data)
+
+    def size(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=self.key(name))['ContentLength']
+
+    def exists(self, name):
+        try:
+            self.size(name)
+            return True
+        except ClientError:
+            return False
+
+    def list(self):
+        """``(nom, taille, date de modification)`` de chaque objet sous le préfixe."""
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'][len(self.prefix):], item['Size'], item['LastModified']
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(name))
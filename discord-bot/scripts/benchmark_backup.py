@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Compare les formats de backup ``ndjson`` (JSON), ``copy`` (COPY CSV) et ``archive``.
+
+Usage :
+    python3 scripts/benchmark_backup.py            # backups seulement
+    python3 scripts/benchmark_backup.py --restore  # + restaurations (ÉCRASE la base !)
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Mesurer les formats, pas la limitation de débit des backups automatiques
+os.environ.setdefault("BACKUP_MAX_ROWS_PER_SEC", "0")
+os.environ.setdefault("BACKUP_MAX_BYTES_PER_SEC", "0")
+
+from backup import PythonBackupManager  # noqa: E402
+from db_tracing import log_summary  # noqa: E402
+from structured_logging import configure_logging  # noqa: E402
+
+FORMATS = ("ndjson", "copy", "archive")
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    ok = func(*args, **kwargs)
+    return ok, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--restore", action="store_true", help="mesure aussi la restauration")
+    parser.add_argument("--runs", type=int, default=3, help="nombre de mesures par format")
+    args = parser.parse_args()
+
+    configure_logging()
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL manquant")
+        sys.exit(1)
+
+    if os.getenv("BACKUP_S3_BUCKET"):
+        # Les backups iraient dans le bucket de production (et sa rétention),
+        # et le format copy y serait remplacé par archive.
+        print("❌ BACKUP_S3_BUCKET défini : le benchmark ne mesure que des backups locaux")
+        sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix="backup_bench_")
+    results = {}
+    try:
+        for fmt in FORMATS:
+            backup_times = []
+            for run in range(args.runs):
+                # Un répertoire par mesure : les noms de backup sont à la seconde près.
+                manager = PythonBackupManager(database_url, os.path.join(workdir, fmt, str(run)))
+                ok, elapsed = timed(manager.create_backup, "benchmark", fmt=fmt)
+                if not ok:
+                    print(f"❌ Échec backup {fmt}")
+                    sys.exit(1)
+                backup_times.append(elapsed)
+
+            latest = manager.list_backups()[0]['filename']
+            results[fmt] = {
+                "backup": min(backup_times),
+                "size": manager._backup_size(latest),
+            }
+            if args.restore:
+                ok, elapsed = timed(manager.restore_from_backup, latest)
+                if not ok:
+                    print(f"❌ Échec restauration {fmt}")
+                    sys.exit(1)
+                results[fmt]["restore"] = elapsed
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n📊 Meilleur temps sur {args.runs} mesure(s)")
+    print(f"{'format':<8} {'backup (s)':>11} {'restore (s)':>12} {'taille (KB)':>12}")
+    for fmt, result in results.items():
+        restore = f"{result['restore']:.2f}" if "restore" in result else "-"
+        print(f"{fmt:<8} {result['backup']:>11.2f} {restore:>12} {result['size'] / 1024:>12.1f}")
+    if results["copy"]["backup"]:
+        print(f"\n⚡ COPY : x{results['ndjson']['backup'] / results['copy']['backup']:.1f} en backup", end="")
+        if args.restore and results["copy"]["restore"]:
+            print(f", x{results['ndjson']['restore'] / results['copy']['restore']:.1f} en restauration")
+        else:
+            print()
+
+    log_summary()
+
+
+if __name__ == "__main__":
+    main()
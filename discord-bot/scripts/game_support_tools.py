@@ -22,6 +22,18 @@ variable is defined::
 
     $ export DATABASE_URL=postgres://...
     $ python3 game_support_tools.py
+    $ python3 game_support_tools.py --target kenji=0.35 --target surge=0.3 --create-indexes
+    $ python3 game_support_tools.py --incremental
+
+Loot tables are rebalanced concurrently on a small connection pool
+(``--workers``), with a single ``UPDATE ... RETURNING`` per table that
+reports the previous and new rates.
+
+Pet counts are aggregated once per pet table into an indexed temporary
+table shared by every quest table.  ``--incremental`` only recounts players
+whose pets changed since the previous run, using the timestamp column of the
+pet table and a watermark kept in ``grade_quest_watermarks``; quests created
+for players without pet changes are picked up by the next full run.
 
 The script is idempotent – running it multiple times will simply ensure the
 target data stays in the desired shape.
@@ -29,18 +41,32 @@ target data stays in the desired shape.
 
 from __future__ import annotations
 
+import argparse
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
-import psycopg2
 from psycopg2 import sql
-from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_tracing import TracingCursor, log_summary  # noqa: E402
+from schema_catalog import Table, get_catalog  # noqa: E402
+from structured_logging import configure_logging  # noqa: E402
 
 
 KENJI_TARGET_RATE = 0.35
 """Desired minimum drop rate for Kenji in matchmaking loot tables."""
 
+DEFAULT_TARGETS: Dict[str, float] = {"kenji": KENJI_TARGET_RATE}
+"""Minimum drop rates enforced when no ``--target`` is given."""
+
+POOL_SIZE = int(os.getenv("GAME_SUPPORT_POOL_SIZE", "4"))
+"""Connections (and loot tables processed concurrently) by default."""
+
 
 PLAYER_ID_CANDIDATES: Sequence[str] = (
     "player_id",
@@ -82,6 +108,16 @@ TARGET_COLUMN_CANDIDATES: Sequence[str] = (
     "objective",
 )
 
+WATERMARK_MARGIN = os.getenv("GRADE_QUEST_WATERMARK_MARGIN", "5 minutes")
+"""Overlap re-read by incremental runs, for pets committed after their timestamp."""
+
+TIMESTAMP_COLUMN_CANDIDATES: Sequence[str] = (
+    "updated_at",
+    "obtained_at",
+    "acquired_at",
+    "created_at",
+)
+
 TYPE_COLUMN_CANDIDATES: Sequence[str] = (
     "quest_type",
     "type",
@@ -99,6 +135,20 @@ class TableInfo:
     name: str
     columns: Dict[str, Dict[str, str]]
 
+    @classmethod
+    def from_catalog(cls, table: Table) -> "TableInfo":
+        return cls(
+            name=table.name,
+            columns={
+                column.name: {
+                    "data_type": column.type,
+                    "is_nullable": "NO" if column.not_null else "YES",
+                    "column_default": column.default,
+                }
+                for column in table.columns.values()
+            },
+        )
+
     def find_column(self, candidates: Iterable[str]) -> Optional[str]:
         """Return the first column that matches one of the candidates."""
 
@@ -108,106 +158,161 @@ class TableInfo:
         return None
 
 
-def get_connection() -> psycopg2.extensions.connection:
+@dataclass
+class RateUpdate:
+    """Rows of one loot table raised to the minimum rate of one brawler."""
+
+    table: str
+    brawler: str
+    rows: int
+    previous_rate: Optional[float]
+    new_rate: float
+
+
+def get_pool(size: int = POOL_SIZE) -> ThreadedConnectionPool:
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
         raise RuntimeError("DATABASE_URL environment variable is required")
 
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    return ThreadedConnectionPool(1, size, database_url, cursor_factory=TracingCursor)
 
 
-def fetch_table_names(cursor) -> List[str]:
-    cursor.execute(
-        """
-        SELECT table_name
-        FROM information_schema.tables
-        WHERE table_schema = 'public'
-        ORDER BY table_name
-        """
-    )
-    return [row["table_name"] for row in cursor.fetchall()]
+def fetch_table_infos(cursor) -> Dict[str, TableInfo]:
+    """Describe every public table from the shared, memoized catalog snapshot."""
 
+    catalog = get_catalog(cursor)
+    return {name: TableInfo.from_catalog(table) for name, table in sorted(catalog.tables.items())}
 
-def fetch_table_info(cursor, table_name: str) -> TableInfo:
-    cursor.execute(
-        """
-        SELECT column_name, data_type, is_nullable, column_default
-        FROM information_schema.columns
-        WHERE table_schema = 'public' AND table_name = %s
-        """,
-        (table_name,),
-    )
 
-    columns: Dict[str, Dict[str, str]] = {}
-    for row in cursor.fetchall():
-        columns[row["column_name"]] = {
-            "data_type": row["data_type"],
-            "is_nullable": row["is_nullable"],
-            "column_default": row["column_default"],
-        }
-    return TableInfo(name=table_name, columns=columns)
+def rate_candidates(table_infos: Dict[str, TableInfo]) -> List[Tuple[TableInfo, str, str]]:
+    """Return ``(table, name column, rate column)`` for every loot-like table."""
 
+    candidates = []
+    for info in table_infos.values():
+        name_column = info.find_column(NAME_COLUMN_CANDIDATES)
+        rate_column = info.find_column(RATE_COLUMN_CANDIDATES)
+        if name_column and rate_column:
+            candidates.append((info, name_column, rate_column))
+    return candidates
 
-def rebalance_kenji_drop_rate(conn) -> List[Tuple[str, Optional[float]]]:
-    """Bring Kenji's drop rate in line with expectations.
 
-    Returns a list of tuples describing the affected tables and the previous
-    rate (if it could be determined).
+def ensure_name_indexes(conn, candidates: Sequence[Tuple[TableInfo, str, str]]) -> None:
+    """Create ``LOWER(name)`` expression indexes used by the rate lookups.
+
+    ``CREATE INDEX CONCURRENTLY`` does not block the loot tables but cannot
+    run inside a transaction, so the connection is in autocommit meanwhile.
     """
 
-    updates: List[Tuple[str, Optional[float]]] = []
-    with conn.cursor() as cursor:
-        table_names = fetch_table_names(cursor)
-        table_infos = {name: fetch_table_info(cursor, name) for name in table_names}
+    conn.commit()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for info, name_column, _rate_column in candidates:
+                cursor.execute(
+                    sql.SQL(
+                        "CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} "
+                        "ON {table} (LOWER({name}))"
+                    ).format(
+                        index=sql.Identifier(f"{info.name}_lower_{name_column}_idx"[:63]),
+                        table=sql.Identifier(info.name),
+                        name=sql.Identifier(name_column),
+                    )
+                )
+    finally:
+        conn.autocommit = False
 
-        for table_name, info in table_infos.items():
-            name_column = info.find_column(NAME_COLUMN_CANDIDATES)
-            rate_column = info.find_column(RATE_COLUMN_CANDIDATES)
 
-            if not name_column or not rate_column:
-                continue
+def rebalance_table(
+    pool: ThreadedConnectionPool,
+    info: TableInfo,
+    name_column: str,
+    rate_column: str,
+    targets: Dict[str, float],
+) -> List[RateUpdate]:
+    """Raise every target brawler below its minimum rate in one statement.
 
-            # Check whether Kenji exists in the table.
+    The self-join on ``ctid`` exposes the rate before the update, so the
+    ``RETURNING`` clause reports old and new values in the same round trip.
+    Rows already at or above their target are not rewritten.
+    """
+
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cursor:
             cursor.execute(
                 sql.SQL(
-                    "SELECT {rate} FROM {table} "
-                    "WHERE LOWER({name}) = 'kenji'"
+                    """
+                    UPDATE {table} AS t
+                    SET {rate} = targets.rate
+                    FROM {table} AS old
+                    JOIN (VALUES {values}) AS targets(brawler, rate)
+                      ON LOWER(old.{name}) = targets.brawler
+                    WHERE t.ctid = old.ctid
+                      AND (old.{rate} IS NULL OR old.{rate} < targets.rate)
+                    RETURNING targets.brawler, old.{rate} AS previous_rate, t.{rate} AS new_rate
+                    """
                 ).format(
+                    table=sql.Identifier(info.name),
                     rate=sql.Identifier(rate_column),
-                    table=sql.Identifier(table_name),
                     name=sql.Identifier(name_column),
-                )
+                    values=sql.SQL(", ").join(sql.SQL("(%s, %s)") for _ in targets),
+                ),
+                [value for target in targets.items() for value in target],
             )
             rows = cursor.fetchall()
-            if not rows:
-                continue
-
-            current_rates = [row[rate_column] for row in rows if row[rate_column] is not None]
-            current_rate = (
-                sum(current_rates) / len(current_rates)
-                if current_rates
-                else None
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+    by_brawler: Dict[str, List[dict]] = {}
+    for row in rows:
+        by_brawler.setdefault(row["brawler"], []).append(row)
+
+    updates = []
+    for brawler, brawler_rows in by_brawler.items():
+        previous = [float(row["previous_rate"]) for row in brawler_rows if row["previous_rate"] is not None]
+        updates.append(
+            RateUpdate(
+                table=info.name,
+                brawler=brawler,
+                rows=len(brawler_rows),
+                previous_rate=sum(previous) / len(previous) if previous else None,
+                new_rate=float(brawler_rows[0]["new_rate"]),
             )
+        )
+    return updates
 
-            cursor.execute(
-                sql.SQL(
-                    "UPDATE {table} "
-                    "SET {rate} = GREATEST(%s, {rate}) "
-                    "WHERE LOWER({name}) = 'kenji'"
-                ).format(
-                    table=sql.Identifier(table_name),
-                    rate=sql.Identifier(rate_column),
-                    name=sql.Identifier(name_column),
-                ),
-                (KENJI_TARGET_RATE,),
-            )
 
-            if cursor.rowcount:
-                updates.append((table_name, current_rate))
+def rebalance_drop_rates(
+    pool: ThreadedConnectionPool,
+    targets: Dict[str, float],
+    create_indexes: bool = False,
+) -> List[RateUpdate]:
+    """Enforce minimum drop rates (``{brawler: rate}``) in every loot table.
 
-    if updates:
-        conn.commit()
+    Candidate tables are updated concurrently, each in its own transaction
+    on a pooled connection.
+    """
 
+    targets = {brawler.lower(): rate for brawler, rate in targets.items()}
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cursor:
+            candidates = rate_candidates(fetch_table_infos(cursor))
+        if create_indexes:
+            ensure_name_indexes(conn, candidates)
+    finally:
+        pool.putconn(conn)
+
+    updates: List[RateUpdate] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(pool.maxconn, len(candidates)))) as executor:
+        for table_updates in executor.map(
+            lambda candidate: rebalance_table(pool, *candidate, targets), candidates
+        ):
+            updates.extend(table_updates)
     return updates
 
 
@@ -229,64 +334,199 @@ def build_grade_condition(type_column: Optional[str], table_has_grade_in_name: b
     return None
 
 
-def fix_grade_quest_progress(conn) -> List[Tuple[str, str, int]]:
-    """Repair grade quest progression using pet inventory information."""
+@dataclass
+class PetCounts:
+    """Pet counts per player of one pet table, in a temporary table."""
+
+    table: str
+    players: int
+    incremental: bool
 
-    updates: List[Tuple[str, str, int]] = []
-    with conn.cursor() as cursor:
-        table_names = fetch_table_names(cursor)
-        table_infos = {name: fetch_table_info(cursor, name) for name in table_names}
-
-        quest_tables: List[TableInfo] = []
-        pet_tables: List[TableInfo] = []
-
-        for name, info in table_infos.items():
-            lowered = name.lower()
-
-            if "quest" in lowered:
-                quest_tables.append(info)
-            if "pet" in lowered or "egg" in lowered:
-                pet_tables.append(info)
-
-        for quest_info in quest_tables:
-            player_column = quest_info.find_column(PLAYER_ID_CANDIDATES)
-            progress_column = quest_info.find_column(PROGRESS_COLUMN_CANDIDATES)
-            target_column = quest_info.find_column(TARGET_COLUMN_CANDIDATES)
-            type_column = quest_info.find_column(TYPE_COLUMN_CANDIDATES)
-            grade_condition = build_grade_condition(
-                type_column, "grade" in quest_info.name.lower()
+
+def ensure_watermark_table(cursor) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS grade_quest_watermarks (
+            pet_table TEXT PRIMARY KEY,
+            watermark TEXT NOT NULL,
+            updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+        )
+        """
+    )
+
+
+def materialize_pet_counts(
+    cursor,
+    pet_info: TableInfo,
+    pet_player_column: str,
+    counts_table: str,
+    incremental: bool = False,
+) -> PetCounts:
+    """Aggregate ``pet_info`` per player into ``counts_table``.
+
+    The temporary table is indexed on ``player_id`` and analyzed so the quest
+    updates join it efficiently; it is dropped at commit.  In incremental
+    mode only players owning a pet stamped at or after the stored watermark
+    (minus :data:`WATERMARK_MARGIN`, for pets committed late) are counted --
+    all of their pets, not just the new ones.  Progress never decreases, so
+    removed pets need no recount.
+
+    The new watermark is the newest timestamp seen by the counting statement
+    itself, so no pet can fall between the two.
+    """
+
+    timestamp_column = pet_info.find_column(TIMESTAMP_COLUMN_CANDIDATES)
+    since = None
+    if timestamp_column:
+        ensure_watermark_table(cursor)
+        if incremental:
+            cursor.execute(
+                "SELECT watermark FROM grade_quest_watermarks WHERE pet_table = %s",
+                (pet_info.name,),
             )
+            row = cursor.fetchone()
+            since = row["watermark"] if row else None
+
+    changed_players = sql.SQL("")
+    params: Tuple = ()
+    if since is not None:
+        changed_players = sql.SQL(
+            "WHERE {player} IN ("
+            "SELECT {player} FROM {table} "
+            "WHERE {ts} >= CAST(%s AS {ts_type}) - CAST(%s AS interval))"
+        ).format(
+            player=sql.Identifier(pet_player_column),
+            table=sql.Identifier(pet_info.name),
+            ts=sql.Identifier(timestamp_column),
+            ts_type=sql.SQL(pet_info.columns[timestamp_column]["data_type"]),
+        )
+        params = (since, WATERMARK_MARGIN)
+
+    cursor.execute(
+        sql.SQL(
+            """
+            CREATE TEMP TABLE {counts} ON COMMIT DROP AS
+            SELECT {player} AS player_id, COUNT(*) AS pet_count, {last_pet} AS last_pet_at
+            FROM {table}
+            {changed_players}
+            GROUP BY {player}
+            """
+        ).format(
+            counts=sql.Identifier(counts_table),
+            player=sql.Identifier(pet_player_column),
+            last_pet=(
+                sql.SQL("MAX({})").format(sql.Identifier(timestamp_column))
+                if timestamp_column
+                else sql.SQL("NULL")
+            ),
+            table=sql.Identifier(pet_info.name),
+            changed_players=changed_players,
+        ),
+        params,
+    )
+    players = cursor.rowcount
+    cursor.execute(
+        sql.SQL("CREATE INDEX ON {counts} (player_id)").format(counts=sql.Identifier(counts_table))
+    )
+    cursor.execute(sql.SQL("ANALYZE {counts}").format(counts=sql.Identifier(counts_table)))
+
+    if timestamp_column:
+        cursor.execute(
+            sql.SQL(
+                """
+                INSERT INTO grade_quest_watermarks (pet_table, watermark)
+                SELECT %s, MAX(last_pet_at)::text FROM {counts}
+                HAVING MAX(last_pet_at) IS NOT NULL
+                ON CONFLICT (pet_table) DO UPDATE
+                SET watermark = EXCLUDED.watermark, updated_at = NOW()
+                """
+            ).format(counts=sql.Identifier(counts_table)),
+            (pet_info.name,),
+        )
+    return PetCounts(table=counts_table, players=players, incremental=since is not None)
+
+
+def select_pet_table(
+    player_column: str, pet_tables: Sequence[TableInfo]
+) -> Optional[Tuple[TableInfo, str]]:
+    """Pick the pet table (and its player column) feeding a quest table.
+
+    The choice depends on the schema only, so full and incremental runs
+    always read the same counts: the first pet table, by name, with a player
+    column.
+    """
+
+    for pet_info in sorted(pet_tables, key=lambda info: info.name):
+        pet_player_column = pet_info.find_column((player_column,) + tuple(PLAYER_ID_CANDIDATES))
+        if pet_player_column:
+            return pet_info, pet_player_column
+    return None
 
-            if not (player_column and progress_column and target_column and grade_condition):
-                continue
 
-            for pet_info in pet_tables:
-                pet_player_column = pet_info.find_column(
-                    (player_column,) + tuple(PLAYER_ID_CANDIDATES)
+def fix_grade_quest_progress(conn, incremental: bool = False) -> List[Tuple[str, str, int]]:
+    """Repair grade quest progression using pet inventory information.
+
+    Pet counts are materialized at most once per pet table and player column
+    (see :func:`materialize_pet_counts`) and reused across quest tables.
+    """
+
+    updates: List[Tuple[str, str, int]] = []
+    pet_counts: Dict[Tuple[str, str], PetCounts] = {}
+    try:
+        with conn.cursor() as cursor:
+            table_infos = fetch_table_infos(cursor)
+
+            quest_tables: List[TableInfo] = []
+            pet_tables: List[TableInfo] = []
+
+            for name, info in table_infos.items():
+                lowered = name.lower()
+
+                if "quest" in lowered:
+                    quest_tables.append(info)
+                if "pet" in lowered or "egg" in lowered:
+                    pet_tables.append(info)
+
+            for quest_info in quest_tables:
+                player_column = quest_info.find_column(PLAYER_ID_CANDIDATES)
+                progress_column = quest_info.find_column(PROGRESS_COLUMN_CANDIDATES)
+                target_column = quest_info.find_column(TARGET_COLUMN_CANDIDATES)
+                type_column = quest_info.find_column(TYPE_COLUMN_CANDIDATES)
+                grade_condition = build_grade_condition(
+                    type_column, "grade" in quest_info.name.lower()
                 )
 
-                if not pet_player_column:
+                if not (player_column and progress_column and target_column and grade_condition):
                     continue
 
+                source = select_pet_table(player_column, pet_tables)
+                if source is None:
+                    continue
+                pet_info, pet_player_column = source
+
+                counts_key = (pet_info.name, pet_player_column)
+                if counts_key not in pet_counts:
+                    pet_counts[counts_key] = materialize_pet_counts(
+                        cursor,
+                        pet_info,
+                        pet_player_column,
+                        f"pet_counts_{len(pet_counts)}",
+                        incremental=incremental,
+                    )
+
                 update_sql = sql.SQL(
                     """
-                    WITH pet_counts AS (
-                        SELECT {pet_player} AS player_id, COUNT(*) AS pet_count
-                        FROM {pet_table}
-                        GROUP BY {pet_player}
-                    )
                     UPDATE {quest_table} AS q
                     SET {progress} = GREATEST(
                         COALESCE({progress}, 0),
                         LEAST({target}, pet_counts.pet_count)
                     )
-                    FROM pet_counts
+                    FROM {pet_counts} AS pet_counts
                     WHERE q.{quest_player} = pet_counts.player_id
                       AND {grade_condition}
                     """
                 ).format(
-                    pet_player=sql.Identifier(pet_player_column),
-                    pet_table=sql.Identifier(pet_info.name),
+                    pet_counts=sql.Identifier(pet_counts[counts_key].table),
                     quest_table=sql.Identifier(quest_info.name),
                     progress=sql.Identifier(progress_column),
                     target=sql.Identifier(target_column),
@@ -297,32 +537,83 @@ def fix_grade_quest_progress(conn) -> List[Tuple[str, str, int]]:
                 cursor.execute(update_sql)
                 if cursor.rowcount:
                     updates.append((quest_info.name, pet_info.name, cursor.rowcount))
-                    break  # Use the first matching pet table for each quest table.
 
-    if updates:
+        # Commit even without updates: it stores the watermarks and drops
+        # the temporary count tables.
         conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
     return updates
 
 
-def main() -> None:
-    conn = get_connection()
+def parse_target(value: str) -> Tuple[str, float]:
+    """Parse ``BRAWLER=RATE`` (e.g. ``kenji=0.35``)."""
+
+    brawler, separator, rate = value.partition("=")
     try:
-        kenji_updates = rebalance_kenji_drop_rate(conn)
-        quest_updates = fix_grade_quest_progress(conn)
-
-        if kenji_updates:
-            print("🐱 Kenji drop rate adjustments:")
-            for table_name, previous_rate in kenji_updates:
-                if previous_rate is None:
-                    print(f"  • {table_name}: now at ≥ {KENJI_TARGET_RATE:.2f} (previous unknown)")
-                else:
-                    print(
-                        f"  • {table_name}: {previous_rate:.2f} → "
-                        f"{KENJI_TARGET_RATE:.2f} (minimum enforced)"
-                    )
+        if not brawler or not separator:
+            raise ValueError
+        return brawler.strip().lower(), float(rate)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected BRAWLER=RATE, got {value!r}") from None
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Fix loot drop rates and grade quest progress.")
+    parser.add_argument(
+        "--target",
+        action="append",
+        type=parse_target,
+        metavar="BRAWLER=RATE",
+        help=f"minimum drop rate to enforce, repeatable (default: kenji={KENJI_TARGET_RATE})",
+    )
+    parser.add_argument(
+        "--create-indexes",
+        action="store_true",
+        help="create LOWER(name) expression indexes on the loot tables first",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=POOL_SIZE,
+        help=f"loot tables processed concurrently (default: {POOL_SIZE})",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only recount pets of players whose inventory changed since the last run",
+    )
+    args = parser.parse_args(argv)
+    targets = dict(args.target) if args.target else dict(DEFAULT_TARGETS)
+
+    pool = get_pool(max(1, args.workers))
+    try:
+        rate_updates = rebalance_drop_rates(pool, targets, create_indexes=args.create_indexes)
+        conn = pool.getconn()
+        try:
+            quest_updates = fix_grade_quest_progress(conn, incremental=args.incremental)
+        finally:
+            pool.putconn(conn)
+
+        if rate_updates:
+            print("🐱 Drop rate adjustments:")
+            for update in rate_updates:
+                previous = (
+                    "previous unknown"
+                    if update.previous_rate is None
+                    else f"{update.previous_rate:.2f}"
+                )
+                print(
+                    f"  • {update.table} / {update.brawler}: {previous} → "
+                    f"{update.new_rate:.2f} ({update.rows} ligne(s), minimum enforced)"
+                )
         else:
-            print("ℹ️ Aucun tableau loot avec Kenji n'a été trouvé.")
+            print(
+                "ℹ️ Aucun tableau loot à corriger pour "
+                f"{', '.join(f'{name} ≥ {rate:.2f}' for name, rate in targets.items())}."
+            )
 
         if quest_updates:
             print("🐣 Grade quest progression repaired:")
@@ -338,8 +629,10 @@ def main() -> None:
             )
 
     finally:
-        conn.close()
+        pool.closeall()
+        log_summary()
 
 
 if __name__ == "__main__":
+    configure_logging()
     main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Vérifie l'intégrité de backups sans les restaurer.
+
+Usage :
+    python3 scripts/verify_backup.py                       # dernier backup
+    python3 scripts/verify_backup.py supabase_backup_<date>.copy [...]
+    python3 scripts/verify_backup.py --db                  # + comparaison à la base (DATABASE_URL)
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backup import PythonBackupManager  # noqa: E402
+from structured_logging import configure_logging  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("backups", nargs="*", help="noms des backups (défaut : le plus récent)")
+    parser.add_argument("--dir", default="/tmp/backups", help="répertoire des backups")
+    parser.add_argument("--db", action="store_true", help="compare aussi les empreintes SQL à la base")
+    args = parser.parse_args()
+
+    configure_logging()
+    database_url = os.getenv("DATABASE_URL")
+    if args.db and not database_url:
+        print("❌ DATABASE_URL manquant")
+        sys.exit(1)
+
+    manager = PythonBackupManager(database_url, args.dir)
+    backups = args.backups
+    if not backups:
+        available = manager.list_backups()
+        if not available:
+            print(f"❌ Aucun backup dans {args.dir}")
+            sys.exit(1)
+        backups = [available[0]['filename']]
+
+    failed = [
+        name for name in backups if not manager.verify_backup(name, against_db=args.db)['ok']
+    ]
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,378 +3,677 @@
 
 from __future__ import annotations
 
+import argparse
+import ast
 import datetime as dt
+import hashlib
+import inspect
+import logging
 import os
 import subprocess
 import sys
-from typing import Dict, Optional
+import textwrap
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 from psycopg2 import sql
-from psycopg2.extras import RealDictCursor
+
+from backfill import Backfill, execute_ddl, run_backfill
+from db_tracing import connect
+from schema_catalog import (
+    Catalog,
+    Column,
+    ColumnSpec,
+    Table,
+    TablePlan,
+    TableSpec,
+    null_fill_clauses,
+    plan_table,
+)
+from structured_logging import configure_logging
+
+logger = logging.getLogger("smart_migration")
 
 
 def log(message: str) -> None:
-    print(f"[smart_migration] {message}")
+    logger.info(message)
+
+
+BACKUP_JOBS = int(os.getenv("MIGRATION_BACKUP_JOBS", str(min(4, os.cpu_count() or 1))))
+BACKUP_COMPRESSION = int(os.getenv("MIGRATION_BACKUP_COMPRESSION", "6"))
+
+
+def _directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _dirs, files in os.walk(path)
+        for name in files
+    )
+
 
+def create_backup(
+    database_url: str, jobs: int = BACKUP_JOBS, compression: int = BACKUP_COMPRESSION
+) -> None:
+    """Create a timestamped directory-format dump using parallel pg_dump.
 
-def create_backup(database_url: str) -> None:
-    """Create a timestamped SQL backup using pg_dump."""
+    Restore with ``pg_restore -j N -d DATABASE_URL db_backup_<timestamp>``.
+    """
     timestamp = dt.datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    backup_file = f"db_backup_{timestamp}.sql"
-    log(f"Creating backup at {backup_file} ...")
+    backup_dir = f"db_backup_{timestamp}"
+    log(f"Creating backup at {backup_dir}/ ({jobs} jobs, compression {compression}) ...")
+    started = time.perf_counter()
     try:
         result = subprocess.run(
-            ["pg_dump", database_url, "-f", backup_file],
+            [
+                "pg_dump",
+                "--format=directory",
+                f"--jobs={jobs}",
+                f"--compress={compression}",
+                "--file",
+                backup_dir,
+                database_url,
+            ],
             capture_output=True,
             text=True,
             check=True,
         )
         if result.stderr:
             log(f"pg_dump warnings: {result.stderr.strip()}")
-        log("Backup completed successfully.")
     except FileNotFoundError:
         log("WARNING: pg_dump not found. Skipping automatic backup.")
+        return
     except subprocess.CalledProcessError as exc:
         log("ERROR: pg_dump failed. Aborting migration.")
         log(exc.stderr.strip())
         raise
 
-
-def get_primary_key_column(cursor, table_name: str) -> Optional[str]:
-    cursor.execute(
-        """
-        SELECT kcu.column_name
-        FROM information_schema.table_constraints tc
-        JOIN information_schema.key_column_usage kcu
-            ON tc.constraint_name = kcu.constraint_name
-            AND tc.table_schema = kcu.table_schema
-        WHERE tc.constraint_type = 'PRIMARY KEY'
-          AND tc.table_schema = 'public'
-          AND tc.table_name = %s
-        ORDER BY kcu.ordinal_position
-        """,
-        (table_name,),
+    elapsed = time.perf_counter() - started
+    size = _directory_size(backup_dir)
+    logger.info(
+        "Backup completed: %.1f MiB in %.1fs (%.1f MiB/s)",
+        size / 2**20,
+        elapsed,
+        size / 2**20 / elapsed if elapsed else 0.0,
+        extra={"event": "backup_created", "duration_ms": round(elapsed * 1000, 1)},
     )
-    rows = cursor.fetchall()
-    if not rows:
-        return None
-    return rows[0]["column_name"]
+
+
+# ----------------------------------------------------------------------------
+# Declarative schema
+# ----------------------------------------------------------------------------
+#
+# The tables the bot owns are described once below.  Each run loads a single
+# ``pg_catalog`` snapshot (see schema_catalog.py), diffs it against these specs
+# and issues at most one ``UPDATE`` and one combined ``ALTER TABLE`` per table.
+
+TIMESTAMP = "timestamp without time zone"
+
+PLAYERS = TableSpec(
+    "players",
+    (
+        ColumnSpec("discord_id", "text", not_null=True),
+        ColumnSpec("name", "text", not_null=True, default="'Unknown'"),
+        ColumnSpec("division", "text", not_null=True, default="'division2'"),
+        ColumnSpec("solo_elo", "integer", not_null=True, default="1000"),
+        ColumnSpec("solo_wins", "integer", not_null=True, default="0"),
+        ColumnSpec("solo_losses", "integer", not_null=True, default="0"),
+        ColumnSpec("created_at", TIMESTAMP, default="NOW()"),
+    ),
+    primary_key=("discord_id",),
+)
+
+SOLO_MATCHES = TableSpec(
+    "solo_matches",
+    (
+        ColumnSpec("id", "integer", serial=True),
+        ColumnSpec("division", "text", not_null=True),
+        ColumnSpec("team1_ids", "text", not_null=True),
+        ColumnSpec("team2_ids", "text", not_null=True),
+        ColumnSpec("room_code", "text", not_null=True),
+        ColumnSpec("status", "text", not_null=True, default="'pending'"),
+        ColumnSpec("winner", "text"),
+        ColumnSpec("created_at", TIMESTAMP, default="NOW()"),
+        ColumnSpec("completed_at", TIMESTAMP),
+    ),
+    primary_key=("id",),
+)
+
+LEGACY_PLAYER_STATS = {
+    "elo": "solo_elo",
+    "wins": "solo_wins",
+    "losses": "solo_losses",
+}
 
 
 def table_exists(cursor, table_name: str) -> bool:
-    cursor.execute(
-        """
-        SELECT EXISTS (
-            SELECT 1 FROM information_schema.tables
-            WHERE table_schema = 'public' AND table_name = %s
-        )
-        """,
-        (table_name,),
-    )
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS exists", (f"public.{table_name}",))
     return cursor.fetchone()["exists"]
 
 
-def column_info(cursor, table_name: str) -> Dict[str, Dict[str, str]]:
-    cursor.execute(
-        """
-        SELECT column_name, data_type, is_nullable, column_default
-        FROM information_schema.columns
-        WHERE table_schema = 'public' AND table_name = %s
-        """,
-        (table_name,),
-    )
-    info: Dict[str, Dict[str, str]] = {}
-    for row in cursor.fetchall():
-        info[row["column_name"]] = {
-            "data_type": row["data_type"],
-            "is_nullable": row["is_nullable"],
-            "column_default": row["column_default"],
-        }
-    return info
-
-
-def ensure_players_schema(cursor) -> None:
-    if not table_exists(cursor, "players"):
-        log("Table 'players' does not exist. Creating with expected schema ...")
-        cursor.execute(
-            """
-            CREATE TABLE players (
-                discord_id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                division TEXT NOT NULL DEFAULT 'division2',
-                solo_elo INTEGER NOT NULL DEFAULT 1000,
-                solo_wins INTEGER NOT NULL DEFAULT 0,
-                solo_losses INTEGER NOT NULL DEFAULT 0,
-                created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()
-            )
-            """
-        )
-        return
+def _execute(cursor, statement, dry_run: bool) -> None:
+    """Run a DDL ``statement`` with a lock timeout, or print it for a dry run."""
+    if dry_run:
+        text = statement.as_string(cursor.connection) if hasattr(statement, "as_string") else statement
+        print(f"{' '.join(text.split())};")
+    else:
+        execute_ddl(cursor, statement)
 
-    log("Ensuring 'players' table schema ...")
-    info = column_info(cursor, "players")
-    pk_column = get_primary_key_column(cursor, "players")
-    log(f"Current primary key column: {pk_column!r}")
 
-    if pk_column != "discord_id":
-        log("Adjusting primary key to be 'discord_id' ...")
-        if "discord_id" in info:
-            log("Column 'discord_id' already exists but is not primary key.")
-        else:
-            if pk_column is None:
-                log("No primary key detected. Attempting to infer identifier column ...")
-                candidate = None
-                for name in ("discord_id", "user_id", "id"):
-                    if name in info:
-                        candidate = name
-                        break
-                if candidate is None and info:
-                    candidate = next(iter(info))
-                pk_column = candidate
-            if pk_column is None:
-                raise RuntimeError("Unable to determine identifier column for players table")
-            log(f"Using column '{pk_column}' to populate new discord_id column.")
-            cursor.execute("ALTER TABLE players ADD COLUMN discord_id TEXT")
-            cursor.execute(
-                sql.SQL("""
-                    UPDATE players
-                    SET discord_id = {pk}::text
-                """).format(pk=sql.Identifier(pk_column))
-            )
-        # Ensure discord_id is not null
+def _batch_key(table: Optional[Table]) -> Optional[str]:
+    columns = table.primary_key_columns if table else ()
+    return columns[0] if len(columns) == 1 else None
+
+
+def apply_plan(cursor, plan: TablePlan, key: Optional[str] = None, dry_run: bool = False) -> None:
+    if plan.fills:
+        assignments, predicate = null_fill_clauses(plan.fills)
+        run_backfill(
+            cursor,
+            Backfill(f"{plan.table}.fill_nulls", plan.table, assignments, predicate, key),
+            dry_run=dry_run,
+        )
+    for statement in plan.statements:
+        _execute(cursor, statement, dry_run)
+
+
+def _prepare_legacy_players(cursor, table: Table, dry_run: bool) -> None:
+    """Data-moving steps the declarative plan cannot express.
+
+    ``table`` is updated in place so the plan computed afterwards reflects
+    the columns these steps add, rename or drop.
+    """
+    columns = table.columns
+    pk_columns = table.primary_key_columns
+    key = _batch_key(table)
+    log(f"Current primary key: {pk_columns!r}")
+
+    if pk_columns != ("discord_id",) and "discord_id" not in columns:
+        source = pk_columns[0] if pk_columns else None
+        if source is None:
+            log("No primary key detected. Attempting to infer identifier column ...")
+            source = next((name for name in ("user_id", "id") if name in columns), None)
+            if source is None and columns:
+                source = next(iter(columns))
+        if source is None:
+            raise RuntimeError("Unable to determine identifier column for players table")
+        log(f"Using column '{source}' to populate new discord_id column.")
+        _execute(cursor, "ALTER TABLE players ADD COLUMN discord_id TEXT", dry_run)
+        columns["discord_id"] = Column("discord_id", "text", False, None)
+        run_backfill(
+            cursor,
+            Backfill(
+                "players.discord_id",
+                "players",
+                sql.SQL("discord_id = {}::text").format(sql.Identifier(source)),
+                sql.SQL("discord_id IS NULL AND {} IS NOT NULL").format(sql.Identifier(source)),
+                key,
+            ),
+            dry_run=dry_run,
+        )
+
+    if pk_columns != ("discord_id",) and not dry_run:
         cursor.execute(
             "SELECT COUNT(*) FROM players WHERE discord_id IS NULL OR discord_id = ''"
         )
-        null_count = cursor.fetchone()["count"]
-        if null_count:
+        if cursor.fetchone()["count"]:
             raise RuntimeError(
                 "Cannot set discord_id as primary key because some rows are missing values."
             )
-        # Drop existing primary key if present
-        if pk_column:
-            cursor.execute(
-                """
-                SELECT constraint_name
-                FROM information_schema.table_constraints
-                WHERE table_schema = 'public' AND table_name = 'players' AND constraint_type = 'PRIMARY KEY'
-                """
-            )
-            row = cursor.fetchone()
-            if row:
-                constraint_name = row["constraint_name"]
-                cursor.execute(
-                    sql.SQL("ALTER TABLE players DROP CONSTRAINT {}" ).format(
-                        sql.Identifier(constraint_name)
-                    )
-                )
-        # Ensure discord_id column type text
-        cursor.execute(
-            "ALTER TABLE players ALTER COLUMN discord_id TYPE TEXT USING discord_id::text"
-        )
-        cursor.execute("ALTER TABLE players ALTER COLUMN discord_id SET NOT NULL")
-        cursor.execute("ALTER TABLE players ADD PRIMARY KEY (discord_id)")
-    else:
-        # Ensure column type text
-        cursor.execute(
-            "ALTER TABLE players ALTER COLUMN discord_id TYPE TEXT USING discord_id::text"
-        )
-        cursor.execute("ALTER TABLE players ALTER COLUMN discord_id SET NOT NULL")
 
-    # Handle legacy display_name column
-    if "display_name" in info:
-        if "name" not in info:
+    if "display_name" in columns:
+        if "name" not in columns:
             log("Renaming legacy column 'display_name' to 'name'.")
-            cursor.execute("ALTER TABLE players RENAME COLUMN display_name TO name")
-            info["name"] = info.pop("display_name")
+            _execute(cursor, "ALTER TABLE players RENAME COLUMN display_name TO name", dry_run)
+            columns["name"] = columns.pop("display_name")
+            columns["name"].name = "name"
         else:
             log("Migrating values from legacy column 'display_name' into 'name'.")
-            cursor.execute(
-                """
-                UPDATE players
-                SET name = display_name
-                WHERE (name IS NULL OR name = '') AND display_name IS NOT NULL
-                """
+            run_backfill(
+                cursor,
+                Backfill(
+                    "players.name_from_display_name",
+                    "players",
+                    sql.SQL("name = display_name"),
+                    sql.SQL("(name IS NULL OR name = '') AND display_name <> ''"),
+                    key,
+                ),
+                dry_run=dry_run,
             )
-            cursor.execute("ALTER TABLE players DROP COLUMN display_name")
-            info.pop("display_name", None)
+            _execute(cursor, "ALTER TABLE players DROP COLUMN display_name", dry_run)
+            columns.pop("display_name")
+
 
-    # Ensure name column exists
-    if "name" not in info:
-        log("Adding missing column 'name'.")
-        cursor.execute("ALTER TABLE players ADD COLUMN name TEXT NOT NULL DEFAULT 'Unknown'")
+def ensure_players_schema(cursor, catalog: Optional[Catalog] = None, dry_run: bool = False) -> None:
+    catalog = catalog or Catalog.load(cursor)
+    table = catalog.table("players")
+    if table is None:
+        log("Table 'players' does not exist. Creating with expected schema ...")
     else:
-        cursor.execute("ALTER TABLE players ALTER COLUMN name SET NOT NULL")
+        log("Ensuring 'players' table schema ...")
+        _prepare_legacy_players(cursor, table, dry_run)
 
-    # Ensure division column
-    if "division" not in info:
-        log("Adding missing column 'division'.")
-        cursor.execute(
-            "ALTER TABLE players ADD COLUMN division TEXT NOT NULL DEFAULT 'division2'"
-        )
+    apply_plan(cursor, plan_table(PLAYERS, table), _batch_key(table), dry_run)
+
+    if table is not None:
+        _backfill_legacy_player_stats(cursor, table, dry_run)
+
+
+def _backfill_legacy_player_stats(cursor, table: Table, dry_run: bool) -> None:
+    """Copy ``elo``/``wins``/``losses`` into their ``solo_*`` columns."""
+    # The primary key is discord_id from here on.
+    for old_col, new_col in LEGACY_PLAYER_STATS.items():
+        if old_col in table.columns:
+            log(f"Migrating data from '{old_col}' to '{new_col}'.")
+            run_backfill(
+                cursor,
+                Backfill(
+                    f"players.{new_col}_from_{old_col}",
+                    "players",
+                    sql.SQL("{new_col} = {old_col}").format(
+                        new_col=sql.Identifier(new_col), old_col=sql.Identifier(old_col)
+                    ),
+                    sql.SQL("{old_col} IS NOT NULL AND {new_col} IS DISTINCT FROM {old_col}").format(
+                        new_col=sql.Identifier(new_col), old_col=sql.Identifier(old_col)
+                    ),
+                    "discord_id",
+                ),
+                dry_run=dry_run,
+            )
+
+
+def ensure_solo_matches_table(
+    cursor, catalog: Optional[Catalog] = None, dry_run: bool = False
+) -> None:
+    catalog = catalog or Catalog.load(cursor)
+    table = catalog.table("solo_matches")
+    if table is None:
+        log("Creating 'solo_matches' table ...")
     else:
+        log("Table 'solo_matches' already exists. Ensuring required columns ...")
+    apply_plan(cursor, plan_table(SOLO_MATCHES, table), _batch_key(table), dry_run)
+
+
+# ----------------------------------------------------------------------------
+# Versioned migrations
+# ----------------------------------------------------------------------------
+#
+# Applied migrations are recorded in ``schema_version`` with a checksum of
+# the migration's syntax tree plus the specs and constants it declares (see
+# Migration.checksum), so reformatting is harmless.  A startup with nothing
+# pending costs a single read of that table and no DDL.  Never edit a
+# migration once it has shipped -- including the specs it declares, such as
+# PLAYERS: add a new migration instead (the checksum check refuses to start on
+# an edited migration).  Shared helpers are outside the checksum: a fix to
+# them must stay safe to run on databases that already applied the
+# migration, and a change that has to reach those databases needs a new
+# migration.
+
+SCHEMA_VERSION_LOCK_ID = 7_201_436_001
+
+
+def _canonical(node: Any) -> str:
+    """Serialise an AST without positions, empty fields or ``None`` fields.
+
+    Skipping empty fields keeps the result stable across Python versions that
+    add optional fields (``type_params``, ``kind``...).
+    """
+    if isinstance(node, ast.AST):
+        fields = ", ".join(
+            f"{name}={_canonical(value)}"
+            for name, value in ast.iter_fields(node)
+            if value is not None and value != []
+        )
+        return f"{type(node).__name__}({fields})"
+    if isinstance(node, list):
+        return "[" + ", ".join(_canonical(item) for item in node) + "]"
+    return repr(node)
+
+
+def code_fingerprint(function: Callable[..., Any]) -> str:
+    """Formatting-insensitive description of ``function``'s code (docstring excluded)."""
+    node = ast.parse(textwrap.dedent(inspect.getsource(function))).body[0]
+    if ast.get_docstring(node) is not None:
+        node.body = node.body[1:]
+    return _canonical(node)
+
+
+@dataclass(frozen=True)
+class Migration:
+    """A schema change, applied once and recorded in ``schema_version``.
+
+    The checksum covers ``apply`` itself and ``specs`` (the specs or
+    constants it reads).  Shared helpers it calls (backfill.py,
+    ``_prepare_legacy_players``...) are not part of it: they can be fixed
+    without invalidating applied migrations, and are tested on their own.
+    """
+
+    version: int
+    name: str
+    apply: Callable[[Any], None]
+    specs: Tuple[Any, ...] = ()
+
+    @property
+    def checksum(self) -> str:
+        digest = hashlib.sha256(code_fingerprint(self.apply).encode("utf-8"))
+        for spec in self.specs:
+            digest.update(repr(spec).encode("utf-8"))
+        return digest.hexdigest()
+
+
+def _migration_0001_players(cursor) -> None:
+    """Bring ``players`` to the solo schema (covers scripts/fix_display_name.py)."""
+    table = Catalog.load(cursor).table("players")
+    if table is not None:
+        _prepare_legacy_players(cursor, table, dry_run=False)
+    apply_plan(cursor, plan_table(PLAYERS, table), _batch_key(table))
+    if table is not None:
+        _backfill_legacy_player_stats(cursor, table, dry_run=False)
+
+
+def _migration_0002_solo_matches(cursor) -> None:
+    table = Catalog.load(cursor).table("solo_matches")
+    apply_plan(cursor, plan_table(SOLO_MATCHES, table), _batch_key(table))
+
+
+LEGACY_MODE_TYPES = "('solo', 'trio', 'chaos')"
+LEGACY_PLAYER_COLUMNS = (
+    ("trio_elo", "INTEGER DEFAULT 1000"),
+    ("trio_wins", "INTEGER DEFAULT 0"),
+    ("trio_losses", "INTEGER DEFAULT 0"),
+    ("chaos_elo", "INTEGER DEFAULT 1000"),
+    ("chaos_wins", "INTEGER DEFAULT 0"),
+    ("chaos_losses", "INTEGER DEFAULT 0"),
+)
+LEGACY_TYPED_TABLES = (
+    ("dodges", "dodge_type"),
+    ("match_history", "match_type"),
+    ("match_messages", "match_type"),
+)
+
+
+def _migration_0003_legacy_modes(cursor) -> None:
+    """Fold scripts/migration_fix.py, db_migration_fix.py and emergency_db_fix.py.
+
+    Only databases that were used by the former solo/trio/chaos bot (they
+    have a ``lobbies`` table) are touched.
+    """
+    if not table_exists(cursor, "lobbies"):
+        log("No legacy 'lobbies' table, skipping multi-mode migration.")
+        return
+
+    for column, definition in LEGACY_PLAYER_COLUMNS:
         cursor.execute(
-            "ALTER TABLE players ALTER COLUMN division SET DEFAULT 'division2'"
+            sql.SQL("ALTER TABLE players ADD COLUMN IF NOT EXISTS {} {}").format(
+                sql.Identifier(column), sql.SQL(definition)
+            )
         )
-        cursor.execute("UPDATE players SET division = 'division2' WHERE division IS NULL")
-        cursor.execute("ALTER TABLE players ALTER COLUMN division SET NOT NULL")
 
-    # Ensure solo_elo column
-    if "solo_elo" not in info:
-        log("Adding missing column 'solo_elo'.")
+    cursor.execute("ALTER TABLE lobbies ADD COLUMN IF NOT EXISTS lobby_type TEXT DEFAULT 'solo'")
+    cursor.execute("ALTER TABLE lobbies ADD COLUMN IF NOT EXISTS teams TEXT DEFAULT ''")
+    cursor.execute("UPDATE lobbies SET lobby_type = 'solo' WHERE lobby_type IS NULL OR lobby_type = ''")
+    cursor.execute("UPDATE lobbies SET teams = '' WHERE teams IS NULL")
+    cursor.execute(f"DELETE FROM lobbies WHERE lobby_type NOT IN {LEGACY_MODE_TYPES}")
+    cursor.execute("ALTER TABLE lobbies DROP CONSTRAINT IF EXISTS lobbies_lobby_type_check")
+    cursor.execute(
+        "ALTER TABLE lobbies ADD CONSTRAINT lobbies_lobby_type_check "
+        f"CHECK (lobby_type IN {LEGACY_MODE_TYPES})"
+    )
+
+    for table, column in LEGACY_TYPED_TABLES:
+        if not table_exists(cursor, table):
+            continue
+        constraint = f"{table}_{column}_check"
         cursor.execute(
-            "ALTER TABLE players ADD COLUMN solo_elo INTEGER NOT NULL DEFAULT 1000"
+            sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS {} TEXT DEFAULT 'solo'").format(
+                sql.Identifier(table), sql.Identifier(column)
+            )
         )
-    else:
         cursor.execute(
-            "ALTER TABLE players ALTER COLUMN solo_elo SET DEFAULT 1000"
+            sql.SQL("UPDATE {table} SET {column} = 'solo' WHERE {column} IS NULL").format(
+                table=sql.Identifier(table), column=sql.Identifier(column)
+            )
         )
-        cursor.execute("UPDATE players SET solo_elo = 1000 WHERE solo_elo IS NULL")
-        cursor.execute("ALTER TABLE players ALTER COLUMN solo_elo SET NOT NULL")
-
-    # Ensure solo_wins column
-    if "solo_wins" not in info:
-        log("Adding missing column 'solo_wins'.")
         cursor.execute(
-            "ALTER TABLE players ADD COLUMN solo_wins INTEGER NOT NULL DEFAULT 0"
+            sql.SQL("ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}").format(
+                sql.Identifier(table), sql.Identifier(constraint)
+            )
         )
-    else:
         cursor.execute(
-            "ALTER TABLE players ALTER COLUMN solo_wins SET DEFAULT 0"
+            sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} CHECK ({} IN {})").format(
+                sql.Identifier(table),
+                sql.Identifier(constraint),
+                sql.Identifier(column),
+                sql.SQL(LEGACY_MODE_TYPES),
+            )
         )
-        cursor.execute("UPDATE players SET solo_wins = 0 WHERE solo_wins IS NULL")
-        cursor.execute("ALTER TABLE players ALTER COLUMN solo_wins SET NOT NULL")
 
-    # Ensure solo_losses column
-    if "solo_losses" not in info:
-        log("Adding missing column 'solo_losses'.")
+    if table_exists(cursor, "lobby_cooldown"):
         cursor.execute(
-            "ALTER TABLE players ADD COLUMN solo_losses INTEGER NOT NULL DEFAULT 0"
+            "ALTER TABLE lobby_cooldown DROP CONSTRAINT IF EXISTS lobby_cooldown_lobby_type_check"
         )
-    else:
         cursor.execute(
-            "ALTER TABLE players ALTER COLUMN solo_losses SET DEFAULT 0"
+            "ALTER TABLE lobby_cooldown ADD CONSTRAINT lobby_cooldown_lobby_type_check "
+            f"CHECK (lobby_type IN {LEGACY_MODE_TYPES})"
         )
-        cursor.execute("UPDATE players SET solo_losses = 0 WHERE solo_losses IS NULL")
-        cursor.execute("ALTER TABLE players ALTER COLUMN solo_losses SET NOT NULL")
-
-    # Ensure created_at column
-    if "created_at" not in info:
-        log("Adding missing column 'created_at'.")
         cursor.execute(
-            "ALTER TABLE players ADD COLUMN created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()"
+            """
+            INSERT INTO lobby_cooldown (id, lobby_type, last_creation)
+            VALUES (1, 'solo', NOW()), (2, 'trio', NOW()), (3, 'chaos', NOW())
+            ON CONFLICT (id) DO UPDATE SET lobby_type = EXCLUDED.lobby_type
+            """
         )
 
-    # Migrate legacy columns if they exist
-    legacy_mapping = {
-        "elo": "solo_elo",
-        "wins": "solo_wins",
-        "losses": "solo_losses",
-    }
-    for old_col, new_col in legacy_mapping.items():
-        if old_col in info:
-            log(f"Migrating data from '{old_col}' to '{new_col}'.")
-            cursor.execute(
-                sql.SQL(
-                    """
-                    UPDATE players
-                    SET {new_col} = COALESCE({old_col}, {new_col})
-                    """
-                ).format(new_col=sql.Identifier(new_col), old_col=sql.Identifier(old_col))
-            )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS trio_teams (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            captain_id TEXT NOT NULL,
+            player2_id TEXT NOT NULL,
+            player3_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
 
 
-def ensure_solo_matches_table(cursor) -> None:
-    if table_exists(cursor, "solo_matches"):
-        log("Table 'solo_matches' already exists. Ensuring required columns ...")
-        info = column_info(cursor, "solo_matches")
-        required_columns = {
-            "division": "TEXT NOT NULL",
-            "team1_ids": "TEXT NOT NULL",
-            "team2_ids": "TEXT NOT NULL",
-            "room_code": "TEXT NOT NULL",
-            "status": "TEXT NOT NULL DEFAULT 'pending'",
-            "winner": "TEXT",
-            "created_at": "TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()",
-            "completed_at": "TIMESTAMP WITHOUT TIME ZONE",
-        }
-        for column, definition in required_columns.items():
-            if column not in info:
-                log(f"Adding missing column '{column}' to solo_matches.")
-                cursor.execute(
-                    sql.SQL("ALTER TABLE solo_matches ADD COLUMN {} {}" ).format(
-                        sql.Identifier(column), sql.SQL(definition)
-                    )
-                )
-        if "id" not in info:
-            log("Adding primary key column 'id' to solo_matches.")
-            cursor.execute("ALTER TABLE solo_matches ADD COLUMN id SERIAL PRIMARY KEY")
+def _migration_0004_bot_state(cursor) -> None:
+    """Key/value state the bot must keep across redeploys (e.g. command tree digest)."""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bot_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """
+    )
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "players_schema",
+        _migration_0001_players,
+        specs=(PLAYERS, LEGACY_PLAYER_STATS),
+    ),
+    Migration(
+        2,
+        "solo_matches_table",
+        _migration_0002_solo_matches,
+        specs=(SOLO_MATCHES,),
+    ),
+    Migration(
+        3,
+        "legacy_multimode_tables",
+        _migration_0003_legacy_modes,
+        specs=(LEGACY_MODE_TYPES, LEGACY_PLAYER_COLUMNS, LEGACY_TYPED_TABLES),
+    ),
+    Migration(4, "bot_state", _migration_0004_bot_state),
+]
+
+
+def load_applied_migrations(cursor) -> Optional[Dict[int, str]]:
+    """Return ``{version: checksum}``, or ``None`` if ``schema_version`` is missing."""
+    in_transaction = (
+        cursor.connection.get_transaction_status()
+        != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    )
+    if in_transaction:
+        cursor.execute("SAVEPOINT schema_version_probe")
+    try:
+        cursor.execute("SELECT version, checksum FROM schema_version")
+    except psycopg2.errors.UndefinedTable:
+        if in_transaction:
+            cursor.execute("ROLLBACK TO SAVEPOINT schema_version_probe")
         else:
-            pk_column = get_primary_key_column(cursor, "solo_matches")
-            if pk_column != "id":
-                log("Ensuring 'id' column is primary key for solo_matches.")
-                if pk_column:
-                    cursor.execute(
-                        """
-                        SELECT constraint_name
-                        FROM information_schema.table_constraints
-                        WHERE table_schema = 'public'
-                          AND table_name = 'solo_matches'
-                          AND constraint_type = 'PRIMARY KEY'
-                        """
-                    )
-                    row = cursor.fetchone()
-                    if row:
-                        cursor.execute(
-                            sql.SQL("ALTER TABLE solo_matches DROP CONSTRAINT {}" ).format(
-                                sql.Identifier(row["constraint_name"])
-                            )
-                        )
-                cursor.execute("ALTER TABLE solo_matches ADD PRIMARY KEY (id)")
-        return
+            cursor.connection.rollback()
+        return None
+    applied = {row["version"]: row["checksum"] for row in cursor.fetchall()}
+    if in_transaction:
+        cursor.execute("RELEASE SAVEPOINT schema_version_probe")
+    return applied
+
+
+def pending_migrations(applied: Optional[Dict[int, str]]) -> List[Migration]:
+    """Return the migrations not yet applied, verifying the applied ones."""
+    applied = applied or {}
+    for migration in MIGRATIONS:
+        recorded = applied.get(migration.version)
+        if recorded is not None and recorded != migration.checksum:
+            raise RuntimeError(
+                f"Migration {migration.version} ({migration.name}) was modified after "
+                "being applied. Add a new migration instead of editing it."
+            )
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def run_migrations(cursor) -> List[Migration]:
+    """Apply pending migrations in order.
 
-    log("Creating 'solo_matches' table ...")
+    Schema changes and backfills commit as they go (see backfill.py) so the
+    bot keeps serving during a migration; each migration is recorded in
+    ``schema_version`` and committed once it completes, and an interrupted
+    run resumes with the first unrecorded one.
+
+    Returns the migrations that were applied (empty on a no-op startup).
+    """
+    if not pending_migrations(load_applied_migrations(cursor)):
+        return []
+
+    connection = cursor.connection
     cursor.execute(
         """
-        CREATE TABLE solo_matches (
-            id SERIAL PRIMARY KEY,
-            division TEXT NOT NULL,
-            team1_ids TEXT NOT NULL,
-            team2_ids TEXT NOT NULL,
-            room_code TEXT NOT NULL,
-            status TEXT NOT NULL DEFAULT 'pending',
-            winner TEXT,
-            created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
-            completed_at TIMESTAMP WITHOUT TIME ZONE
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+            duration_ms INTEGER
         )
         """
     )
+    connection.commit()
+    # Serialise concurrent runners (bot restarts overlapping a manual run),
+    # then re-read what the winner may already have applied.  The lock is
+    # session-level because migrations commit in several transactions.
+    cursor.execute("SELECT pg_advisory_lock(%s)", (SCHEMA_VERSION_LOCK_ID,))
+    try:
+        pending = pending_migrations(load_applied_migrations(cursor))
+        for migration in pending:
+            log(f"Applying migration {migration.version:04d} {migration.name} ...")
+            started = time.perf_counter()
+            migration.apply(cursor)
+            cursor.execute(
+                """
+                INSERT INTO schema_version (version, name, checksum, duration_ms)
+                VALUES (%s, %s, %s, %s)
+                """,
+                (
+                    migration.version,
+                    migration.name,
+                    migration.checksum,
+                    round((time.perf_counter() - started) * 1000),
+                ),
+            )
+            connection.commit()
+    finally:
+        if connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            connection.rollback()
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (SCHEMA_VERSION_LOCK_ID,))
+        connection.commit()
+    return pending
+
+
+def plan_schema(cursor) -> None:
+    """Print pending migrations and the DDL the declarative specs would issue."""
+    pending = pending_migrations(load_applied_migrations(cursor))
+    for migration in pending:
+        print(f"-- pending migration {migration.version:04d} {migration.name}")
+    if not pending:
+        print("-- no pending migrations")
+
+    catalog = Catalog.load(cursor)
+    print("-- players")
+    ensure_players_schema(cursor, catalog, dry_run=True)
+    print("-- solo_matches")
+    ensure_solo_matches_table(cursor, catalog, dry_run=True)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="print the migration plan without backing up or changing anything",
+    )
+    args = parser.parse_args(argv)
 
-
-def main() -> None:
+    configure_logging()
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
         log("ERROR: DATABASE_URL environment variable is not set.")
         sys.exit(1)
 
-    try:
-        create_backup(database_url)
-    except Exception:
-        log("Backup failed. Migration aborted.")
-        sys.exit(1)
+    if args.dry_run:
+        conn = connect(database_url)
+        try:
+            with conn.cursor() as cursor:
+                plan_schema(cursor)
+        finally:
+            conn.rollback()
+            conn.close()
+        return
 
-    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    conn = connect(database_url)
     conn.autocommit = False
     try:
         with conn.cursor() as cursor:
-            log("Starting migration inside transaction ...")
-            ensure_players_schema(cursor)
-            ensure_solo_matches_table(cursor)
+            if not pending_migrations(load_applied_migrations(cursor)):
+                log("Schema already up to date, no backup needed.")
+                return
+            conn.rollback()
+
+            try:
+                create_backup(database_url)
+            except Exception:
+                log("Backup failed. Migration aborted.")
+                sys.exit(1)
+
+            log("Starting migration ...")
+            applied = run_migrations(cursor)
         conn.commit()
-        log("Migration completed successfully.")
+        if applied:
+            log(f"Migration completed successfully ({len(applied)} applied).")
+        else:
+            log("Schema already up to date.")
     except Exception as exc:
         conn.rollback()
-        log(f"Migration failed and has been rolled back: {exc}")
+        log(f"Migration failed, completed steps are kept and the next run resumes: {exc}")
         raise
     finally:
         conn.close()
@@ -0,0 +1,169 @@
+"""Queue-based structured logging shared by the bot and the scripts.
+
+:func:`configure_logging` installs a single :class:`logging.handlers.QueueHandler`
+on the root logger.  Callers only pay for an in-memory ``put``; formatting and
+the actual stderr writes happen on a background
+:class:`logging.handlers.QueueListener` thread, so log I/O never runs on the
+event loop.
+
+Records are emitted as one JSON object per line.  The structured fields
+``event``, ``command``, ``user``, ``match_id`` and ``duration_ms`` are picked up
+from ``extra=``::
+
+    logger.info("Match created", extra={"event": "match_created", "match_id": 42})
+
+High-volume events can be sampled with ``LOG_SAMPLE_RATES``, e.g.
+``LOG_SAMPLE_RATES=command=0.1,slow_query=0.5`` keeps one ``command`` record out
+of ten and every other ``slow_query`` record.  Records at WARNING or above are
+never sampled out.
+
+Configuration (environment variables):
+
+``LOG_LEVEL``
+    Root level (default ``INFO``).
+``LOG_FORMAT``
+    ``json`` (default) or ``text`` for human readable lines.
+``LOG_SAMPLE_RATES``
+    Comma separated ``event=rate`` pairs, ``rate`` between 0 and 1.
+"""
+
+from __future__ import annotations
+
+import atexit
+import datetime as dt
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import Dict, Optional
+
+STRUCTURED_FIELDS = ("event", "command", "user", "match_id", "duration_ms", "sampled")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": dt.datetime.fromtimestamp(record.created, dt.timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name in STRUCTURED_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                payload[name] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one record out of ``1 / rate`` for each sampled event."""
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self.intervals = {
+            event: max(1, round(1 / rate)) for event, rate in rates.items() if rate > 0
+        }
+        self.dropped = {event for event, rate in rates.items() if rate <= 0}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        if event in self.dropped:
+            return False
+        interval = self.intervals.get(event)
+        if interval is None or interval == 1:
+            return True
+        with self._lock:
+            count = self._counts.get(event, 0)
+            self._counts[event] = count + 1
+        if count % interval:
+            return False
+        record.sampled = interval
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that defers message formatting to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render tracebacks now so the record does not keep frames alive in
+        # the queue; the message itself is interpolated on the listener thread.
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def parse_sample_rates(raw: Optional[str]) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for item in (raw or "").split(","):
+        if "=" not in item:
+            continue
+        event, _, rate = item.partition("=")
+        try:
+            rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None) -> None:
+    """Route every log record through the shared non-blocking pipeline.
+
+    Safe to call more than once; only the first call installs the pipeline.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if fmt == "text":
+        stream_handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(os.getenv("LOG_SAMPLE_RATES"))))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush pending records and stop the listener thread."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
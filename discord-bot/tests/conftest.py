@@ -0,0 +1,35 @@
+"""Shared helpers for the unit tests (no database or Discord connection needed).
+
+Run from ``discord-bot/``: ``python -m pytest -q``.
+"""
+
+import os
+import sys
+
+import pytest
+from psycopg2 import sql
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "scripts")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def render(composable):
+    """Text of a ``psycopg2.sql`` object without a connection (identifiers double-quoted)."""
+    if isinstance(composable, sql.Composed):
+        return "".join(render(part) for part in composable.seq)
+    if isinstance(composable, sql.SQL):
+        return composable.string
+    if isinstance(composable, sql.Identifier):
+        return ".".join(f'"{name}"' for name in composable.strings)
+    if isinstance(composable, sql.Placeholder):
+        return f"%({composable.name})s" if composable.name else "%s"
+    if isinstance(composable, sql.Literal):
+        return repr(composable.wrapped)
+    raise TypeError(f"cannot render {composable!r}")
+
+
+@pytest.fixture(name="render")
+def render_fixture():
+    return render
@@ -0,0 +1,156 @@
+import inspect
+
+import pytest
+from psycopg2 import sql
+
+import backfill
+import smart_migration
+from backfill import Backfill, batch_statement, run_backfill
+
+KEYED = Backfill(
+    "players_solo_elo",
+    "players",
+    sql.SQL("solo_elo = elo"),
+    sql.SQL("solo_elo IS NULL"),
+    key="discord_id",
+)
+
+
+def test_batch_statement_keyed_first_batch(render):
+    assert render(batch_statement(KEYED, after_key=False)) == (
+        'WITH updated AS (UPDATE "players" SET solo_elo = elo WHERE "discord_id" IN ('
+        'SELECT "discord_id" FROM "players" WHERE (solo_elo IS NULL) '
+        'ORDER BY "discord_id" LIMIT %(limit)s) RETURNING "discord_id" AS key) '
+        "SELECT COUNT(*) AS rows, MAX(key)::text AS last_key FROM updated"
+    )
+
+
+def test_batch_statement_keyed_resumes_after_last_key(render):
+    assert 'WHERE "discord_id" > %(last_key)s AND (solo_elo IS NULL)' in render(
+        batch_statement(KEYED, after_key=True)
+    )
+
+
+def test_batch_statement_without_key_walks_ctid(render):
+    job = Backfill("fill", "solo_matches", sql.SQL("status = 'pending'"), sql.SQL("status IS NULL"))
+
+    assert render(batch_statement(job, after_key=False)) == (
+        "WITH updated AS (UPDATE \"solo_matches\" SET status = 'pending' WHERE ctid = ANY(ARRAY("
+        'SELECT ctid FROM "solo_matches" WHERE status IS NULL LIMIT %(limit)s)) '
+        "RETURNING NULL::text AS key) "
+        "SELECT COUNT(*) AS rows, MAX(key)::text AS last_key FROM updated"
+    )
+
+
+class FakeConnection:
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakeCursor:
+    """Runs backfill batches against ``rows`` (``{key: needs_work}``).
+
+    Rows in ``sticky`` still match the predicate after being updated.
+    """
+
+    def __init__(self, rows, on_batch=None, sticky=()):
+        self.connection = FakeConnection()
+        self.rows = rows
+        self.on_batch = on_batch
+        self.sticky = set(sticky)
+        self.batches = []
+        self.completed = []
+        self._result = None
+
+    def execute(self, query, params=None):
+        text = repr(query)
+        if "AS count" in text:
+            self._result = {"count": sum(self.rows.values())}
+        elif isinstance(query, sql.Composable):
+            after = params["last_key"] if "%(last_key)s" in text else None
+            upper = params["upper"] if "%(upper)s" in text else None
+            keys = sorted(
+                key for key, pending in self.rows.items()
+                if pending
+                and (after is None or key > int(after))
+                and (upper is None or key <= int(upper))
+            )[: params["limit"]]
+            for key in keys:
+                self.rows[key] = key in self.sticky
+            self.batches.append((after, upper, keys))
+            if self.on_batch:
+                self.on_batch(self)
+            self._result = {"rows": len(keys), "last_key": str(max(keys)) if keys else None}
+        elif "completed_at = CASE" in query:
+            self.completed.append(params[2])
+            self._result = None
+        else:
+            self._result = None
+
+    def fetchone(self):
+        return self._result
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(backfill, "SLEEP_MS", 0)
+
+
+def test_run_backfill_walks_keys_then_completes():
+    cursor = FakeCursor({1: True, 2: True, 3: True})
+
+    assert run_backfill(cursor, KEYED, batch_size=2) == 3
+    assert cursor.batches == [
+        (None, None, [1, 2]),
+        ("2", None, [3]),
+        ("3", None, []),
+        (None, "3", []),
+    ]
+    assert cursor.completed == [False, False, False, True]
+
+
+def test_run_backfill_sweeps_rows_written_behind_the_walk():
+    def rewrite_first_row(cursor):
+        if len(cursor.batches) == 2:
+            cursor.rows[1] = True
+
+    cursor = FakeCursor({1: True, 2: True, 3: True}, on_batch=rewrite_first_row)
+
+    assert run_backfill(cursor, KEYED, batch_size=2) == 4
+    assert cursor.batches[-2:] == [(None, "3", [1]), ("1", "3", [])]
+    assert cursor.completed[-1] is True
+    assert not any(cursor.rows.values())
+
+
+def test_run_backfill_stops_on_row_the_update_does_not_clear():
+    # ``name = display_name`` avec ``display_name = ''`` : la ligne 2 vérifie
+    # encore l'ancien prédicat après la mise à jour.
+    cursor = FakeCursor({1: True, 2: True, 3: True}, sticky=[2])
+
+    assert run_backfill(cursor, KEYED, batch_size=2) == 4
+    assert cursor.batches == [
+        (None, None, [1, 2]),
+        ("2", None, [3]),
+        ("3", None, []),
+        (None, "3", [2]),
+        ("2", "3", []),
+    ]
+    assert cursor.completed[-1] is True
+
+
+def test_run_backfill_without_key_updates_at_most_the_initial_rows():
+    job = Backfill("fill", "players", sql.SQL("name = display_name"), sql.SQL("name IS NULL"))
+    cursor = FakeCursor({1: True, 2: True, 3: True}, sticky=[2])
+
+    assert run_backfill(cursor, job, batch_size=2) == 3
+    assert cursor.completed[-1] is True
+    assert len(cursor.batches) == 2
+
+
+def test_name_from_display_name_skips_empty_display_names():
+    source = inspect.getsource(smart_migration._prepare_legacy_players)
+
+    assert "(name IS NULL OR name = '') AND display_name <> ''" in source
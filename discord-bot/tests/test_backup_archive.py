@@ -0,0 +1,92 @@
+import hashlib
+import io
+
+import pytest
+
+import backup_archive
+from backup import _BlockSplitter
+from backup_archive import ArchiveWriter, extract, normalize_key, read_index, select_blocks
+
+ROWS = [
+    b'1,alice,1000\n',
+    b'2,"bob\nle retour",1010\n',
+    b'3,"dit ""salut""",990\n',
+    b'10,,1000\n',
+    b'11,"",1000\n',
+]
+CSV = b"".join(ROWS)
+
+
+class FakeManager:
+    def _account(self, rows, size):
+        pass
+
+
+def write_archive(chunk_size, block_rows=2):
+    out = io.BytesIO()
+    writer = ArchiveWriter(out)
+    writer.add_table("players", ["discord_id", "name", "solo_elo"], ["discord_id"], ["bigint"])
+    splitter = _BlockSplitter(FakeManager(), writer, "players", [0], ["bigint"])
+    for start in range(0, len(CSV), chunk_size):
+        splitter.write(CSV[start:start + chunk_size])
+    splitter.close()
+    writer.close({"format": backup_archive.FORMAT_ARCHIVE})
+    return out
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(backup_archive, "BLOCK_ROWS", 2)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, len(CSV)])
+def test_blocks_do_not_depend_on_copy_chunks(chunk_size):
+    index = read_index(write_archive(chunk_size))
+
+    assert [(block["rows"], block["first_key"], block["last_key"]) for block in index["blocks"]] == [
+        (2, [1], [2]),
+        (2, [3], [10]),
+        (1, [11], [11]),
+    ]
+    assert index["tables"]["players"]["rows"] == 5
+    assert index["metadata"] == {"format": backup_archive.FORMAT_ARCHIVE}
+
+
+def test_extract_whole_table_round_trips():
+    archive = write_archive(7)
+    index = read_index(archive)
+
+    assert extract(archive, index, "players") == CSV
+    assert index["tables"]["players"]["sha256"] == hashlib.sha256(CSV).hexdigest()
+
+
+def test_extract_single_key_reads_only_its_block():
+    archive = write_archive(7)
+    index = read_index(archive)
+    key = normalize_key(index, "players", "10")
+
+    assert key == [10]
+    assert len(select_blocks(index, "players", key)) == 1
+    assert extract(archive, index, "players", key) == ROWS[3]
+    assert extract(archive, index, "players", [2]) == ROWS[1]
+    assert extract(archive, index, "players", [4]) == b""
+
+
+def test_discarded_table_is_not_indexed():
+    out = io.BytesIO()
+    writer = ArchiveWriter(out)
+    writer.add_table("players", ["discord_id"], ["discord_id"], ["bigint"])
+    writer.write_block("players", b"1\n", 1, [1], [1])
+    writer.discard_table("players")
+    writer.close({})
+    index = read_index(out)
+
+    assert index["tables"] == {}
+    assert index["blocks"] == []
+    with pytest.raises(KeyError):
+        select_blocks(index, "players")
+
+
+def test_read_index_rejects_other_files():
+    with pytest.raises(ValueError):
+        read_index(io.BytesIO(b"x" * 64))
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+from backup import plan_retention
+
+START = datetime(2026, 3, 2, 12, 30)  # un lundi
+
+
+def entry(name, hours_ago, size=100, chain=None):
+    return {
+        'filename': name,
+        'date': (START - timedelta(hours=hours_ago)).isoformat(),
+        'size': size,
+        'chain': chain or [name],
+    }
+
+
+def test_empty_index():
+    assert plan_retention([]) == ({}, [])
+
+
+def test_keeps_latest_backup_of_each_recent_hour():
+    entries = [entry(f"b{i}", i) for i in range(6)]
+    entries.append(entry("b0-early", 0.25))  # même heure que b0
+
+    keep, delete = plan_retention(entries, hourly=4, daily=0, weekly=0, budget_bytes=0)
+
+    assert keep == {"b0": "hourly", "b1": "hourly", "b2": "hourly", "b3": "hourly"}
+    assert sorted(delete) == ["b0-early", "b4", "b5"]
+
+
+def test_daily_and_weekly_tiers():
+    entries = [entry(f"d{day}", 24 * day) for day in range(15)]
+
+    keep, delete = plan_retention(entries, hourly=1, daily=3, weekly=2, budget_bytes=0)
+
+    # d1 est un dimanche : le plus récent de la semaine ISO précédente.
+    assert keep == {"d0": "weekly", "d1": "weekly", "d2": "daily"}
+    assert "d14" in delete
+
+
+def test_keeps_whole_chain_of_kept_incremental():
+    entries = [
+        entry("full", 30),
+        entry("inc1", 20, chain=["full", "inc1"]),
+        entry("inc2", 0, chain=["full", "inc1", "inc2"]),
+    ]
+
+    keep, delete = plan_retention(entries, hourly=1, daily=0, weekly=0, budget_bytes=0)
+
+    assert keep == {"inc2": "hourly", "inc1": "chain", "full": "chain"}
+    assert delete == []
+
+
+def test_budget_drops_oldest_independent_backups_first():
+    entries = [
+        entry("full-old", 3, size=400),
+        entry("full", 2, size=400),
+        entry("inc", 1, size=50, chain=["full", "inc"]),
+        entry("latest", 0, size=400),
+    ]
+
+    keep, delete = plan_retention(entries, hourly=4, daily=0, weekly=0, budget_bytes=900)
+
+    # "full" reste : "inc" en dépend.
+    assert set(keep) == {"latest", "inc", "full"}
+    assert delete == ["full-old"]
+
+
+def test_budget_never_drops_latest():
+    keep, delete = plan_retention(
+        [entry("latest", 0, size=10_000)], hourly=1, daily=0, weekly=0, budget_bytes=1
+    )
+
+    assert keep == {"latest": "hourly"}
+    assert delete == []
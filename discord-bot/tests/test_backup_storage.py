@@ -0,0 +1,97 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backup_storage import MultipartUpload
+
+
+class StubClient:
+    """Enregistre les appels multipart comme le ferait un bucket S3."""
+
+    def __init__(self, fail_part=None):
+        self.fail_part = fail_part
+        self.parts = {}
+        self.completed = None
+        self.aborted = False
+        self._lock = threading.Lock()
+
+    def create_multipart_upload(self, Bucket, Key):
+        return {'UploadId': 'upload-1'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber == self.fail_part:
+            raise OSError("connexion perdue")
+        with self._lock:
+            self.parts[PartNumber] = Body
+        return {'ETag': f'etag-{PartNumber}'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed = (Key, MultipartUpload['Parts'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted = True
+
+
+class StubStorage:
+    """Le sous-ensemble de :class:`S3Storage` utilisé par ``MultipartUpload``."""
+
+    def __init__(self, client, part_size=4, concurrency=2):
+        self.client = client
+        self.bucket = 'bucket'
+        self.part_size = part_size
+        self._pool = ThreadPoolExecutor(max_workers=concurrency)
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def key(self, name):
+        return 'backups/' + name
+
+
+def test_parts_are_uploaded_in_order():
+    client = StubClient()
+    upload = MultipartUpload(StubStorage(client), 'backup.pba')
+    for chunk in (b'abc', b'defgh', b'ij'):
+        upload.write(chunk)
+    assert upload.tell() == 10
+    upload.close()
+
+    key, parts = client.completed
+    assert key == 'backups/backup.pba'
+    assert parts == [{'PartNumber': n, 'ETag': f'etag-{n}'} for n in (1, 2, 3)]
+    assert b''.join(client.parts[n] for n in (1, 2, 3)) == b'abcdefghij'
+    assert [len(client.parts[n]) for n in (1, 2, 3)] == [4, 4, 2]
+
+
+def test_empty_upload_still_sends_one_part():
+    client = StubClient()
+    upload = MultipartUpload(StubStorage(client), 'empty.pba')
+    upload.close()
+    upload.close()  # idempotent
+
+    assert client.completed[1] == [{'PartNumber': 1, 'ETag': 'etag-1'}]
+    assert client.parts == {1: b''}
+
+
+def test_failed_part_fails_close_and_abort_cleans_up():
+    client = StubClient(fail_part=2)
+    upload = MultipartUpload(StubStorage(client), 'backup.pba')
+    upload.write(b'x' * 10)
+
+    with pytest.raises(OSError):
+        upload.close()
+    assert client.completed is None
+
+    upload.abort()
+    assert client.aborted
+
+
+def test_slots_are_released_after_each_part():
+    client = StubClient()
+    storage = StubStorage(client, part_size=1, concurrency=2)
+    upload = MultipartUpload(storage, 'backup.pba')
+    upload.write(b'abcdef')  # bloquerait si les emplacements n'étaient pas libérés
+    upload.close()
+
+    assert len(client.parts) == 6
+    for _ in range(2):
+        assert storage._slots.acquire(blocking=False)
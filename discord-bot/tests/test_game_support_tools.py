@@ -0,0 +1,24 @@
+import argparse
+
+import pytest
+
+from game_support_tools import parse_target
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("kenji=0.35", ("kenji", 0.35)),
+        ("Kenji =0.5", ("kenji", 0.5)),
+        ("shelly=1", ("shelly", 1.0)),
+        ("el primo=0", ("el primo", 0.0)),
+    ],
+)
+def test_parse_target(value, expected):
+    assert parse_target(value) == expected
+
+
+@pytest.mark.parametrize("value", ["kenji", "=0.35", "kenji=", "kenji=beaucoup", ""])
+def test_parse_target_rejects_malformed_values(value):
+    with pytest.raises(argparse.ArgumentTypeError, match="BRAWLER=RATE"):
+        parse_target(value)
@@ -0,0 +1,26 @@
+import asyncio
+
+from log_digest import LogDigest, _ChannelBuffer, pack_messages
+
+
+def test_pack_messages_joins_until_the_limit():
+    assert pack_messages(["a", "b", "c" * 5], limit=6) == ["a\n\nb", "ccccc"]
+    assert pack_messages([""]) == []
+
+
+def test_empty_entries_do_not_kill_the_digest_task():
+    sent = []
+
+    async def sender(channel_id, content):
+        sent.append((channel_id, content))
+
+    async def scenario():
+        digest = LogDigest(sender, interval=0)
+        digest.error(1, "")
+        digest.error(1, "❌ erreur")
+        # Un tampon ne contenant que des entrées vides se termine sans envoi.
+        await asyncio.wait_for(digest._run(2, _ChannelBuffer(entries=[""], urgent=True)), 1)
+        await digest.flush()
+
+    asyncio.run(scenario())
+    assert sent == [(1, "❌ erreur")]
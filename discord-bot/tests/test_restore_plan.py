@@ -0,0 +1,94 @@
+from backup import build_restore_plan
+from schema_catalog import Catalog, Column, Constraint, Index, Table
+
+
+def make_table(name, foreign_keys=(), indexes=(), serial=False):
+    columns = {
+        "id": Column(
+            "id", "integer", True, f"nextval('{name}_id_seq'::regclass)" if serial else None
+        ),
+    }
+    constraints = [Constraint(f"{name}_pkey", "p", "PRIMARY KEY (id)", ["id"])]
+    for referenced in foreign_keys:
+        constraints.append(
+            Constraint(
+                f"{name}_{referenced}_fkey",
+                "f",
+                f"FOREIGN KEY ({referenced}_id) REFERENCES {referenced}(id)",
+                [f"{referenced}_id"],
+                referenced_table=referenced,
+            )
+        )
+    all_indexes = [Index(f"{name}_pkey", f"CREATE UNIQUE INDEX {name}_pkey", True, True)]
+    all_indexes += [Index(index, f"CREATE INDEX {index}", False, False) for index in indexes]
+    return Table(name, columns, constraints=constraints, indexes=all_indexes)
+
+
+def catalog(*tables):
+    return Catalog("public", {table.name: table for table in tables})
+
+
+def test_levels_follow_foreign_keys():
+    plan = build_restore_plan(
+        catalog(
+            make_table("players"),
+            make_table("solo_matches", foreign_keys=["players"]),
+            make_table("match_votes", foreign_keys=["solo_matches", "players"]),
+            make_table("settings"),
+        ),
+        ["match_votes", "solo_matches", "players", "settings"],
+    )
+
+    assert plan.levels == [["players", "settings"], ["solo_matches"], ["match_votes"]]
+
+
+def test_unknown_tables_are_skipped():
+    plan = build_restore_plan(catalog(make_table("players")), ["players", "missing"])
+
+    assert plan.tables == ["players"]
+    assert plan.levels == [["players"]]
+
+
+def test_cycles_end_up_in_last_level():
+    plan = build_restore_plan(
+        catalog(
+            make_table("players"),
+            make_table("a", foreign_keys=["b", "players"]),
+            make_table("b", foreign_keys=["a"]),
+        ),
+        ["a", "b", "players"],
+    )
+
+    assert plan.levels == [["players"], ["a", "b"]]
+
+
+def test_self_reference_is_not_a_dependency():
+    plan = build_restore_plan(
+        catalog(make_table("players", foreign_keys=["players"])), ["players"]
+    )
+
+    assert plan.levels == [["players"]]
+    assert [(table, fk.name) for table, fk in plan.foreign_keys] == [
+        ("players", "players_players_fkey")
+    ]
+
+
+def test_collects_objects_to_rebuild():
+    plan = build_restore_plan(
+        catalog(
+            make_table("players", indexes=["players_name_idx"], serial=True),
+            make_table("solo_matches", foreign_keys=["players"]),
+            # Non restaurée, mais sa FK vers players empêcherait le TRUNCATE.
+            make_table("trio_teams", foreign_keys=["players"], indexes=["trio_teams_idx"]),
+        ),
+        ["players", "solo_matches"],
+    )
+
+    assert sorted((table, fk.referenced_table) for table, fk in plan.foreign_keys) == [
+        ("solo_matches", "players"),
+        ("trio_teams", "players"),
+    ]
+    assert [(table, index.name) for table, index in plan.indexes] == [
+        ("players", "players_name_idx")
+    ]
+    assert plan.sequences == [("players", "id")]
@@ -0,0 +1,115 @@
+import pytest
+
+from schema_catalog import (
+    Column,
+    ColumnSpec,
+    Constraint,
+    Table,
+    TableSpec,
+    normalize_default,
+    plan_table,
+)
+
+SPEC = TableSpec(
+    "players",
+    (
+        ColumnSpec("discord_id", "text", not_null=True),
+        ColumnSpec("name", "text", not_null=True),
+        ColumnSpec("solo_elo", "integer", not_null=True, default="1000"),
+        ColumnSpec("created_at", "timestamp without time zone", default="NOW()"),
+    ),
+    ("discord_id",),
+)
+
+
+def table(columns, primary_key=("discord_id",)):
+    constraints = []
+    if primary_key:
+        constraints.append(
+            Constraint("players_pkey", "p", "PRIMARY KEY", list(primary_key))
+        )
+    return Table(
+        "players",
+        {column.name: column for column in columns},
+        constraints=constraints,
+    )
+
+
+def up_to_date():
+    return [
+        Column("discord_id", "text", True, None),
+        Column("name", "text", True, None),
+        Column("solo_elo", "integer", True, "1000"),
+        Column("created_at", "timestamp without time zone", False, "now()"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "expression, expected",
+    [
+        (None, None),
+        ("1000", "1000"),
+        ("'division2'::text", "'division2'"),
+        ("'division2'::character varying", "'division2'"),
+        ("(0)::bigint", "0"),
+        ("CURRENT_TIMESTAMP", "now()"),
+        ("now()", "now()"),
+        ("'{}'::text[]", "'{}'"),
+    ],
+)
+def test_normalize_default(expression, expected):
+    assert normalize_default(expression) == expected
+
+
+def test_plan_table_creates_missing_table(render):
+    plan = plan_table(SPEC, None)
+
+    assert plan.fills == []
+    assert [render(statement) for statement in plan.statements] == [
+        'CREATE TABLE "players" ("discord_id" TEXT NOT NULL, "name" TEXT NOT NULL, '
+        '"solo_elo" INTEGER NOT NULL DEFAULT 1000, '
+        '"created_at" TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(), '
+        'PRIMARY KEY ("discord_id"))'
+    ]
+
+
+def test_plan_table_is_empty_when_up_to_date():
+    assert not plan_table(SPEC, table(up_to_date()))
+
+
+def test_plan_table_ignores_default_spelling():
+    columns = up_to_date()
+    columns[3] = Column("created_at", "timestamp without time zone", False, "CURRENT_TIMESTAMP")
+
+    assert not plan_table(SPEC, table(columns))
+
+
+def test_plan_table_groups_changes_in_one_alter(render):
+    columns = [
+        Column("discord_id", "text", False, None),
+        Column("solo_elo", "bigint", False, "0"),
+    ]
+
+    plan = plan_table(SPEC, table(columns, primary_key=()))
+
+    assert plan.fills == [("solo_elo", "1000")]
+    assert [render(statement) for statement in plan.statements] == [
+        'ALTER TABLE "players" '
+        'ALTER COLUMN "discord_id" SET NOT NULL, '
+        'ADD COLUMN "name" TEXT NOT NULL, '
+        'ALTER COLUMN "solo_elo" TYPE INTEGER USING "solo_elo"::INTEGER, '
+        'ALTER COLUMN "solo_elo" SET DEFAULT 1000, '
+        'ALTER COLUMN "solo_elo" SET NOT NULL, '
+        'ADD COLUMN "created_at" TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(), '
+        'ADD PRIMARY KEY ("discord_id")'
+    ]
+
+
+def test_plan_table_replaces_wrong_primary_key(render):
+    columns = up_to_date()
+
+    plan = plan_table(SPEC, table(columns, primary_key=("name",)))
+
+    assert [render(statement) for statement in plan.statements] == [
+        'ALTER TABLE "players" DROP CONSTRAINT "players_pkey", ADD PRIMARY KEY ("discord_id")'
+    ]
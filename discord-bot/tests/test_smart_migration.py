@@ -0,0 +1,79 @@
+import hashlib
+
+import pytest
+
+import smart_migration
+from smart_migration import MIGRATIONS, code_fingerprint, pending_migrations
+
+COMPACT = '''
+def step(cursor):
+    """Docstring."""
+    cursor.execute("ALTER TABLE players ADD COLUMN x INT")  # commentaire
+'''
+
+REFORMATTED = '''
+def step(cursor) :
+    cursor.execute(
+        "ALTER TABLE players ADD COLUMN x INT"
+    )
+'''
+
+CHANGED = '''
+def step(cursor):
+    cursor.execute("ALTER TABLE players ADD COLUMN y INT")
+'''
+
+
+def load(tmp_path, name, source):
+    path = tmp_path / f"{name}.py"
+    path.write_text(source)
+    namespace = {}
+    exec(compile(source, str(path), "exec"), namespace)
+    return namespace["step"]
+
+
+def test_fingerprint_ignores_formatting_comments_and_docstring(tmp_path):
+    compact = load(tmp_path, "compact", COMPACT)
+    reformatted = load(tmp_path, "reformatted", REFORMATTED)
+    changed = load(tmp_path, "changed", CHANGED)
+
+    assert code_fingerprint(compact) == code_fingerprint(reformatted)
+    assert code_fingerprint(compact) != code_fingerprint(changed)
+
+
+def test_checksum_covers_declared_specs():
+    migration = MIGRATIONS[1]
+    before = migration.checksum
+    edited = smart_migration.Migration(
+        migration.version,
+        migration.name,
+        migration.apply,
+        specs=(smart_migration.PLAYERS,),
+    )
+
+    assert edited.checksum != before
+
+
+def test_checksum_covers_only_apply_and_specs():
+    migration = MIGRATIONS[0]
+    digest = hashlib.sha256(code_fingerprint(migration.apply).encode("utf-8"))
+    for spec in migration.specs:
+        digest.update(repr(spec).encode("utf-8"))
+
+    # Les fonctions partagées (_prepare_legacy_players, backfill.py) n'y figurent pas.
+    assert migration.checksum == digest.hexdigest()
+
+
+def test_pending_migrations_skips_applied():
+    applied = {m.version: m.checksum for m in MIGRATIONS[:-1]}
+
+    assert pending_migrations(applied) == MIGRATIONS[-1:]
+
+
+def test_pending_migrations_refuses_edited_migration():
+    with pytest.raises(RuntimeError):
+        pending_migrations({MIGRATIONS[0].version: "0" * 64})
+
+
+def test_pending_migrations_on_fresh_database():
+    assert pending_migrations(None) == MIGRATIONS